@@ -9,6 +9,8 @@ export const MainApp: React.FC = () => {
     const [channels, setChannels] = useState<any[]>([]);
     const [currentChannel, setCurrentChannel] = useState<any>(null);
     const [messages, setMessages] = useState<any[]>([]);
+    // Cursor for the page of history before the oldest loaded message
+    const [olderCursor, setOlderCursor] = useState<string | null>(null);
     const [messageInput, setMessageInput] = useState('');
     const [user, setUser] = useState<any>(null);
 
@@ -24,6 +26,10 @@ export const MainApp: React.FC = () => {
             wsService.connect(currentWorkspace.id, token);
 
             wsService.on('message.new', (data) => {
+                // Thread replies carry their parent's channel_id but aren't part of the timeline
+                if (data.data.thread_id) {
+                    return;
+                }
                 if (data.data.channel_id === currentChannel?.id) {
                     setMessages((prev) => [...prev, data.data]);
                 }
@@ -36,8 +42,8 @@ export const MainApp: React.FC = () => {
     }, [currentWorkspace]);
 
     useEffect(() => {
-        if (currentChannel) {
-            loadMessages(currentChannel.id);
+        if (currentChannel && currentWorkspace) {
+            loadMessages(currentWorkspace.id, currentChannel.id);
         }
     }, [currentChannel]);
 
@@ -74,15 +80,33 @@ export const MainApp: React.FC = () => {
         }
     };
 
-    const loadMessages = async (channelId: string) => {
+    const loadMessages = async (workspaceId: string, channelId: string) => {
         try {
-            const response = await messageAPI.list({ channel_id: channelId, limit: 50 });
-            setMessages(response.data.reverse());
+            const response = await messageAPI.list(workspaceId, { channel_id: channelId, limit: 50 });
+            const page = response.data;
+            setMessages([...page.messages].reverse());
+            setOlderCursor(page.has_more_before ? page.before : null);
         } catch (error) {
             console.error('Failed to load messages:', error);
         }
     };
 
+    const loadOlderMessages = async () => {
+        if (!olderCursor || !currentChannel || !currentWorkspace) return;
+        try {
+            const response = await messageAPI.list(currentWorkspace.id, {
+                channel_id: currentChannel.id,
+                limit: 50,
+                before: olderCursor,
+            });
+            const page = response.data;
+            setMessages((prev) => [...[...page.messages].reverse(), ...prev]);
+            setOlderCursor(page.has_more_before ? page.before : null);
+        } catch (error) {
+            console.error('Failed to load older messages:', error);
+        }
+    };
+
     const sendMessage = async (e: React.FormEvent) => {
         e.preventDefault();
         if (!messageInput.trim() || !currentChannel || !currentWorkspace) return;
@@ -176,6 +200,11 @@ export const MainApp: React.FC = () => {
 
                 {/* Messages */}
                 <div className="messages-container">
+                    {olderCursor && (
+                        <button className="btn btn-secondary" onClick={loadOlderMessages}>
+                            Load older messages
+                        </button>
+                    )}
                     {messages.map((msg) => (
                         <div key={msg.id} className="message animate-slide-in">
                             <div className="message-avatar">{msg.user_id[0]}</div>
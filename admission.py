@@ -0,0 +1,107 @@
+from typing import Optional
+from fastapi import WebSocket
+from prometheus_client import Counter, Gauge
+import asyncio
+import json
+import random
+import time
+
+from app.core.config import settings
+
+ADMISSIONS = Counter(
+    "ws_connection_admissions_total",
+    "WebSocket connection attempts by admission outcome",
+    ["outcome"]
+)
+HANDSHAKES_IN_FLIGHT = Gauge(
+    "ws_handshakes_in_flight",
+    "WebSocket handshakes admitted but not yet connected"
+)
+
+
+class AdmissionController:
+    """
+    Admission control for WebSocket connects.
+
+    A token bucket limits the accept rate and a counter caps handshakes in flight
+    (auth, membership loading, replay). A connect that finds the bucket empty is
+    deferred if its turn comes within max_wait; otherwise, or when too many
+    handshakes are already running, it is rejected with a jittered retry delay
+    sized to the current backlog so a reconnect storm spreads itself out.
+    """
+
+    def __init__(
+        self,
+        rate: float = settings.WS_ADMISSION_RATE,
+        burst: int = settings.WS_ADMISSION_BURST,
+        max_handshakes: int = settings.WS_MAX_CONCURRENT_HANDSHAKES,
+        max_wait: float = settings.WS_ADMISSION_MAX_WAIT
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_handshakes = max_handshakes
+        self.max_wait = max_wait
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self.in_flight = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _retry_after(self, backlog: float) -> float:
+        base = max(settings.WS_ADMISSION_RETRY_MIN, backlog)
+        return round(base + random.uniform(0, base), 1)
+
+    async def admit(self) -> Optional[float]:
+        """
+        Wait for a handshake slot.
+
+        Returns:
+            None once admitted (call release() when the handshake is over), or
+            the number of seconds the client should wait before retrying
+        """
+        if self.in_flight >= self.max_handshakes:
+            ADMISSIONS.labels(outcome="rejected").inc()
+            return self._retry_after(self.max_wait)
+
+        self._refill()
+        # Tokens may go negative: each deferred connect reserves its future token
+        wait = (1 - self._tokens) / self.rate
+        if wait > self.max_wait:
+            ADMISSIONS.labels(outcome="rejected").inc()
+            return self._retry_after(wait)
+
+        self._tokens -= 1
+        self.in_flight += 1
+        HANDSHAKES_IN_FLIGHT.inc()
+        if wait > 0:
+            ADMISSIONS.labels(outcome="deferred").inc()
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.release()
+                raise
+        else:
+            ADMISSIONS.labels(outcome="accepted").inc()
+        return None
+
+    def release(self):
+        """Give back a handshake slot taken by admit()."""
+        self.in_flight -= 1
+        HANDSHAKES_IN_FLIGHT.dec()
+
+
+async def reject(websocket: WebSocket, retry_after: float, subprotocol: Optional[str] = None):
+    """
+    Turn a connect away with close code 1013 (try again later).
+
+    The socket is accepted first so that browsers see the close code and the
+    reason, which carries the suggested retry delay in seconds.
+    """
+    await websocket.accept(subprotocol=subprotocol)
+    await websocket.close(code=1013, reason=json.dumps({"retry_after": retry_after}))
+
+
+admission = AdmissionController()
@@ -96,9 +96,22 @@ export const channelAPI = {
 export const messageAPI = {
     send: (workspaceId: string, data: any) =>
         api.post(`/messages?workspace_id=${workspaceId}`, data),
-    list: (params: any) => api.get('/messages', { params }),
+    // Returns a page: { messages (newest first), before, after, has_more_before, has_more_after }
+    list: (workspaceId: string, params: any) =>
+        api.get('/messages', { params: { workspace_id: workspaceId, ...params } }),
     addReaction: (messageId: string, emoji: string) =>
         api.post(`/messages/${messageId}/reactions`, { emoji }),
+    removeReaction: (messageId: string, emoji: string) =>
+        api.delete(`/messages/${messageId}/reactions/${encodeURIComponent(emoji)}`),
+    reply: (workspaceId: string, messageId: string, data: any) =>
+        api.post(`/messages/${messageId}/replies?workspace_id=${workspaceId}`, data),
+    replies: (workspaceId: string, messageId: string, params?: any) =>
+        api.get(`/messages/${messageId}/replies`, { params: { workspace_id: workspaceId, ...params } }),
+    threads: (workspaceId: string, parentIds: string[]) =>
+        api.get(`/messages/threads?${new URLSearchParams([
+            ['workspace_id', workspaceId],
+            ...parentIds.map((id): [string, string] => ['parent_ids', id]),
+        ])}`),
 };
 
 // File API
@@ -0,0 +1,125 @@
+"""
+Connection bookkeeping benchmark: bytes per idle WebSocket connection.
+
+Registers N idle connections the way the node used to (parallel dicts keyed by
+socket, the heartbeat wheel's slot and last-activity dicts, and an outbound queue
+with an asyncio.Event each) and the way it does now (one slotted ConnectionState
+referenced from every index, with a slotted queue), and reports
+the traced allocation per connection for each. Sockets and user ids are created
+up front so only the node's own bookkeeping is measured. Prints a JSON report.
+
+    python -m benchmarks.bench_connection_memory --connections 100000
+"""
+from collections import deque
+from typing import Callable, Dict, List, Set
+import argparse
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+
+from app.core.config import settings
+from app.websocket.connection_manager import ConnectionManager
+from app.websocket.connection_state import ConnectionState
+from app.websocket.outbound import OutboundQueue
+
+
+class FakeSocket:
+    __slots__ = ()
+
+
+class LegacyQueue:
+    """OutboundQueue's per-instance state before it was slotted."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.policy = None
+        self.batching = False
+        self.codec = None
+        self.dropped = 0
+        self.writer_task = None
+        self._items = deque()
+        self._ready = asyncio.Event()
+
+
+class LegacyRegistry:
+    """The per-socket dicts ConnectionManager and HeartbeatWheel kept before ConnectionState."""
+
+    def __init__(self, slots: int):
+        self.active_connections: Dict[str, Set[FakeSocket]] = {}
+        self.connection_users: Dict[FakeSocket, str] = {}
+        self.connection_workspaces: Dict[FakeSocket, str] = {}
+        self.connection_queues: Dict[FakeSocket, LegacyQueue] = {}
+        self.online: Dict[str, Dict[str, Set[FakeSocket]]] = {}
+        self.slots: List[Set[FakeSocket]] = [set() for _ in range(slots)]
+        self.slot_of: Dict[FakeSocket, int] = {}
+        self.last_activity: Dict[FakeSocket, float] = {}
+        self.next_slot = 0
+
+    def register(self, websocket: FakeSocket, user_id: str, workspace_id: str, queue: LegacyQueue):
+        self.active_connections.setdefault(workspace_id, set()).add(websocket)
+        self.connection_users[websocket] = user_id
+        self.connection_workspaces[websocket] = workspace_id
+        self.connection_queues[websocket] = queue
+        self.online.setdefault(workspace_id, {}).setdefault(user_id, set()).add(websocket)
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % len(self.slots)
+        self.slots[slot].add(websocket)
+        self.slot_of[websocket] = slot
+        self.last_activity[websocket] = time.monotonic()
+
+
+def measure(register: Callable[[FakeSocket, str, str], None], sockets, users, workspaces) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i, websocket in enumerate(sockets):
+        register(websocket, users[i % len(users)], workspaces[i % len(workspaces)])
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--connections", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--workspaces", type=int, default=10)
+    args = parser.parse_args()
+
+    users = [f"user-{i:08d}" for i in range(args.users)]
+    workspaces = [f"workspace-{i:04d}" for i in range(args.workspaces)]
+
+    legacy = LegacyRegistry(settings.WS_HEARTBEAT_SLOTS)
+    legacy_bytes = measure(
+        lambda websocket, user_id, workspace_id: legacy.register(
+            websocket, user_id, workspace_id, LegacyQueue(settings.WS_MESSAGE_QUEUE_SIZE)
+        ),
+        [FakeSocket() for _ in range(args.connections)], users, workspaces
+    )
+    del legacy
+
+    manager = ConnectionManager()
+    state_bytes = measure(
+        lambda websocket, user_id, workspace_id: manager._register(
+            ConnectionState(websocket, user_id, workspace_id, OutboundQueue(settings.WS_MESSAGE_QUEUE_SIZE))
+        ),
+        [FakeSocket() for _ in range(args.connections)], users, workspaces
+    )
+
+    n = args.connections
+    report = {
+        "connections": n,
+        "users": args.users,
+        "workspaces": args.workspaces,
+        "before": {"bytes_per_connection": round(legacy_bytes / n, 1)},
+        "after": {"bytes_per_connection": round(state_bytes / n, 1)},
+        "saved_bytes_per_connection": round((legacy_bytes - state_bytes) / n, 1)
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
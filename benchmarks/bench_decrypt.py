@@ -0,0 +1,131 @@
+"""
+History decryption benchmark: per-page latency and event-loop lag.
+
+Simulates concurrent history loads, each decrypting a page of messages, and
+compares decrypting serially on the event loop (the old get_messages path)
+with MessageEncryption.decrypt_batch, both cold and with the plaintext cache
+warm. A probe task measures how late the loop wakes up while pages are being
+decrypted, which is the delay every WebSocket on the node would see. Prints a
+JSON report.
+
+    python -m benchmarks.bench_decrypt --pages 400 --page-size 50 --concurrency 20
+"""
+from typing import Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from bson import ObjectId
+
+from app.core.encryption import MessageEncryption
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"count": 0, "p50": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": pick(0.50),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 3)
+    }
+
+
+def build_pages(encryption: MessageEncryption, pages: int, page_size: int, seed: int) -> List[List[dict]]:
+    rng = random.Random(seed)
+    result = []
+    for _ in range(pages):
+        page = []
+        for _ in range(page_size):
+            text = "".join(rng.choice("abcdefghij klmnop") for _ in range(rng.randint(20, 400)))
+            page.append({"_id": ObjectId(), "version": 1, "content": encryption.encrypt(text)})
+        result.append(page)
+    return result
+
+
+async def _monitor_loop_lag(samples: List[float], interval: float = 0.005):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def run_scenario(
+    pages: List[List[dict]], concurrency: int, decrypt_page: Callable[[List[dict]], Awaitable[None]]
+) -> dict:
+    latencies: List[float] = []
+    lag: List[float] = []
+    queue = list(pages)
+
+    async def worker():
+        while queue:
+            page = queue.pop()
+            started = time.perf_counter()
+            await decrypt_page(page)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    monitor = asyncio.create_task(_monitor_loop_lag(lag))
+    await asyncio.sleep(0.05)
+    lag.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    monitor.cancel()
+    return {
+        "pages_per_second": round(len(pages) / elapsed, 1),
+        "page_latency_ms": percentiles(latencies),
+        "loop_lag_ms": percentiles(lag)
+    }
+
+
+async def run(args) -> dict:
+    encryption = MessageEncryption()
+    pages = build_pages(encryption, args.pages, args.page_size, args.seed)
+
+    async def serial(page: List[dict]):
+        # The old path: every document decrypted inline on the event loop
+        for msg in page:
+            encryption.decrypt(msg["content"])
+        await asyncio.sleep(0)
+
+    async def batched(page: List[dict]):
+        await encryption.decrypt_batch([msg["content"] for msg in page])
+
+    async def cached(page: List[dict]):
+        await encryption.decrypt_batch(
+            [msg["content"] for msg in page], keys=[(msg["_id"], msg["version"]) for msg in page]
+        )
+
+    report = {
+        "pages": args.pages,
+        "page_size": args.page_size,
+        "concurrency": args.concurrency,
+        "serial_on_loop": await run_scenario(pages, args.concurrency, serial),
+        "decrypt_batch": await run_scenario(pages, args.concurrency, batched),
+    }
+    await run_scenario(pages, args.concurrency, cached)  # warm the plaintext cache
+    report["decrypt_batch_cached"] = await run_scenario(pages, args.concurrency, cached)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20, help="history loads in flight at once")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Ciphertext storage format report: v1 (base64 Fernet text) vs v2 (binary AES-GCM envelope).
+
+Without --mongo, measures stored bytes per message and encrypt/decrypt
+throughput for both formats over a representative mix of message lengths.
+With --mongo, also seeds a scratch database next to the configured one with v1
+messages, records collStats (data size, storage size, average document size),
+runs the EncryptionMigrator over it and records collStats again, plus the
+migration rate. Prints a JSON report.
+
+    python -m benchmarks.bench_encryption_format --messages 20000
+    python -m benchmarks.bench_encryption_format --messages 200000 --mongo
+"""
+from datetime import datetime
+from typing import List
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from bson import ObjectId
+
+from app.core.config import settings
+from app.core.encryption import encryption
+
+
+def sample_texts(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    words = ["ok", "thanks", "deploy", "the", "build", "is", "green", "can", "you", "review", "this", "PR", "🚀"]
+    # Mostly short chat messages with a long tail
+    return [
+        " ".join(rng.choice(words) for _ in range(int(rng.lognormvariate(2.0, 0.9)) + 1))
+        for _ in range(count)
+    ]
+
+
+def measure_format(texts: List[str], version: int) -> dict:
+    started = time.perf_counter()
+    ciphertexts = [encryption.encrypt(text, version=version) for text in texts]
+    encrypt_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for ciphertext in ciphertexts:
+        encryption.decrypt(ciphertext)
+    decrypt_seconds = time.perf_counter() - started
+
+    sizes = [len(ciphertext) for ciphertext in ciphertexts]
+    plaintext_bytes = sum(len(text.encode()) for text in texts)
+    return {
+        "mean_stored_bytes": round(statistics.fmean(sizes), 1),
+        "overhead_ratio": round(sum(sizes) / plaintext_bytes, 2),
+        "encrypt_per_second": round(len(texts) / encrypt_seconds),
+        "decrypt_per_second": round(len(texts) / decrypt_seconds)
+    }
+
+
+async def measure_migration(texts: List[str], batch_size: int) -> dict:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from app.core import encryption_migration
+    from app.core.encryption_migration import EncryptionMigrator
+
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    db = client[f"{settings.MONGODB_DB}_encryption_report"]
+    await client.drop_database(db.name)
+    try:
+        batch = []
+        for text in texts:
+            batch.append({
+                "_id": ObjectId(),
+                "workspace_id": "report-ws",
+                "channel_id": "report-ch",
+                "user_id": "report-user",
+                "content": encryption.encrypt(text, version=1),
+                "created_at": datetime.utcnow()
+            })
+            if len(batch) == 1000:
+                await db.messages.insert_many(batch)
+                batch = []
+        if batch:
+            await db.messages.insert_many(batch)
+
+        async def coll_stats() -> dict:
+            stats = await db.command("collStats", "messages")
+            return {key: stats.get(key) for key in ("count", "size", "storageSize", "avgObjSize")}
+
+        before = await coll_stats()
+        encryption_migration.get_mongo_db = lambda: db
+        migrator = EncryptionMigrator(batch_size=batch_size)
+        migrator.pause = 0
+        started = time.perf_counter()
+        checkpoint = await migrator.run_once()
+        seconds = time.perf_counter() - started
+        after = await coll_stats()
+        return {
+            "before": before,
+            "after": after,
+            "migrated": checkpoint["migrated"],
+            "seconds": round(seconds, 2),
+            "documents_per_second": round(checkpoint["migrated"] / seconds)
+        }
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=settings.ENCRYPTION_MIGRATION_BATCH)
+    parser.add_argument("--mongo", action="store_true", help="also measure collection size and migration")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = sample_texts(args.messages, args.seed)
+    report = {
+        "messages": args.messages,
+        "mean_plaintext_bytes": round(statistics.fmean(len(text.encode()) for text in texts), 1),
+        "v1_fernet_base64": measure_format(texts, 1),
+        "v2_aes_gcm_binary": measure_format(texts, 2)
+    }
+    if args.mongo:
+        report["migration"] = asyncio.run(measure_migration(texts, args.batch_size))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
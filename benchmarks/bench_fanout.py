@@ -0,0 +1,323 @@
+"""
+WebSocket fan-out benchmark and load generator.
+
+Runs the real /ws endpoint in-process under uvicorn with fakeredis standing in
+for Redis, opens N client sockets across M workspaces from a separate process
+and drives message, typing and presence workloads through ConnectionManager.
+Principals and channel memberships are generated up front instead of being read
+from PostgreSQL, so no database is needed.
+
+Reports fan-out latency percentiles (publish -> client receive), delivered
+events per second by type, server memory per socket and event-loop lag, as JSON
+so runs can be compared between commits:
+
+    python -m benchmarks.bench_fanout --clients 2000 --workspaces 20 --duration 10
+    python -m benchmarks.bench_fanout --output fanout-$(git rev-parse --short HEAD).json
+"""
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import fakeredis
+import uvicorn
+import websockets
+from fastapi import FastAPI
+
+from app.core.principal_cache import Principal, principal_cache
+from app.core.security import create_access_token
+from app.db.redis import RedisClient
+from app.main import websocket_endpoint
+from app.websocket.admission import admission
+from app.websocket.connection_manager import manager
+from app.websocket.events import WSEventType, create_event
+
+CHANNELS_PER_WORKSPACE = 5
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 3)
+    }
+
+
+def build_population(clients: int, workspaces: int, seed: int):
+    """
+    Spread clients over workspaces; every user is in #general plus one other channel.
+
+    Returns:
+        (per-client (workspace_id, user_id), workspace -> [(channel_id, user_id)])
+    """
+    rng = random.Random(seed)
+    population = []
+    memberships: Dict[str, List[Tuple[str, str]]] = {}
+    for i in range(clients):
+        workspace_id = f"bench-ws-{i % workspaces}"
+        user_id = f"bench-user-{i}"
+        population.append((workspace_id, user_id))
+        rows = memberships.setdefault(workspace_id, [])
+        rows.append((f"{workspace_id}-ch-0", user_id))
+        rows.append((f"{workspace_id}-ch-{rng.randrange(1, CHANNELS_PER_WORKSPACE)}", user_id))
+    return population, memberships
+
+
+# --- client process -------------------------------------------------------
+
+async def _client(url: str, stats: dict, typing_channel: Optional[str], stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            async with websockets.connect(url, max_queue=None, open_timeout=30) as ws:
+                typer = None
+                if typing_channel:
+                    typer = asyncio.create_task(_type(ws, typing_channel, stop))
+                try:
+                    async for raw in ws:
+                        now = time.time_ns()
+                        event = json.loads(raw)
+                        events = event if isinstance(event, list) else [event]
+                        for item in events:
+                            event_type = item.get("type")
+                            stats["received"][event_type] = stats["received"].get(event_type, 0) + 1
+                            sent_ns = (item.get("data") or {}).get("sent_ns")
+                            if sent_ns:
+                                stats["latency_ms"].append((now - sent_ns) / 1e6)
+                finally:
+                    if typer:
+                        typer.cancel()
+                return
+        except websockets.ConnectionClosed as e:
+            if e.rcvd is None or e.rcvd.code != 1013:
+                stats["errors"] += 1
+                return
+            # Turned away by admission control: honour the suggested backoff
+            stats["rejected"] += 1
+            await asyncio.sleep(json.loads(e.rcvd.reason or "{}").get("retry_after", 1.0))
+        except Exception:
+            stats["errors"] += 1
+            return
+
+
+async def _type(ws, channel_id: str, stop: asyncio.Event):
+    frame = json.dumps({"type": "typing", "channel_id": channel_id, "is_typing": True})
+    while not stop.is_set():
+        await ws.send(frame)
+        await asyncio.sleep(1.0 + random.random())
+
+
+async def _run_clients(urls: List[Tuple[str, Optional[str]]], conn):
+    stats = {"received": {}, "latency_ms": [], "rejected": 0, "errors": 0}
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(_client(url, stats, typing_channel, stop)) for url, typing_channel in urls]
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, conn.recv)  # workload finished
+    stop.set()
+    await asyncio.sleep(0.5)  # let in-flight frames land
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    conn.send(stats)
+
+
+def client_process(urls: List[Tuple[str, Optional[str]]], conn):
+    asyncio.run(_run_clients(urls, conn))
+
+
+# --- server side ----------------------------------------------------------
+
+async def _monitor_loop_lag(samples: List[float], interval: float = 0.01):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def _drive_messages(memberships, rate: float, duration: float) -> int:
+    workspaces = list(memberships)
+    rng = random.Random(1)
+    sent = 0
+    interval = 1.0 / rate
+    deadline = time.perf_counter() + duration
+    next_at = time.perf_counter()
+    while time.perf_counter() < deadline:
+        workspace_id = rng.choice(workspaces)
+        channel_id = f"{workspace_id}-ch-{rng.randrange(CHANNELS_PER_WORKSPACE)}"
+        event = create_event(
+            WSEventType.MESSAGE_NEW,
+            {"channel_id": channel_id, "content": "x" * 120, "sent_ns": time.time_ns()},
+            workspace_id
+        )
+        await manager.publish_event(event, channel_id=channel_id)
+        sent += 1
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    return sent
+
+
+async def _drive_presence(population, rate: float, duration: float) -> int:
+    rng = random.Random(2)
+    changes = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        workspace_id, user_id = rng.choice(population)
+        manager.presence.set_status(user_id, [workspace_id], rng.choice(["online", "away", "busy"]), None)
+        changes += 1
+        await asyncio.sleep(1.0 / rate)
+    return changes
+
+
+async def _wait_for_connections(expected: int, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while len(manager.connections) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+async def run(args) -> dict:
+    population, memberships = build_population(args.clients, args.workspaces, args.seed)
+
+    RedisClient.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    for workspace_id, user_id in population:
+        principal_cache._store(
+            user_id, Principal(user_id, f"{user_id}@bench.local", user_id, True, frozenset([workspace_id]))
+        )
+
+    async def fetch_memberships(workspace_id: str):
+        return memberships.get(workspace_id, [])
+
+    manager.channel_index._fetch = fetch_memberships
+
+    async def skip_persist():
+        pass
+
+    manager.presence.persist = skip_persist
+    if args.admission_rate:
+        admission.rate = args.admission_rate
+        admission.burst = int(args.admission_rate * 2)
+    await manager.initialize()
+
+    app = FastAPI()
+    app.add_api_websocket_route("/ws/{workspace_id}", websocket_endpoint)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    lag_samples: List[float] = []
+    lag_task = asyncio.create_task(_monitor_loop_lag(lag_samples))
+
+    urls = []
+    for i, (workspace_id, user_id) in enumerate(population):
+        token = create_access_token({"sub": user_id})
+        typing_channel = f"{workspace_id}-ch-0" if i < args.clients * args.typing_fraction else None
+        urls.append((f"ws://127.0.0.1:{args.port}/ws/{workspace_id}?token={token}", typing_channel))
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.get_context("spawn").Process(target=client_process, args=(urls, child_conn))
+    process.start()
+
+    connect_started = time.perf_counter()
+    await _wait_for_connections(args.clients, timeout=120)
+    connect_seconds = time.perf_counter() - connect_started
+    connected = len(manager.connections)
+    memory_per_socket = (tracemalloc.get_traced_memory()[0] - memory_before) / max(1, connected)
+    tracemalloc.stop()
+
+    # Let the lag monitor see past the tracemalloc teardown before measuring
+    await asyncio.sleep(0.1)
+    lag_samples.clear()
+    started = time.perf_counter()
+    messages_sent, presence_changes = await asyncio.gather(
+        _drive_messages(memberships, args.message_rate, args.duration),
+        _drive_presence(population, args.presence_rate, args.duration)
+    )
+    elapsed = time.perf_counter() - started
+
+    loop = asyncio.get_running_loop()
+    parent_conn.send("done")
+    stats = await loop.run_in_executor(None, parent_conn.recv)
+    process.join()
+
+    lag_task.cancel()
+    server.should_exit = True
+    await server_task
+
+    received = stats["received"]
+    return {
+        "revision": _git_revision(),
+        "config": {
+            "clients": args.clients,
+            "workspaces": args.workspaces,
+            "channels_per_workspace": CHANNELS_PER_WORKSPACE,
+            "duration_s": args.duration,
+            "message_rate": args.message_rate,
+            "presence_rate": args.presence_rate,
+            "typing_fraction": args.typing_fraction
+        },
+        "connect": {
+            "connected": connected,
+            "seconds": round(connect_seconds, 3),
+            "admission_rejections": stats["rejected"],
+            "errors": stats["errors"]
+        },
+        "published": {"messages": messages_sent, "presence_changes": presence_changes},
+        "delivered": received,
+        "events_per_second": round(sum(received.values()) / elapsed, 1),
+        "messages_delivered_per_second": round(received.get(WSEventType.MESSAGE_NEW.value, 0) / elapsed, 1),
+        "fanout_latency_ms": percentiles(stats["latency_ms"]),
+        "loop_lag_ms": percentiles(lag_samples),
+        "server_bytes_per_socket": round(memory_per_socket, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--workspaces", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of workload")
+    parser.add_argument("--message-rate", type=float, default=200.0, help="messages published per second")
+    parser.add_argument("--presence-rate", type=float, default=50.0, help="status changes per second")
+    parser.add_argument("--typing-fraction", type=float, default=0.05, help="share of clients that keep typing")
+    parser.add_argument("--admission-rate", type=float, default=0, help="override WS_ADMISSION_RATE")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
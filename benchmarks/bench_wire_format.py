@@ -0,0 +1,120 @@
+"""
+Wire format benchmark: bytes on the wire and encode/decode CPU per event.
+
+Compares the JSON text protocol with the msgpack subprotocol, each with and
+without deflate, over a representative mix of events (typing updates, presence
+diffs, short and long messages). Prints a JSON report.
+
+    python -m benchmarks.bench_wire_format --iterations 20000
+"""
+from typing import Callable, Dict, List
+import argparse
+import json
+import time
+import zlib
+
+import msgpack
+
+from app.core.config import settings
+from app.websocket.events import (
+    WSEventType,
+    create_event,
+    create_presence_diff_event,
+    create_typing_update_event
+)
+from app.websocket.protocol import MsgpackCodec
+
+
+def sample_events() -> List[dict]:
+    workspace_id = "5f1c0d7e9b1e8a0012345678"
+    channel_id = "5f1c0d7e9b1e8a0087654321"
+    message = {
+        "_id": "65a9f0c2d4e5f6a7b8c9d0e1",
+        "channel_id": channel_id,
+        "user_id": "user_4821",
+        "content": "Deploy finished, all green. Rolling the canary to 50% now.",
+        "attachments": [],
+        "reactions": {},
+        "mentions": [],
+        "thread_id": None,
+        "created_at": "2024-01-19T10:21:54.123456",
+        "updated_at": None
+    }
+    long_message = dict(message, content=" ".join(["Incident summary and follow-ups:"] + ["lorem ipsum"] * 300))
+    return [
+        create_typing_update_event(channel_id, ["user_4821"], ["user_4821"], [], workspace_id),
+        create_presence_diff_event({"online": ["user_1", "user_2"], "offline": ["user_3"]}, workspace_id),
+        create_event(WSEventType.MESSAGE_NEW, message, workspace_id),
+        create_event(WSEventType.MESSAGE_NEW, long_message, workspace_id)
+    ]
+
+
+def measure(encode: Callable[[dict], bytes], decode: Callable[[bytes], object], events: List[dict], iterations: int) -> Dict:
+    payloads = [encode(event) for event in events]
+
+    start = time.process_time()
+    for _ in range(iterations):
+        for event in events:
+            encode(event)
+    encode_seconds = time.process_time() - start
+
+    start = time.process_time()
+    for _ in range(iterations):
+        for payload in payloads:
+            decode(payload)
+    decode_seconds = time.process_time() - start
+
+    count = iterations * len(events)
+    return {
+        "bytes_per_event": [len(payload) for payload in payloads],
+        "total_bytes": sum(len(payload) for payload in payloads),
+        "encode_us_per_event": round(encode_seconds / count * 1e6, 3),
+        "decode_us_per_event": round(decode_seconds / count * 1e6, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    events = sample_events()
+    level = settings.WS_COMPRESSION_LEVEL
+
+    def json_encode(event):
+        return json.dumps(event, separators=(",", ":"), default=str).encode()
+
+    # Matches the server, which packs from the already-encoded JSON frame
+    def msgpack_encode(event):
+        return MsgpackCodec.pack_event(json.loads(json_encode(event)))
+
+    def msgpack_decode(payload):
+        return msgpack.unpackb(payload, raw=False)
+
+    formats = {
+        "json": (json_encode, json.loads),
+        "json+deflate": (
+            lambda event: zlib.compress(json_encode(event), level),
+            lambda payload: json.loads(zlib.decompress(payload))
+        ),
+        "msgpack": (msgpack_encode, msgpack_decode),
+        "msgpack+deflate": (
+            lambda event: zlib.compress(msgpack_encode(event), level),
+            lambda payload: msgpack_decode(zlib.decompress(payload))
+        )
+    }
+
+    report = {
+        "events": [event["type"] for event in events],
+        "iterations": args.iterations,
+        "compression_level": level,
+        "formats": {
+            name: measure(encode, decode, events, args.iterations)
+            for name, (encode, decode) in formats.items()
+        }
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
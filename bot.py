@@ -56,6 +56,6 @@ class AuditLog(Base):
     action = Column(String, nullable=False)  # e.g., "channel.create", "message.delete"
     resource_type = Column(String, nullable=False)  # e.g., "channel", "message"
     resource_id = Column(String, nullable=True)
-    metadata = Column(JSON, default=dict)  # Additional context
+    metadata_ = Column("metadata", JSON, default=dict)  # Additional context; "metadata" is reserved by SQLAlchemy
     ip_address = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,179 @@
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import select
+import asyncio
+
+from app.db.postgresql import AsyncSessionLocal
+from app.models.channel import Channel, ChannelMember
+from app.websocket.connection_state import ConnectionState
+
+
+class ChannelRoutingIndex:
+    """
+    In-memory channel -> online connections index used to route channel events.
+
+    User ids are interned to small integers so that channel membership for large
+    workspaces is held as sets of ints rather than sets of UUID strings. Membership
+    is loaded from ChannelMember rows when the first local socket of a workspace
+    connects and is dropped again when the last one leaves; in between it is kept
+    current through add_member/remove_member. Intern tables are per workspace and
+    are dropped with it, so they only hold users of workspaces with local sockets.
+    """
+
+    def __init__(self):
+        # workspace_id -> user_id -> interned integer id
+        self._user_ids: Dict[str, Dict[str, int]] = {}
+        # channel_id -> interned ids of its members
+        self._channel_members: Dict[str, Set[int]] = {}
+        # workspace_id -> channel ids known for it
+        self._workspace_channels: Dict[str, Set[str]] = {}
+        # workspace_id -> interned user id -> that user's local connections
+        self._online: Dict[str, Dict[int, Set[ConnectionState]]] = {}
+        self._loaded: Set[str] = set()
+        self._loading: Dict[str, asyncio.Task] = {}
+        # Membership changes seen while a workspace was loading: (channel_id, user_id, joined)
+        self._pending: Dict[str, List[Tuple[str, str, bool]]] = {}
+
+    def _intern(self, workspace_id: str, user_id: str) -> int:
+        user_ids = self._user_ids.setdefault(workspace_id, {})
+        uid = user_ids.get(user_id)
+        if uid is None:
+            uid = user_ids[user_id] = len(user_ids)
+        return uid
+
+    def _uid(self, workspace_id: str, user_id: str) -> Optional[int]:
+        return self._user_ids.get(workspace_id, {}).get(user_id)
+
+    def is_loaded(self, workspace_id: str) -> bool:
+        return workspace_id in self._loaded
+
+    async def ensure_loaded(self, workspace_id: str):
+        """Load channel membership for a workspace, coalescing concurrent callers."""
+        if workspace_id in self._loaded:
+            return
+        task = self._loading.get(workspace_id)
+        if task is None:
+            # Start buffering membership changes before the query is even sent
+            self._pending[workspace_id] = []
+            task = asyncio.create_task(self._load(workspace_id))
+            self._loading[workspace_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(workspace_id, None))
+        await asyncio.shield(task)
+
+    async def _fetch(self, workspace_id: str) -> List[Tuple[str, str]]:
+        """Read (channel_id, user_id) membership rows for a workspace."""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(ChannelMember.channel_id, ChannelMember.user_id)
+                .join(Channel, Channel.id == ChannelMember.channel_id)
+                .where(Channel.workspace_id == workspace_id)
+            )
+            return result.all()
+
+    async def _load(self, workspace_id: str):
+        try:
+            rows = await self._fetch(workspace_id)
+        except Exception:
+            self._pending.pop(workspace_id, None)
+            raise
+
+        pending = self._pending.pop(workspace_id, [])
+        if workspace_id not in self._online:
+            # Every local socket left while we were loading
+            return
+
+        channels = self._workspace_channels.setdefault(workspace_id, set())
+        for channel_id, user_id in rows:
+            self._channel_members.setdefault(channel_id, set()).add(self._intern(workspace_id, user_id))
+            channels.add(channel_id)
+        self._loaded.add(workspace_id)
+
+        for channel_id, user_id, joined in pending:
+            self._apply(workspace_id, channel_id, user_id, joined)
+
+    def _apply(self, workspace_id: str, channel_id: str, user_id: str, joined: bool):
+        if joined:
+            self._channel_members.setdefault(channel_id, set()).add(self._intern(workspace_id, user_id))
+            self._workspace_channels.setdefault(workspace_id, set()).add(channel_id)
+        else:
+            members = self._channel_members.get(channel_id)
+            uid = self._uid(workspace_id, user_id)
+            if members is not None and uid is not None:
+                members.discard(uid)
+
+    def add_member(self, workspace_id: str, channel_id: str, user_id: str):
+        """Record that a user joined a channel."""
+        self._record(workspace_id, channel_id, user_id, True)
+
+    def remove_member(self, workspace_id: str, channel_id: str, user_id: str):
+        """Record that a user left a channel."""
+        self._record(workspace_id, channel_id, user_id, False)
+
+    def _record(self, workspace_id: str, channel_id: str, user_id: str, joined: bool):
+        if workspace_id in self._pending:
+            self._pending[workspace_id].append((channel_id, user_id, joined))
+        elif workspace_id in self._loaded:
+            self._apply(workspace_id, channel_id, user_id, joined)
+
+    def add_connection(self, connection: ConnectionState):
+        """Register a local connection for its user."""
+        online = self._online.setdefault(connection.workspace_id, {})
+        online.setdefault(self._intern(connection.workspace_id, connection.user_id), set()).add(connection)
+
+    def remove_connection(self, connection: ConnectionState):
+        """Unregister a local connection; forgets the workspace once it has none left."""
+        workspace_id = connection.workspace_id
+        online = self._online.get(workspace_id)
+        uid = self._uid(workspace_id, connection.user_id)
+        if online is None or uid is None:
+            return
+        connections = online.get(uid)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del online[uid]
+        if not online:
+            self._drop_workspace(workspace_id)
+
+    def _drop_workspace(self, workspace_id: str):
+        self._online.pop(workspace_id, None)
+        self._user_ids.pop(workspace_id, None)
+        self._loaded.discard(workspace_id)
+        for channel_id in self._workspace_channels.pop(workspace_id, ()):
+            self._channel_members.pop(channel_id, None)
+
+    def is_member(self, workspace_id: str, channel_id: str, user_id: str) -> Optional[bool]:
+        """Check channel membership; None if membership for the workspace isn't loaded."""
+        if workspace_id not in self._loaded:
+            return None
+        uid = self._uid(workspace_id, user_id)
+        return uid is not None and uid in self._channel_members.get(channel_id, ())
+
+    def connections_for_users(self, workspace_id: str, user_ids: List[str]) -> List[ConnectionState]:
+        """Get the local connections of the given users in a workspace."""
+        online = self._online.get(workspace_id)
+        if not online:
+            return []
+        connections = []
+        for user_id in user_ids:
+            uid = self._uid(workspace_id, user_id)
+            if uid is not None:
+                connections.extend(online.get(uid, ()))
+        return connections
+
+    def connections_for_channel(self, workspace_id: str, channel_id: str) -> Optional[List[ConnectionState]]:
+        """
+        Get local connections of a channel's members.
+
+        Returns:
+            The connections, or None if membership for the workspace isn't loaded
+        """
+        if workspace_id not in self._loaded:
+            return None
+        members = self._channel_members.get(channel_id)
+        online = self._online.get(workspace_id)
+        if not members or not online:
+            return []
+        # Walk whichever side is smaller: O(min(channel members, online users))
+        if len(members) <= len(online):
+            return [conn for uid in members for conn in online.get(uid, ())]
+        return [conn for uid, conns in online.items() if uid in members for conn in conns]
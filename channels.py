@@ -4,11 +4,16 @@ from sqlalchemy import select
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
 
 from app.db.postgresql import get_db
+from app.db.mongodb import get_mongo_db
+from app.core.read_markers import read_markers
 from app.models.channel import Channel, ChannelMember, DirectMessage, ChannelType, ChannelRole
-from app.models.user import User
+from app.models.user import User, UserWorkspace, UserRole
 from app.api.v1.endpoints.auth import get_current_user
+from app.websocket.connection_manager import manager
 
 router = APIRouter()
 
@@ -56,6 +61,8 @@ async def create_channel(
     await db.commit()
     await db.refresh(channel)
     
+    await manager.update_channel_membership(channel.workspace_id, channel.id, current_user.id, joined=True)
+    
     return channel
 
 @router.get("", response_model=List[ChannelResponse])
@@ -71,6 +78,30 @@ async def list_channels(
     channels = result.scalars().all()
     return channels
 
+class ReadMarkerUpdate(BaseModel):
+    message_id: str
+
+class UnreadCount(BaseModel):
+    channel_id: str
+    unread: int
+    mentions: int
+    last_read_message_id: Optional[str]
+
+@router.get("/unread", response_model=List[UnreadCount])
+async def get_unread_counts(
+    workspace_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Unread and mention counts for every channel the user belongs to in a workspace."""
+    result = await db.execute(
+        select(ChannelMember.channel_id)
+        .join(Channel, Channel.id == ChannelMember.channel_id)
+        .where(Channel.workspace_id == workspace_id, ChannelMember.user_id == current_user.id)
+    )
+    channel_ids = list(result.scalars().all())
+    return await read_markers.counts(current_user.id, workspace_id, channel_ids)
+
 @router.get("/{channel_id}", response_model=ChannelResponse)
 async def get_channel(
     channel_id: str,
@@ -86,6 +117,29 @@ async def get_channel(
     
     return channel
 
+@router.post("/{channel_id}/read")
+async def mark_channel_read(
+    channel_id: str,
+    marker: ReadMarkerUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    """Move the user's read marker in a channel forward to a message."""
+    try:
+        message_oid = ObjectId(marker.message_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    db = get_mongo_db()
+    message = await db.messages.find_one(
+        {"_id": message_oid, "channel_id": channel_id},
+        projection={"channel_seq": 1}
+    )
+    if not message or message.get("channel_seq") is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    moved = await read_markers.mark_read(current_user.id, channel_id, marker.message_id, message["channel_seq"])
+    return {"status": "read" if moved else "unchanged"}
+
 @router.post("/{channel_id}/members")
 async def add_channel_member(
     channel_id: str,
@@ -94,6 +148,12 @@ async def add_channel_member(
     db: AsyncSession = Depends(get_db)
 ):
     """Add a member to a channel."""
+    result = await db.execute(select(Channel).where(Channel.id == channel_id))
+    channel = result.scalar_one_or_none()
+    
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
     member = ChannelMember(
         channel_id=channel_id,
         user_id=user_id,
@@ -102,4 +162,59 @@ async def add_channel_member(
     db.add(member)
     await db.commit()
     
+    await manager.update_channel_membership(channel.workspace_id, channel_id, user_id, joined=True)
+    
     return {"status": "added"}
+
+async def _is_channel_admin(db: AsyncSession, channel: Channel, user_id: str) -> bool:
+    """Whether a user is an admin of the channel or an owner/admin of its workspace."""
+    result = await db.execute(
+        select(ChannelMember.role).where(
+            ChannelMember.channel_id == channel.id,
+            ChannelMember.user_id == user_id
+        )
+    )
+    if result.scalar_one_or_none() == ChannelRole.ADMIN:
+        return True
+    result = await db.execute(
+        select(UserWorkspace.role).where(
+            UserWorkspace.workspace_id == channel.workspace_id,
+            UserWorkspace.user_id == user_id
+        )
+    )
+    return result.scalar_one_or_none() in (UserRole.OWNER, UserRole.ADMIN)
+
+@router.delete("/{channel_id}/members/{user_id}")
+async def remove_channel_member(
+    channel_id: str,
+    user_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Remove a member from a channel. Members can leave; removing others takes a channel or workspace admin."""
+    result = await db.execute(select(Channel).where(Channel.id == channel_id))
+    channel = result.scalar_one_or_none()
+    
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    if user_id != current_user.id and not await _is_channel_admin(db, channel, current_user.id):
+        raise HTTPException(status_code=403, detail="Only channel or workspace admins can remove other members")
+    
+    result = await db.execute(
+        select(ChannelMember).where(
+            ChannelMember.channel_id == channel_id,
+            ChannelMember.user_id == user_id
+        )
+    )
+    member = result.scalar_one_or_none()
+    
+    if not member:
+        raise HTTPException(status_code=404, detail="Member not found")
+    
+    await db.delete(member)
+    await db.commit()
+    
+    await manager.update_channel_membership(channel.workspace_id, channel_id, user_id, joined=False)
+    
+    return {"status": "removed"}
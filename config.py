@@ -16,6 +16,21 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     ENCRYPTION_KEY: str = secrets.token_urlsafe(32)
+    ENCRYPTION_WRITE_VERSION: int = 2  # 2 = binary AES-GCM envelope, 1 = legacy base64 Fernet text
+    ENCRYPTION_WORKERS: int = 4  # threads used for batch encryption/decryption
+    ENCRYPTION_INLINE_BATCH: int = 8  # batches this small are handled on the event loop
+    DECRYPT_CACHE_SIZE: int = 20000  # decrypted messages kept, keyed by (id, version)
+    ENCRYPTION_MIGRATION_ENABLED: bool = False  # rewrite v1 messages as v2 in the background
+    ENCRYPTION_MIGRATION_BATCH: int = 500  # documents per bulk_write
+    ENCRYPTION_MIGRATION_PAUSE: float = 0.1  # seconds between batches
+    ENCRYPTION_MIGRATION_LEASE: int = 60  # seconds a node owns the migration without renewing
+    WORKSPACE_KEYS_ENABLED: bool = True  # encrypt messages with per-workspace data keys instead of the global key
+    WORKSPACE_KEY_CACHE_SIZE: int = 10000  # unwrapped data keys kept per node
+    WORKSPACE_KEY_ACTIVE_TTL: int = 60  # seconds a node keeps using a workspace's key before checking for a newer one
+    KMS_MASTER_KEY_FILE: str = "kms_master_keys.json"  # master keys for the local KMS; derived from ENCRYPTION_KEY if missing
+    PRINCIPAL_CACHE_TTL: int = 60  # seconds a resolved user/membership lookup is reused
+    PRINCIPAL_CACHE_SIZE: int = 100000  # principals kept in memory per node
+    PRINCIPAL_CACHE_MISS_TTL: int = 5  # seconds a handshake for a workspace the user isn't in is answered without rechecking PostgreSQL
     
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:5173"]
@@ -79,9 +94,52 @@ class Settings(BaseSettings):
         "application/zip", "application/x-zip-compressed"
     ]
     
+    # Bulk ingestion
+    BULK_INGEST_MAX_MESSAGES: int = 50000  # per request, JSON or NDJSON
+    BULK_INGEST_CHUNK_SIZE: int = 1000  # messages per insert_many
+    BULK_INGEST_MAX_BYTES: int = 64 * 1024 * 1024  # request body, JSON or NDJSON
+    BULK_INGEST_MAX_LINE_BYTES: int = 256 * 1024  # one NDJSON message
+    
+    # Hot-channel message cache
+    MESSAGE_CACHE_CHANNEL_MESSAGES: int = 100  # newest messages kept per channel
+    MESSAGE_CACHE_MAX_CHANNELS: int = 5000
+    MESSAGE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # estimated, across all channels
+    MESSAGE_CACHE_TTL: int = 300  # seconds; backstop for lost pub/sub events
+    
+    # Read markers
+    READ_MARKER_PERSIST_INTERVAL: int = 30  # seconds between bulk write-backs to MongoDB
+    
     # WebSocket
     WS_HEARTBEAT_INTERVAL: int = 30  # seconds
+    WS_IDLE_TIMEOUT: int = 75  # seconds without any client frame before a socket is reaped
+    WS_HEARTBEAT_SLOTS: int = 30  # timer wheel slots; one slot is visited every interval / slots
     WS_MESSAGE_QUEUE_SIZE: int = 100
+    WS_ADMISSION_RATE: float = 200.0  # connects accepted per second (token bucket refill)
+    WS_ADMISSION_BURST: int = 400  # connects accepted back to back before the rate applies
+    WS_MAX_CONCURRENT_HANDSHAKES: int = 500
+    WS_ADMISSION_MAX_WAIT: float = 2.0  # longest a connect is deferred before it is rejected instead
+    WS_ADMISSION_RETRY_MIN: float = 1.0  # lower bound for the retry delay suggested on rejection
+    WS_SLOW_CONSUMER_POLICY: str = "drop_oldest"  # drop_oldest, drop_ephemeral, disconnect
+    WS_PER_MESSAGE_DEFLATE: bool = True  # permessage-deflate negotiation in uvicorn
+    WS_COMPRESSION_MIN_BYTES: int = 1024  # binary frames at least this large are deflated once per event
+    WS_COMPRESSION_LEVEL: int = 6
+    WS_BATCH_WINDOW_MS: int = 5  # how long a batching connection waits to group events
+    WS_BATCH_MAX_EVENTS: int = 50
+    WS_BATCH_BYPASS_TYPES: List[str] = ["heartbeat", "error", "typing.update"]
+    WS_TYPING_TTL: float = 6.0  # seconds a typing start stays active without a refresh
+    WS_TYPING_FLUSH_INTERVAL: float = 0.5  # at most one typing frame per channel per interval
+    WS_TYPING_REFRESH_INTERVAL: float = 3.0  # channels with typers are re-announced at least this often
+    WS_REACTION_HOT_THRESHOLD: int = 10  # reaction changes per message per interval before they are coalesced
+    WS_REACTION_FLUSH_INTERVAL: float = 1.0  # at most one reaction.counts per hot message per interval
+    WS_MAX_THREAD_SUBSCRIPTIONS: int = 200  # threads one connection can follow as a viewer
+    WS_PRESENCE_TTL: int = 90  # seconds a user stays online without a refresh from their node
+    WS_PRESENCE_FLUSH_INTERVAL: float = 2.0  # one presence.diff per workspace per interval
+    WS_PRESENCE_PERSIST_INTERVAL: int = 60  # seconds between bulk last_seen write-backs
+    WS_REPLAY_LOG_SIZE: int = 1000  # events kept per workspace for resuming sessions
+    WS_REPLAY_TTL: int = 86400  # seconds an idle workspace's replay log is kept
+    WS_REPLAY_GAP_TIMEOUT: float = 0.5  # how long a resume waits for events still being logged
+    WS_EVENT_DEDUPE_WINDOW: int = 10000  # recently delivered event ids remembered per node
+    WS_PUBSUB_SHARDS: int = 0  # 0 = one Redis channel per workspace, N = hash workspaces into N channels
     
     class Config:
         env_file = ".env"
@@ -1,141 +1,669 @@
-from typing import Dict, Set, Optional
+from typing import Dict, List, Set, Optional, Tuple, Union
+from collections import OrderedDict
+from bson import ObjectId
 from fastapi import WebSocket
+from sqlalchemy import or_, select
 import json
 import asyncio
-from datetime import datetime
+import itertools
+import time
+import uuid
+import zlib
+from app.db.mongodb import get_mongo_db
+from app.db.postgresql import AsyncSessionLocal
 from app.db.redis import get_redis
 from app.core.config import settings
+from app.models.channel import DirectMessage
+from app.websocket.channel_index import ChannelRoutingIndex
+from app.websocket.connection_state import ConnectionState
+from app.websocket.events import (
+    EPHEMERAL_EVENT_TYPES,
+    Frame,
+    WSEventType,
+    create_event,
+    create_sync_required_event,
+    encode_frame
+)
+from app.websocket.heartbeat import HeartbeatWheel
+from app.websocket.message_cache import MessageCache
+from app.websocket.outbound import OutboundQueue, SlowConsumerPolicy
+from app.websocket.presence import PresenceEngine
+from app.websocket.protocol import json_codec
+from app.websocket.reactions import ReactionAggregator
+from app.websocket.replay import ReplayLog
+from app.websocket.typing_indicators import TypingAggregator
+
+WS_CHANNEL_PREFIX = "ws_events:"
+
+
+class RecentEventIds:
+    """Bounded window of recently delivered event ids, oldest evicted first."""
+    
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._ids: "OrderedDict[str, None]" = OrderedDict()
+    
+    def add(self, event_id: str) -> bool:
+        """Remember an event id. Returns False if it was already in the window."""
+        if event_id in self._ids:
+            return False
+        self._ids[event_id] = None
+        if len(self._ids) > self.size:
+            self._ids.popitem(last=False)
+        return True
 
 
 class ConnectionManager:
     """Manage WebSocket connections with Redis pub/sub for scaling."""
     
     def __init__(self):
-        # workspace_id -> set of WebSocket connections
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
-        # websocket -> user_id mapping
-        self.connection_users: Dict[WebSocket, str] = {}
-        # websocket -> workspace_id mapping
-        self.connection_workspaces: Dict[WebSocket, str] = {}
+        # websocket -> its connection record (user, workspace, outbound queue, activity)
+        self.connections: Dict[WebSocket, ConnectionState] = {}
+        # workspace_id -> its local connections
+        self.workspace_connections: Dict[str, Set[ConnectionState]] = {}
+        self.slow_consumer_policy = SlowConsumerPolicy(settings.WS_SLOW_CONSUMER_POLICY)
+        # Latency-sensitive event types that are never held back for batching
+        self.batch_bypass_types = frozenset(settings.WS_BATCH_BYPASS_TYPES)
+        # channel -> online member sockets
+        self.channel_index = ChannelRoutingIndex()
+        # parent message id -> connections viewing that thread
+        self.thread_viewers: Dict[str, Set[ConnectionState]] = {}
         self.redis = None
         self.pubsub = None
         self.listener_task = None
+        self.replay_log: Optional[ReplayLog] = None
+        # pub/sub channel -> number of locally active workspaces routed through it
+        self.channel_interest: Dict[str, int] = {}
+        self.subscribed_channels: Set[str] = set()
+        self._subscription_lock = asyncio.Lock()
+        self._has_subscriptions = asyncio.Event()
+        # Unique per worker process, so several workers on one host never mistake each other's events
+        self.node_id = uuid.uuid4().hex
+        self._event_counter = itertools.count()
+        self.recent_events = RecentEventIds(settings.WS_EVENT_DEDUPE_WINDOW)
+        self.typing = TypingAggregator(self.publish_event)
+        self.reactions = ReactionAggregator(self.publish_event)
+        self.heartbeats = HeartbeatWheel(self._enqueue, self._reap_idle)
+        self.presence = PresenceEngine(self.publish_event, lambda: self.workspace_connections.keys())
+        # Only kept coherent for workspaces whose events this node receives
+        self.message_cache = MessageCache(lambda workspace_id: workspace_id in self.workspace_connections)
     
     async def initialize(self):
-        """Initialize Redis pub/sub."""
+        """Initialize Redis pub/sub. Channels are subscribed as local interest appears."""
         self.redis = get_redis()
         self.pubsub = self.redis.pubsub()
-        await self.pubsub.subscribe("websocket_events")
+        self.replay_log = ReplayLog(self.redis)
         # Start listening for Redis messages
         self.listener_task = asyncio.create_task(self._redis_listener())
+        self.typing.start(self.redis)
+        self.reactions.start()
+        self.heartbeats.start()
+        self.presence.start(self.redis)
+    
+    @staticmethod
+    def pubsub_channel(workspace_id: str) -> str:
+        """Redis channel carrying a workspace's events (per workspace, or a hashed shard)."""
+        shards = settings.WS_PUBSUB_SHARDS
+        if shards > 0:
+            return f"{WS_CHANNEL_PREFIX}shard:{zlib.crc32(workspace_id.encode()) % shards}"
+        return f"{WS_CHANNEL_PREFIX}{workspace_id}"
+    
+    async def _add_interest(self, workspace_id: str):
+        channel = self.pubsub_channel(workspace_id)
+        self.channel_interest[channel] = self.channel_interest.get(channel, 0) + 1
+        await self._sync_subscription(channel)
+    
+    async def _remove_interest(self, workspace_id: str):
+        channel = self.pubsub_channel(workspace_id)
+        remaining = self.channel_interest.get(channel, 0) - 1
+        if remaining > 0:
+            self.channel_interest[channel] = remaining
+        else:
+            self.channel_interest.pop(channel, None)
+        await self._sync_subscription(channel)
+    
+    async def _sync_subscription(self, channel: str):
+        """Subscribe or unsubscribe so that the node follows current local interest."""
+        if not self.pubsub:
+            return
+        async with self._subscription_lock:
+            wanted = channel in self.channel_interest
+            try:
+                if wanted and channel not in self.subscribed_channels:
+                    await self.pubsub.subscribe(channel)
+                    self.subscribed_channels.add(channel)
+                    self._has_subscriptions.set()
+                elif not wanted and channel in self.subscribed_channels:
+                    await self.pubsub.unsubscribe(channel)
+                    self.subscribed_channels.discard(channel)
+            except Exception as e:
+                print(f"Redis subscription error for {channel}: {e}")
     
-    async def connect(self, websocket: WebSocket, workspace_id: str, user_id: str):
-        """Accept a new WebSocket connection."""
-        await websocket.accept()
+    async def connect(
+        self,
+        websocket: WebSocket,
+        workspace_id: str,
+        user_id: str,
+        batch: bool = False,
+        resume_from: Optional[int] = None,
+        codec=json_codec,
+        subprotocol: Optional[str] = None
+    ):
+        """
+        Accept a new WebSocket connection.
         
-        if workspace_id not in self.active_connections:
-            self.active_connections[workspace_id] = set()
+        Args:
+            batch: Send bursts of events as array frames
+            resume_from: Last sequence number the client saw; missed events are replayed
+            codec: Wire format negotiated from the client's subprotocols
+            subprotocol: Subprotocol to confirm in the handshake
+        """
+        await websocket.accept(subprotocol=subprotocol)
         
-        self.active_connections[workspace_id].add(websocket)
-        self.connection_users[websocket] = user_id
-        self.connection_workspaces[websocket] = workspace_id
+        # Live events queue up from here on; the writer starts once any replay is in front of them
+        queue = OutboundQueue(
+            settings.WS_MESSAGE_QUEUE_SIZE, self.slow_consumer_policy, batching=batch, codec=codec
+        )
+        connection = ConnectionState(websocket, user_id, workspace_id, queue)
+        first_local_socket = self._register(connection)
+        if first_local_socket:
+            await self._add_interest(workspace_id)
+        try:
+            await self.channel_index.ensure_loaded(workspace_id)
+        except Exception as e:
+            # Channel events fall back to workspace-wide delivery until the next load
+            print(f"Error loading channel membership for workspace {workspace_id}: {e}")
+        
+        try:
+            await self.presence.connected(workspace_id, user_id)
+        except Exception as e:
+            print(f"Presence error: {e}")
         
-        print(f"✓ User {user_id} connected to workspace {workspace_id}")
+        if resume_from is not None:
+            await self._replay(queue, workspace_id, user_id, resume_from)
+        if self.connections.get(websocket) is connection:
+            # Still connected after the awaits above
+            queue.writer_task = asyncio.create_task(self._writer(connection))
+    
+    def _register(self, connection: ConnectionState) -> bool:
+        """Add a connection to every index. Returns True if it is the workspace's first local one."""
+        self.connections[connection.websocket] = connection
+        workspace = self.workspace_connections.get(connection.workspace_id)
+        first_local_socket = workspace is None
+        if first_local_socket:
+            workspace = self.workspace_connections[connection.workspace_id] = set()
+        workspace.add(connection)
+        self.channel_index.add_connection(connection)
+        self.heartbeats.add(connection)
+        return first_local_socket
     
     async def disconnect(self, websocket: WebSocket):
         """Remove a WebSocket connection."""
-        workspace_id = self.connection_workspaces.get(websocket)
-        user_id = self.connection_users.get(websocket)
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        workspace_id = connection.workspace_id
         
-        if workspace_id and websocket in self.active_connections.get(workspace_id, set()):
-            self.active_connections[workspace_id].remove(websocket)
-            
+        last_local_socket = False
+        workspace = self.workspace_connections.get(workspace_id)
+        if workspace is not None:
+            workspace.discard(connection)
             # Clean up empty workspace sets
-            if not self.active_connections[workspace_id]:
-                del self.active_connections[workspace_id]
+            if not workspace:
+                del self.workspace_connections[workspace_id]
+                last_local_socket = True
         
-        self.connection_users.pop(websocket, None)
-        self.connection_workspaces.pop(websocket, None)
+        queue = connection.queue
+        if queue.writer_task and queue.writer_task is not asyncio.current_task():
+            queue.writer_task.cancel()
+        self.heartbeats.remove(connection)
+        self.channel_index.remove_connection(connection)
+        if connection.thread_subscriptions:
+            self._drop_thread_viewer(connection, connection.thread_subscriptions)
+        try:
+            await self.presence.disconnected(workspace_id, connection.user_id)
+        except Exception as e:
+            print(f"Presence error: {e}")
         
-        if user_id and workspace_id:
-            print(f"✓ User {user_id} disconnected from workspace {workspace_id}")
+        if last_local_socket:
+            self.message_cache.drop_workspace(workspace_id)
+            await self._remove_interest(workspace_id)
     
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
-        """Send a message to a specific WebSocket connection."""
+    def touch(self, websocket: WebSocket):
+        """Record activity from a client so it isn't reaped as idle."""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.last_activity = time.monotonic()
+            connection.frames_received += 1
+    
+    def _enqueue(self, connection: ConnectionState, frame: Frame):
+        if not connection.queue.put(frame):
+            asyncio.create_task(self._evict_slow_consumer(connection.websocket))
+    
+    async def _reap_idle(self, connections):
+        """Drop connections that went silent, closing their sockets in the background."""
+        websockets = [connection.websocket for connection in connections]
+        for websocket in websockets:
+            await self.disconnect(websocket)
+        asyncio.create_task(self._close_all(websockets, code=1001))
+    
+    @classmethod
+    async def _close_all(cls, websockets, code: int):
+        await asyncio.gather(*(cls._close_quietly(websocket, code) for websocket in websockets))
+    
+    async def _replay(self, queue: OutboundQueue, workspace_id: str, user_id: str, resume_from: int):
+        """Queue the events a resuming client missed, or a sync.required event if they're gone."""
+        entries = None
+        if self.replay_log:
+            try:
+                entries = await self.replay_log.since(workspace_id, resume_from)
+            except Exception as e:
+                print(f"Error reading replay log: {e}")
+        
+        if entries is None:
+            latest_seq = 0
+            if self.replay_log:
+                try:
+                    latest_seq = await self.replay_log.latest_seq(workspace_id)
+                except Exception:
+                    pass
+            queue.prepend([encode_frame(create_sync_required_event(latest_seq, workspace_id))])
+            return
+        
+        frames = []
+        for seq, channel_id, participant_ids, text in entries:
+            # Skip events from channels the user can't see
+            if channel_id and self.channel_index.is_member(workspace_id, channel_id, user_id) is False:
+                continue
+            # and thread events for threads they aren't in; viewers resubscribe after reconnecting
+            if participant_ids is not None and user_id not in participant_ids:
+                continue
+            frames.append(Frame(text, None, seq))
+        if frames:
+            queue.prepend(frames)
+    
+    async def send_personal_message(self, message: Union[dict, Frame], websocket: WebSocket):
+        """Queue a message for a specific WebSocket connection."""
+        frame = encode_frame(message)
+        connection = self.connections.get(websocket)
+        if connection is None:
+            try:
+                await websocket.send_text(frame.text)
+            except Exception as e:
+                print(f"Error sending message: {e}")
+            return
+        
+        if not connection.queue.put(frame):
+            await self._evict_slow_consumer(websocket)
+    
+    async def broadcast_to_workspace(
+        self, workspace_id: str, message: Union[dict, Frame], exclude: Optional[WebSocket] = None
+    ):
+        """Broadcast a message to all connections in a workspace without waiting on any socket."""
+        if workspace_id in self.workspace_connections:
+            await self._fan_out(self.workspace_connections[workspace_id], encode_frame(message), exclude)
+    
+    async def _fan_out(self, connections, frame: Frame, exclude: Optional[WebSocket] = None):
+        """Enqueue one shared frame on each connection."""
+        overflowed = []
+        for connection in connections:
+            if connection.websocket is not exclude and not connection.queue.put(frame):
+                overflowed.append(connection.websocket)
+        
+        # Slow consumers under the "disconnect" policy
+        for websocket in overflowed:
+            await self._evict_slow_consumer(websocket)
+    
+    async def _writer(self, connection: ConnectionState):
+        """Drain a connection's outbound queue onto its socket."""
+        window = settings.WS_BATCH_WINDOW_MS / 1000
+        websocket = connection.websocket
+        queue = connection.queue
+        codec = queue.codec
         try:
-            await websocket.send_json(message)
+            while True:
+                if not queue.batching:
+                    await codec.send(websocket, await queue.get())
+                    connection.frames_sent += 1
+                    continue
+                batch = await queue.get_batch(settings.WS_BATCH_MAX_EVENTS, window, self.batch_bypass_types)
+                if len(batch) == 1:
+                    await codec.send(websocket, batch[0])
+                else:
+                    # One array frame (and one send) for the whole burst
+                    await codec.send_batch(websocket, batch)
+                connection.frames_sent += len(batch)
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
             print(f"Error sending message: {e}")
             await self.disconnect(websocket)
     
-    async def broadcast_to_workspace(self, workspace_id: str, message: dict, exclude: Optional[WebSocket] = None):
-        """Broadcast a message to all connections in a workspace."""
-        if workspace_id in self.active_connections:
-            disconnected = []
-            for connection in self.active_connections[workspace_id]:
-                if connection != exclude:
-                    try:
-                        await connection.send_json(message)
-                    except Exception as e:
-                        print(f"Error broadcasting: {e}")
-                        disconnected.append(connection)
-            
-            # Clean up disconnected connections
-            for conn in disconnected:
-                await self.disconnect(conn)
-    
-    async def broadcast_to_channel(self, workspace_id: str, channel_id: str, message: dict):
-        """Broadcast a message to all users in a specific channel."""
-        # In a real implementation, you'd check channel membership
-        # For now, broadcast to entire workspace
-        await self.broadcast_to_workspace(workspace_id, message)
-    
-    async def publish_event(self, event: dict):
-        """Publish an event to Redis for other server instances."""
+    async def _evict_slow_consumer(self, websocket: WebSocket):
+        """Drop a connection whose outbound queue overflowed."""
+        await self.disconnect(websocket)
+        # Closing may itself block on a stalled client, so don't hold up the caller
+        asyncio.create_task(self._close_quietly(websocket, code=1013))
+    
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+    
+    async def broadcast_to_channel(self, workspace_id: str, channel_id: str, message: Union[dict, Frame]):
+        """Broadcast a message to the connected members of a specific channel."""
+        connections = self.channel_index.connections_for_channel(workspace_id, channel_id)
+        if connections is None:
+            # Membership isn't loaded for this workspace, so we can't narrow it down
+            await self.broadcast_to_workspace(workspace_id, message)
+            return
+        await self._fan_out(connections, encode_frame(message))
+    
+    async def update_channel_membership(self, workspace_id: str, channel_id: str, user_id: str, joined: bool):
+        """Apply a channel join/leave to the routing index on every node and notify the channel."""
+        event = create_event(
+            WSEventType.MEMBER_JOINED if joined else WSEventType.MEMBER_LEFT,
+            {"channel_id": channel_id, "user_id": user_id},
+            workspace_id
+        )
+        await self.publish_event(event, channel_id=channel_id)
+    
+    async def _apply_member_event(self, workspace_id: str, message: Union[dict, Frame]):
+        event = json.loads(message.text) if isinstance(message, Frame) else message
+        data = event.get("data") or {}
+        channel_id = data.get("channel_id")
+        user_id = data.get("user_id")
+        if not channel_id or not user_id:
+            return
+        if event.get("type") == WSEventType.MEMBER_JOINED.value:
+            self.channel_index.add_member(workspace_id, channel_id, user_id)
+            await self.broadcast_to_channel(workspace_id, channel_id, message)
+        else:
+            # Let the departing member see their own leave event
+            await self.broadcast_to_channel(workspace_id, channel_id, message)
+            self.channel_index.remove_member(workspace_id, channel_id, user_id)
+    
+    async def subscribe_threads(self, websocket: WebSocket, thread_ids: List[str]) -> int:
+        """
+        Follow threads as a viewer, receiving their events without participating.
+        
+        Only threads the user can see are added: a channel thread needs channel
+        membership (checked again on every delivery), a DM thread needs the user
+        to be one of the DM's members.
+        
+        Raises:
+            ValueError: thread_ids isn't a list of message ids, or is longer than WS_MAX_THREAD_SUBSCRIPTIONS
+        
+        Returns:
+            How many threads were added; the rest are unknown, not visible to
+            the user, or past WS_MAX_THREAD_SUBSCRIPTIONS
+        """
+        if not isinstance(thread_ids, list) or not all(
+            isinstance(thread_id, str) and ObjectId.is_valid(thread_id) for thread_id in thread_ids
+        ):
+            raise ValueError("thread_ids must be a list of message ids")
+        if len(thread_ids) > settings.WS_MAX_THREAD_SUBSCRIPTIONS:
+            raise ValueError(f"At most {settings.WS_MAX_THREAD_SUBSCRIPTIONS} thread_ids per subscribe")
+        
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return 0
+        subscribed = connection.thread_subscriptions or ()
+        thread_ids = [thread_id for thread_id in dict.fromkeys(thread_ids) if thread_id not in subscribed]
+        if not thread_ids:
+            return 0
+        try:
+            visible = await self._visible_threads(connection, thread_ids)
+        except Exception as e:
+            print(f"Error checking thread access: {e}")
+            return 0
+        if self.connections.get(websocket) is not connection:
+            # Disconnected while we were checking
+            return 0
+        
+        if connection.thread_subscriptions is None:
+            connection.thread_subscriptions = set()
+        added = 0
+        for thread_id in thread_ids:
+            if len(connection.thread_subscriptions) >= settings.WS_MAX_THREAD_SUBSCRIPTIONS:
+                break
+            if thread_id not in visible:
+                continue
+            connection.thread_subscriptions.add(thread_id)
+            self.thread_viewers.setdefault(thread_id, set()).add(connection)
+            added += 1
+        return added
+    
+    async def _visible_threads(self, connection: ConnectionState, thread_ids: List[str]) -> Set[str]:
+        """The thread ids among thread_ids whose channel or DM the connection's user is in."""
+        workspace_id, user_id = connection.workspace_id, connection.user_id
+        parents = await self._fetch_thread_parents(workspace_id, thread_ids)
+        dm_ids = {dm_id for _, channel_id, dm_id in parents if not channel_id and dm_id}
+        member_dms = await self._fetch_member_dms(workspace_id, user_id, dm_ids) if dm_ids else set()
+        visible = set()
+        for thread_id, channel_id, dm_id in parents:
+            if channel_id:
+                if self.channel_index.is_member(workspace_id, channel_id, user_id) is not False:
+                    visible.add(thread_id)
+            elif dm_id in member_dms:
+                visible.add(thread_id)
+        return visible
+    
+    async def _fetch_thread_parents(
+        self, workspace_id: str, thread_ids: List[str]
+    ) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """Read (thread_id, channel_id, dm_id) for the thread parents that exist in a workspace."""
+        parents = await get_mongo_db().messages.find(
+            {
+                "_id": {"$in": [ObjectId(thread_id) for thread_id in thread_ids]},
+                "workspace_id": workspace_id,
+                "thread_id": None
+            },
+            projection={"channel_id": 1, "dm_id": 1}
+        ).to_list(length=None)
+        return [(str(parent["_id"]), parent.get("channel_id"), parent.get("dm_id")) for parent in parents]
+    
+    async def _fetch_member_dms(self, workspace_id: str, user_id: str, dm_ids: Set[str]) -> Set[str]:
+        """Read which of dm_ids the user is one of the two members of."""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(DirectMessage.id).where(
+                    DirectMessage.id.in_(dm_ids),
+                    DirectMessage.workspace_id == workspace_id,
+                    or_(DirectMessage.user1_id == user_id, DirectMessage.user2_id == user_id)
+                )
+            )
+            return set(result.scalars().all())
+    
+    def unsubscribe_threads(self, websocket: WebSocket, thread_ids: List[str]):
+        """Stop viewing threads."""
+        connection = self.connections.get(websocket)
+        if connection is None or not connection.thread_subscriptions or not isinstance(thread_ids, list):
+            return
+        subscribed = connection.thread_subscriptions
+        thread_ids = [
+            thread_id for thread_id in thread_ids if isinstance(thread_id, str) and thread_id in subscribed
+        ]
+        subscribed.difference_update(thread_ids)
+        self._drop_thread_viewer(connection, thread_ids)
+    
+    def _drop_thread_viewer(self, connection: ConnectionState, thread_ids):
+        for thread_id in thread_ids:
+            viewers = self.thread_viewers.get(thread_id)
+            if viewers is not None:
+                viewers.discard(connection)
+                if not viewers:
+                    del self.thread_viewers[thread_id]
+    
+    async def _deliver_to_thread(
+        self,
+        workspace_id: str,
+        channel_id: Optional[str],
+        thread_id: str,
+        participant_ids: List[str],
+        message: Union[dict, Frame]
+    ):
+        """Send a thread event to the thread's participants and viewers only."""
+        connections = set(self.channel_index.connections_for_users(workspace_id, participant_ids))
+        connections.update(
+            connection for connection in self.thread_viewers.get(thread_id, ())
+            if connection.workspace_id == workspace_id
+        )
+        if channel_id:
+            # Viewers subscribe by id and participants may have left, so check channel membership
+            connections = [
+                connection for connection in connections
+                if self.channel_index.is_member(workspace_id, channel_id, connection.user_id) is not False
+            ]
+        await self._fan_out(connections, encode_frame(message))
+    
+    async def publish_event(
+        self,
+        event: dict,
+        channel_id: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        participant_ids: Optional[List[str]] = None
+    ):
+        """
+        Deliver an event to local sockets right away and publish it for other nodes.
+        
+        This is the single path for workspace events. The Redis payload is a small
+        routing header (workspace, type, channel, thread and its participants,
+        origin node, event id) followed by the encoded frame; listeners skip their
+        own events and drop ids they have already delivered.
+        
+        Args:
+            thread_id: Route to this thread's participants and viewers instead of the whole channel
+            participant_ids: The thread's participants, when thread_id is set
+        """
+        workspace_id = event.get("workspace_id")
+        if not workspace_id:
+            return
+        if channel_id is None:
+            channel_id = (event.get("data") or {}).get("channel_id")
+        event_type = event.get("type")
+        event_id = f"{self.node_id}:{next(self._event_counter)}"
+        self.recent_events.add(event_id)
+        
+        # Durable events get a workspace sequence number and go into the replay log
+        seq = None
+        if self.replay_log and event_type not in EPHEMERAL_EVENT_TYPES:
+            try:
+                seq = await self.replay_log.next_seq(workspace_id)
+                event["seq"] = seq
+            except Exception as e:
+                print(f"Error allocating event sequence: {e}")
+        frame = encode_frame(event)
+        
+        if thread_id is None:
+            participant_ids = None
+            # Thread events aren't part of the channel timeline the cache holds
+            self.message_cache.apply(event_type, channel_id, event.get("data") or {})
+        else:
+            participant_ids = participant_ids or []
+        await self._deliver(workspace_id, event_type, channel_id, frame, thread_id, participant_ids)
+        
         if self.redis:
-            await self.redis.publish("websocket_events", json.dumps(event))
+            header = {
+                "w": workspace_id,
+                "t": event_type,
+                "c": channel_id,
+                "s": seq,
+                "n": self.node_id,
+                "e": event_id
+            }
+            if thread_id is not None:
+                header["r"] = thread_id
+                header["p"] = participant_ids
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    if seq is not None:
+                        self.replay_log.append(pipe, workspace_id, seq, channel_id, frame.text, participant_ids)
+                    pipe.publish(self.pubsub_channel(workspace_id), f"{json.dumps(header)}\n{frame.text}")
+                    await pipe.execute()
+            except Exception as e:
+                print(f"Error publishing event: {e}")
+    
+    async def _deliver(
+        self,
+        workspace_id: str,
+        event_type: Optional[str],
+        channel_id: Optional[str],
+        message: Union[dict, Frame],
+        thread_id: Optional[str] = None,
+        participant_ids: Optional[List[str]] = None
+    ):
+        """Route an event to the local sockets that should see it."""
+        if event_type in (WSEventType.MEMBER_JOINED.value, WSEventType.MEMBER_LEFT.value):
+            await self._apply_member_event(workspace_id, message)
+        elif thread_id is not None:
+            await self._deliver_to_thread(workspace_id, channel_id, thread_id, participant_ids or [], message)
+        elif channel_id:
+            await self.broadcast_to_channel(workspace_id, channel_id, message)
+        else:
+            await self.broadcast_to_workspace(workspace_id, message)
     
     async def _redis_listener(self):
-        """Listen for events from Redis pub/sub."""
+        """Listen for events from the subscribed Redis pub/sub channels."""
         try:
-            async for message in self.pubsub.listen():
-                if message["type"] == "message":
-                    try:
-                        event = json.loads(message["data"])
-                        workspace_id = event.get("workspace_id")
-                        if workspace_id:
-                            await self.broadcast_to_workspace(workspace_id, event)
-                    except json.JSONDecodeError:
-                        pass
+            while True:
+                if not self.subscribed_channels:
+                    self._has_subscriptions.clear()
+                    await self._has_subscriptions.wait()
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and message["type"] == "message":
+                    await self._handle_published(message["data"])
         except asyncio.CancelledError:
             pass
         except Exception as e:
             print(f"Redis listener error: {e}")
     
+    async def _handle_published(self, payload: str):
+        try:
+            header_text, text = payload.split("\n", 1)
+            header = json.loads(header_text)
+        except ValueError:
+            return
+        
+        if header.get("n") == self.node_id:
+            # Already delivered locally by publish_event
+            return
+        event_id = header.get("e")
+        if event_id and not self.recent_events.add(event_id):
+            return
+        
+        workspace_id = header.get("w")
+        # With hashed shards the channel also carries workspaces we have no sockets for
+        if not workspace_id or workspace_id not in self.workspace_connections:
+            return
+        
+        # Forward the published text as-is instead of re-encoding it
+        event_type = header.get("t")
+        thread_id = header.get("r")
+        if thread_id is None:
+            self.message_cache.apply_published(event_type, header.get("c"), text)
+        await self._deliver(
+            workspace_id, event_type, header.get("c"), Frame(text, event_type, header.get("s")),
+            thread_id, header.get("p")
+        )
+    
     async def send_typing_indicator(self, workspace_id: str, channel_id: str, user_id: str, is_typing: bool):
-        """Send typing indicator to channel."""
-        message = {
-            "type": "typing.update",
-            "channel_id": channel_id,
-            "user_id": user_id,
-            "is_typing": is_typing,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        await self.broadcast_to_channel(workspace_id, channel_id, message)
+        """Record a typing indicator; the aggregator sends coalesced updates to the channel."""
+        self.typing.update(workspace_id, channel_id, user_id, is_typing)
+    
+    async def publish_reaction(self, event: dict, counts: Dict[str, int]):
+        """Publish a reaction delta; deltas for hot messages go out as periodic reaction.counts instead."""
+        await self.reactions.record(event, counts)
     
     async def send_presence_update(self, workspace_id: str, user_id: str, status: str):
-        """Send presence update to workspace."""
-        message = {
-            "type": "presence.updated",
-            "user_id": user_id,
-            "status": status,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        await self.broadcast_to_workspace(workspace_id, message)
+        """Queue a presence change; it goes out with the workspace's next presence.diff."""
+        self.presence.mark(workspace_id, user_id, status)
     
     def get_workspace_connection_count(self, workspace_id: str) -> int:
         """Get number of active connections for a workspace."""
-        return len(self.active_connections.get(workspace_id, set()))
+        return len(self.workspace_connections.get(workspace_id, ()))
 
 
 # Global connection manager instance
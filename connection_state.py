@@ -0,0 +1,41 @@
+from typing import Optional, Set
+from fastapi import WebSocket
+import sys
+import time
+
+from app.websocket.outbound import OutboundQueue
+
+
+class ConnectionState:
+    """
+    Everything the node keeps about one WebSocket connection.
+
+    One slotted record per socket replaces the per-socket entries that used to be
+    spread over several dicts; the manager's indexes (by socket, by workspace, by
+    channel, by heartbeat slot) all point at the same record. User and workspace
+    ids are interned so sockets of the same user or workspace share the strings.
+    """
+    __slots__ = (
+        "websocket",
+        "user_id",
+        "workspace_id",
+        "queue",
+        "thread_subscriptions",
+        "last_activity",
+        "frames_sent",
+        "frames_received",
+        "heartbeat_slot"
+    )
+
+    def __init__(self, websocket: WebSocket, user_id: str, workspace_id: str, queue: OutboundQueue):
+        self.websocket = websocket
+        self.user_id = sys.intern(user_id)
+        self.workspace_id = sys.intern(workspace_id)
+        self.queue = queue
+        # Threads the client views without participating in them; allocated on first use
+        self.thread_subscriptions: Optional[Set[str]] = None
+        # Monotonic time of the last frame received from the client
+        self.last_activity = time.monotonic()
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.heartbeat_slot = -1
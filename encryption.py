@@ -1,9 +1,30 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Hashable, List, Optional, Union
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
+import asyncio
 import base64
+import hashlib
+import os
+import struct
 from app.core.config import settings
+from app.core.workspace_keys import DataKey, workspace_keys
+
+# v2 envelope, stored as BSON binary:
+#   version (1 byte) | key id (4 bytes) | nonce (12 bytes) | AES-GCM ciphertext + tag
+# The 5-byte header is authenticated as associated data. The key id names either the global
+# key or a workspace data key (see WorkspaceKeys). v1 is base64 text of a Fernet token.
+ENVELOPE_V2 = 2
+ENVELOPE_HEADER = struct.Struct(">BI")
+NONCE_SIZE = 12
+
+Ciphertext = Union[str, bytes]
 
 
 class MessageEncryption:
@@ -11,34 +32,172 @@ class MessageEncryption:
     
     def __init__(self):
         # Derive a key from the encryption key setting
-        kdf = PBKDF2(
+        kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
             salt=b'forensic_messenger_salt',  # In production, use a random salt per workspace
             iterations=100000,
             backend=default_backend()
         )
-        key = base64.urlsafe_b64encode(kdf.derive(settings.ENCRYPTION_KEY.encode()))
-        self.cipher = Fernet(key)
+        master = kdf.derive(settings.ENCRYPTION_KEY.encode())
+        self.cipher = Fernet(base64.urlsafe_b64encode(master))
+        
+        # Separate AES-256-GCM key for v2 envelopes, named by a hash so stored messages say which key they need.
+        # Messages are written with workspace data keys unless WORKSPACE_KEYS_ENABLED is off.
+        aead_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"messages/v2").derive(master)
+        self.key_id = int.from_bytes(hashlib.sha256(aead_key).digest()[:4], "big")
+        self.global_key = DataKey(self.key_id, AESGCM(aead_key))
+        workspace_keys.reserved_ids.add(self.key_id)
+        # Format new ciphertexts are written in; 1 while nodes that can't read v2 are still running
+        self.write_version = settings.ENCRYPTION_WRITE_VERSION
+        self._executor = None
+        # (message id, version) -> plaintext, most recently used last
+        self._plaintexts: "OrderedDict[Hashable, str]" = OrderedDict()
+        self.cache_size = settings.DECRYPT_CACHE_SIZE
+    
+    async def data_key(self, workspace_id: Optional[str]) -> DataKey:
+        """The key new messages in a workspace are encrypted with."""
+        if not settings.WORKSPACE_KEYS_ENABLED or not workspace_id:
+            return self.global_key
+        return await workspace_keys.active(workspace_id)
     
-    def encrypt(self, plaintext: str) -> str:
-        """Encrypt a message."""
+    def encrypt(self, plaintext: str, version: Optional[int] = None, key: Optional[DataKey] = None) -> Ciphertext:
+        """
+        Encrypt a message.
+        
+        Args:
+            key: Key for a v2 envelope, from data_key(); the global key if omitted
+        
+        Returns:
+            A v2 envelope (bytes) or, when writing version 1, base64 Fernet text
+        """
         if not plaintext:
             return ""
+        if (version or self.write_version) >= ENVELOPE_V2:
+            key = key or self.global_key
+            nonce = os.urandom(NONCE_SIZE)
+            header = ENVELOPE_HEADER.pack(ENVELOPE_V2, key.key_id)
+            return header + nonce + key.aead.encrypt(nonce, plaintext.encode(), header)
         encrypted = self.cipher.encrypt(plaintext.encode())
         return base64.urlsafe_b64encode(encrypted).decode()
     
-    def decrypt(self, ciphertext: str) -> str:
-        """Decrypt a message."""
+    async def encrypt_batch(
+        self, plaintexts: List[str], version: Optional[int] = None, key: Optional[DataKey] = None
+    ) -> List[Ciphertext]:
+        """Encrypt many messages on the worker threads, keeping the event loop free."""
+        return await self._run_batch(partial(self.encrypt, version=version, key=key), plaintexts)
+    
+    async def _run_batch(self, func: Callable, values: list) -> list:
+        """Apply func to every value, split across the worker threads when there are enough of them."""
+        if len(values) <= settings.ENCRYPTION_INLINE_BATCH:
+            # Cheaper than a round trip through the pool
+            return [func(value) for value in values]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.ENCRYPTION_WORKERS, thread_name_prefix="encryption"
+            )
+        loop = asyncio.get_running_loop()
+        step = -(-len(values) // settings.ENCRYPTION_WORKERS)
+        parts = await asyncio.gather(*[
+            loop.run_in_executor(self._executor, _apply_all, func, values[i:i + step])
+            for i in range(0, len(values), step)
+        ])
+        return [result for part in parts for result in part]
+    
+    def decrypt(self, ciphertext: Ciphertext, keys: Optional[Dict[int, AESGCM]] = None) -> str:
+        """
+        Decrypt a message stored in either format.
+        
+        Args:
+            keys: Workspace keys from load_keys(); otherwise only keys already
+                in the workspace key cache can be used
+        """
         if not ciphertext:
             return ""
         try:
+            if isinstance(ciphertext, bytes):
+                return self._decrypt_v2(ciphertext, keys)
             decoded = base64.urlsafe_b64decode(ciphertext.encode())
             decrypted = self.cipher.decrypt(decoded)
             return decrypted.decode()
         except Exception as e:
             # Log the error in production
             raise ValueError(f"Failed to decrypt message: {str(e)}")
+    
+    def _decrypt_v2(self, envelope: bytes, keys: Optional[Dict[int, AESGCM]]) -> str:
+        version, key_id = ENVELOPE_HEADER.unpack_from(envelope)
+        if version != ENVELOPE_V2:
+            raise ValueError(f"unknown envelope version {version}")
+        if key_id == self.key_id:
+            aead = self.global_key.aead
+        else:
+            aead = (keys or {}).get(key_id) or workspace_keys.cached(key_id)
+        if aead is None:
+            raise ValueError(f"unknown key id {key_id}")
+        header_size = ENVELOPE_HEADER.size
+        nonce = envelope[header_size:header_size + NONCE_SIZE]
+        return aead.decrypt(nonce, envelope[header_size + NONCE_SIZE:], envelope[:header_size]).decode()
+    
+    @staticmethod
+    def is_legacy(ciphertext: Ciphertext) -> bool:
+        """Whether a stored ciphertext is in the v1 (base64 Fernet) format."""
+        return isinstance(ciphertext, str) and bool(ciphertext)
+    
+    @staticmethod
+    def key_id_of(ciphertext: Ciphertext) -> Optional[int]:
+        """Id of the key a v2 envelope was written with; None for v1 text and empty content."""
+        if isinstance(ciphertext, bytes) and len(ciphertext) >= ENVELOPE_HEADER.size:
+            return ENVELOPE_HEADER.unpack_from(ciphertext)[1]
+        return None
+    
+    async def load_keys(self, ciphertexts: List[Ciphertext]) -> Dict[int, AESGCM]:
+        """Unwrap the workspace keys a batch of envelopes needs (cached after the first use)."""
+        key_ids = {self.key_id_of(ciphertext) for ciphertext in ciphertexts} - {None, self.key_id}
+        if not key_ids:
+            return {}
+        return await workspace_keys.load(key_ids)
+    
+    async def decrypt_batch(
+        self, ciphertexts: List[Ciphertext], keys: Optional[List[Hashable]] = None
+    ) -> List[str]:
+        """
+        Decrypt a page of messages off the event loop.
+        
+        Args:
+            keys: Cache key per ciphertext, e.g. (message id, version); plaintexts
+                are kept in a bounded LRU under these so repeat reads skip decryption
+        
+        Returns:
+            Plaintexts in the same order as the ciphertexts
+        """
+        if keys is None:
+            loaded = await self.load_keys(ciphertexts)
+            return await self._run_batch(partial(self.decrypt, keys=loaded), ciphertexts)
+        
+        plaintexts: List[Optional[str]] = []
+        missing = []
+        for index, key in enumerate(keys):
+            plaintext = self._plaintexts.get(key)
+            if plaintext is not None:
+                self._plaintexts.move_to_end(key)
+            else:
+                missing.append(index)
+            plaintexts.append(plaintext)
+        
+        if missing:
+            pending = [ciphertexts[index] for index in missing]
+            loaded = await self.load_keys(pending)
+            decrypted = await self._run_batch(partial(self.decrypt, keys=loaded), pending)
+            for index, plaintext in zip(missing, decrypted):
+                plaintexts[index] = plaintext
+                self._plaintexts[keys[index]] = plaintext
+            while len(self._plaintexts) > self.cache_size:
+                self._plaintexts.popitem(last=False)
+        return plaintexts
+
+
+def _apply_all(func: Callable, values: list) -> list:
+    return [func(value) for value in values]
 
 
 # Global encryption instance
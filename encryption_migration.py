@@ -0,0 +1,267 @@
+from typing import Dict, Optional
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import time
+import uuid
+
+from app.core.config import settings
+from app.core.encryption import ENVELOPE_V2, encryption
+from app.core.workspace_keys import workspace_keys
+from app.db.mongodb import get_mongo_db
+
+CHECKPOINT_ID = "message_encryption_v2"
+KEY_ROTATION_CHECKPOINT_PREFIX = "workspace_key_rotation:"
+
+
+class EncryptionMigrator:
+    """
+    Background rewrite of message content that isn't under its workspace's current key.
+
+    Rewrites v1 (base64 Fernet text) into v2 envelopes, and v2 envelopes written
+    with another key (the global key, or a workspace key that has since been
+    rotated) under the workspace's active data key. Walks the messages
+    collection, or one workspace's messages, in _id order in batches of
+    ENCRYPTION_MIGRATION_BATCH, decrypting and re-encrypting on the encryption
+    worker pool and writing each batch with one unordered bulk_write. Progress
+    is checkpointed in the migrations collection after every batch, so the job
+    resumes where it stopped after a restart. The checkpoint document doubles as
+    a lease: only one node migrates at a time. Each update is conditional on the
+    content still being the ciphertext that was read, so a concurrent edit is
+    never overwritten; new writes already use the active key and are skipped. Start it only
+    once every node writes v2 (ENCRYPTION_WRITE_VERSION = 2), otherwise v1
+    documents written behind the checkpoint are left for a later run.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = settings.ENCRYPTION_MIGRATION_BATCH,
+        checkpoint_id: str = CHECKPOINT_ID,
+        workspace_id: Optional[str] = None
+    ):
+        self.batch_size = batch_size
+        self.checkpoint_id = checkpoint_id
+        self.workspace_id = workspace_id
+        self.pause = settings.ENCRYPTION_MIGRATION_PAUSE
+        self.lease = settings.ENCRYPTION_MIGRATION_LEASE
+        self.owner = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _acquire(self, db) -> Optional[dict]:
+        """Take or renew the lease. Returns the checkpoint, or None if another node holds it."""
+        now = datetime.utcnow()
+        try:
+            return await db.migrations.find_one_and_update(
+                {
+                    "_id": self.checkpoint_id,
+                    "completed_at": None,
+                    "$or": [{"owner": self.owner}, {"lease_until": {"$lt": now}}, {"owner": None}]
+                },
+                {
+                    "$set": {"owner": self.owner, "lease_until": now + timedelta(seconds=self.lease)},
+                    "$setOnInsert": {"last_id": None, "migrated": 0, "skipped": 0, "started_at": now}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The upsert loses when the lease is held or the job is done
+            return None
+
+    async def migrate_batch(self, db, checkpoint: dict) -> int:
+        """
+        Migrate the next batch after the checkpoint.
+
+        Returns:
+            Number of documents read; 0 once the collection is exhausted
+        """
+        query = {}
+        if self.workspace_id is not None:
+            query["workspace_id"] = self.workspace_id
+        if checkpoint.get("last_id") is not None:
+            query["_id"] = {"$gt": checkpoint["last_id"]}
+        cursor = db.messages.find(query, projection={"content": 1, "workspace_id": 1})
+        docs = await cursor.sort("_id", 1).limit(self.batch_size).to_list(length=self.batch_size)
+        if not docs:
+            return 0
+
+        keys = {}
+        for workspace_id in {doc.get("workspace_id") for doc in docs}:
+            keys[workspace_id] = await encryption.data_key(workspace_id)
+        stale = [
+            doc for doc in docs
+            if encryption.is_legacy(doc.get("content"))
+            or encryption.key_id_of(doc.get("content")) not in (None, keys[doc.get("workspace_id")].key_id)
+        ]
+        migrated = 0
+        if stale:
+            try:
+                plaintexts = await encryption.decrypt_batch([doc["content"] for doc in stale])
+            except ValueError:
+                # Don't let one undecryptable document stall the job; leave it as it is
+                stale = [doc for doc in stale if await self._decrypts(doc["content"])]
+                plaintexts = await encryption.decrypt_batch([doc["content"] for doc in stale])
+            # One encryption batch per target key
+            by_key: Dict[int, list] = {}
+            for doc, plaintext in zip(stale, plaintexts):
+                by_key.setdefault(keys[doc.get("workspace_id")].key_id, []).append((doc, plaintext))
+            operations = []
+            for pairs in by_key.values():
+                key = keys[pairs[0][0].get("workspace_id")]
+                envelopes = await encryption.encrypt_batch(
+                    [plaintext for _, plaintext in pairs], version=ENVELOPE_V2, key=key
+                )
+                operations += [
+                    UpdateOne({"_id": doc["_id"], "content": doc["content"]}, {"$set": {"content": envelope}})
+                    for (doc, _), envelope in zip(pairs, envelopes)
+                ]
+            if operations:
+                result = await db.messages.bulk_write(operations, ordered=False)
+                migrated = result.modified_count
+
+        checkpoint["last_id"] = docs[-1]["_id"]
+        checkpoint["migrated"] = checkpoint.get("migrated", 0) + migrated
+        checkpoint["skipped"] = checkpoint.get("skipped", 0) + len(docs) - migrated
+        await db.migrations.update_one(
+            {"_id": self.checkpoint_id, "owner": self.owner},
+            {"$set": {
+                "last_id": checkpoint["last_id"],
+                "migrated": checkpoint["migrated"],
+                "skipped": checkpoint["skipped"],
+                "updated_at": datetime.utcnow()
+            }}
+        )
+        return len(docs)
+
+    @staticmethod
+    async def _decrypts(ciphertext) -> bool:
+        try:
+            await encryption.decrypt_batch([ciphertext])
+            return True
+        except ValueError:
+            return False
+
+    async def run_once(self, max_seconds: Optional[float] = None) -> Optional[dict]:
+        """
+        Migrate until the collection is done (or max_seconds pass).
+
+        Returns:
+            The final checkpoint (completed_at is set once everything is migrated),
+            or None if another node holds the lease
+        """
+        db = get_mongo_db()
+        checkpoint = await self._acquire(db)
+        if checkpoint is None:
+            existing = await db.migrations.find_one({"_id": self.checkpoint_id})
+            return existing if existing and existing.get("completed_at") else None
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        renew_at = time.monotonic() + self.lease / 3
+        while True:
+            if not await self.migrate_batch(db, checkpoint):
+                checkpoint["completed_at"] = datetime.utcnow()
+                await db.migrations.update_one(
+                    {"_id": self.checkpoint_id, "owner": self.owner},
+                    {"$set": {"completed_at": checkpoint["completed_at"], "owner": None}}
+                )
+                return checkpoint
+            if deadline and time.monotonic() >= deadline:
+                return checkpoint
+            if time.monotonic() >= renew_at:
+                checkpoint = await self._acquire(db)
+                if checkpoint is None:
+                    return None
+                renew_at = time.monotonic() + self.lease / 3
+            await asyncio.sleep(self.pause)
+
+    async def _run(self):
+        try:
+            while True:
+                try:
+                    checkpoint = await self.run_once()
+                    if checkpoint is not None and checkpoint.get("completed_at"):
+                        print(f"✓ Message encryption migrated: {checkpoint['migrated']} documents rewritten")
+                        return
+                except Exception as e:
+                    print(f"Encryption migration error: {e}")
+                # Another node holds the lease (or the batch failed): check again later
+                await asyncio.sleep(self.lease)
+        except asyncio.CancelledError:
+            pass
+
+
+encryption_migrator = EncryptionMigrator()
+
+# workspace_id -> rotation running on this node
+_rotations: Dict[str, asyncio.Task] = {}
+
+
+async def rotate_workspace_key(workspace_id: str) -> dict:
+    """
+    Rotate one workspace's data key and re-encrypt its messages under the new key.
+
+    The new key is active at once on this node. After WORKSPACE_KEY_ACTIVE_TTL,
+    when no node is still writing with the old key, the workspace's messages
+    are rewritten batch by batch by an EncryptionMigrator with its own
+    checkpoint, then the old keys are marked retired. Other workspaces are
+    untouched. Calling it again while a rotation is unfinished (e.g. after a
+    restart) resumes that rotation instead of creating another key.
+
+    Returns:
+        The completed checkpoint
+    """
+    db = get_mongo_db()
+    checkpoint_id = f"{KEY_ROTATION_CHECKPOINT_PREFIX}{workspace_id}"
+    pending = await db.migrations.find_one({"_id": checkpoint_id, "completed_at": None})
+    if pending is None:
+        await workspace_keys.rotate(workspace_id)
+        await db.migrations.replace_one(
+            {"_id": checkpoint_id},
+            {
+                "owner": None,
+                "last_id": None,
+                "migrated": 0,
+                "skipped": 0,
+                "started_at": datetime.utcnow(),
+                "completed_at": None
+            },
+            upsert=True
+        )
+        await asyncio.sleep(settings.WORKSPACE_KEY_ACTIVE_TTL)
+
+    migrator = EncryptionMigrator(checkpoint_id=checkpoint_id, workspace_id=workspace_id)
+    while True:
+        checkpoint = await migrator.run_once()
+        if checkpoint is not None and checkpoint.get("completed_at"):
+            break
+        # Another node holds the lease: wait for it to finish or lapse
+        await asyncio.sleep(migrator.lease)
+    await workspace_keys.retire_previous(workspace_id)
+    return checkpoint
+
+
+def start_key_rotation(workspace_id: str) -> bool:
+    """Run rotate_workspace_key in the background. Returns False if it is already running on this node."""
+    if workspace_id in _rotations:
+        return False
+
+    async def run():
+        try:
+            checkpoint = await rotate_workspace_key(workspace_id)
+            print(f"✓ Workspace {workspace_id} key rotated: {checkpoint['migrated']} messages re-encrypted")
+        except Exception as e:
+            print(f"Workspace key rotation error: {e}")
+        finally:
+            _rotations.pop(workspace_id, None)
+
+    _rotations[workspace_id] = asyncio.create_task(run())
+    return True
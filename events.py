@@ -1,6 +1,7 @@
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime
+import json
 
 
 class WSEventType(str, Enum):
@@ -9,17 +10,21 @@ class WSEventType(str, Enum):
     MESSAGE_NEW = "message.new"
     MESSAGE_UPDATED = "message.updated"
     MESSAGE_DELETED = "message.deleted"
+    MESSAGE_BULK = "message.bulk"
     
     # Reactions
     REACTION_ADDED = "reaction.added"
     REACTION_REMOVED = "reaction.removed"
+    REACTION_COUNTS = "reaction.counts"
     
     # Typing
     TYPING_START = "typing.start"
     TYPING_STOP = "typing.stop"
+    TYPING_UPDATE = "typing.update"
     
     # Presence
     PRESENCE_UPDATED = "presence.updated"
+    PRESENCE_DIFF = "presence.diff"
     
     # Channels
     CHANNEL_CREATED = "channel.created"
@@ -36,16 +41,114 @@ class WSEventType(str, Enum):
     # System
     HEARTBEAT = "heartbeat"
     ERROR = "error"
+    SYNC_REQUIRED = "sync.required"
 
 
-def create_event(event_type: WSEventType, data: Dict[str, Any], workspace_id: str = None) -> Dict[str, Any]:
+# Stable integer codes used by the binary (msgpack) wire format. Never renumber.
+EVENT_TYPE_CODES = {
+    WSEventType.MESSAGE_NEW.value: 1,
+    WSEventType.MESSAGE_UPDATED.value: 2,
+    WSEventType.MESSAGE_DELETED.value: 3,
+    WSEventType.REACTION_ADDED.value: 4,
+    WSEventType.REACTION_REMOVED.value: 5,
+    WSEventType.TYPING_START.value: 6,
+    WSEventType.TYPING_STOP.value: 7,
+    WSEventType.TYPING_UPDATE.value: 8,
+    WSEventType.PRESENCE_UPDATED.value: 9,
+    WSEventType.PRESENCE_DIFF.value: 10,
+    WSEventType.CHANNEL_CREATED.value: 11,
+    WSEventType.CHANNEL_UPDATED.value: 12,
+    WSEventType.CHANNEL_DELETED.value: 13,
+    WSEventType.MEMBER_JOINED.value: 14,
+    WSEventType.MEMBER_LEFT.value: 15,
+    WSEventType.THREAD_UPDATED.value: 16,
+    WSEventType.HEARTBEAT.value: 17,
+    WSEventType.ERROR.value: 18,
+    WSEventType.SYNC_REQUIRED.value: 19,
+    WSEventType.MESSAGE_BULK.value: 20,
+    WSEventType.REACTION_COUNTS.value: 21,
+}
+
+# Event types that may be dropped first when a slow consumer's queue overflows
+EPHEMERAL_EVENT_TYPES = frozenset({
+    WSEventType.TYPING_START.value,
+    WSEventType.TYPING_STOP.value,
+    WSEventType.TYPING_UPDATE.value,
+    WSEventType.PRESENCE_UPDATED.value,
+    WSEventType.PRESENCE_DIFF.value,
+})
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_json(message: Dict[str, Any]) -> str:
+    """Encode an event dict the way it is sent on the wire."""
+    return json.dumps(message, default=_json_default, separators=(",", ":"), ensure_ascii=False)
+
+
+class Frame:
+    """An encoded WebSocket frame, shared by every recipient of an event."""
+    __slots__ = ("text", "event_type", "seq", "packed", "binary")
+    
+    def __init__(self, text: str, event_type: Optional[str] = None, seq: Optional[int] = None):
+        self.text = text
+        self.event_type = event_type
+        # Workspace sequence number, for events kept in the replay log
+        self.seq = seq
+        # Binary protocol encodings, filled in on first use (see app.websocket.protocol)
+        self.packed: Optional[bytes] = None
+        self.binary: Optional[bytes] = None
+
+
+class Event(dict):
+    """
+    A WebSocket event that encodes itself at most once.
+    
+    The encoded frame is cached on first use and reset if the event is modified,
+    so the same buffer can be handed to every connection in a broadcast.
+    """
+    __slots__ = ("_frame",)
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._frame: Optional[Frame] = None
+    
+    def __setitem__(self, key, value):
+        self._frame = None
+        super().__setitem__(key, value)
+    
+    def update(self, *args, **kwargs):
+        self._frame = None
+        super().update(*args, **kwargs)
+    
+    @property
+    def frame(self) -> Frame:
+        if self._frame is None:
+            self._frame = Frame(encode_json(self), self.get("type"), self.get("seq"))
+        return self._frame
+
+
+def encode_frame(message: Union[Frame, Dict[str, Any]]) -> Frame:
+    """Return the wire frame for an event, encoding plain dicts once."""
+    if isinstance(message, Frame):
+        return message
+    if isinstance(message, Event):
+        return message.frame
+    return Frame(encode_json(message), message.get("type"), message.get("seq"))
+
+
+def create_event(event_type: WSEventType, data: Dict[str, Any], workspace_id: str = None) -> Event:
     """Create a standardized WebSocket event."""
-    return {
-        "type": event_type.value,
-        "data": data,
-        "workspace_id": workspace_id,
-        "timestamp": datetime.utcnow().isoformat()
-    }
+    return Event(
+        type=event_type.value,
+        data=data,
+        workspace_id=workspace_id,
+        timestamp=datetime.utcnow().isoformat()
+    )
 
 
 def create_message_event(message: Dict[str, Any], workspace_id: str) -> Dict[str, Any]:
@@ -53,15 +156,108 @@ def create_message_event(message: Dict[str, Any], workspace_id: str) -> Dict[str
     return create_event(WSEventType.MESSAGE_NEW, message, workspace_id)
 
 
-def create_reaction_event(message_id: str, emoji: str, user_id: str, action: str, workspace_id: str) -> Dict[str, Any]:
-    """Create a reaction event."""
+def create_message_updated_event(
+    message_id: str, channel_id: Optional[str], changes: Dict[str, Any], version: int, workspace_id: str
+) -> Dict[str, Any]:
+    """Create a message edit delta carrying only the changed fields."""
+    return create_event(
+        WSEventType.MESSAGE_UPDATED,
+        {
+            "message_id": message_id,
+            "channel_id": channel_id,
+            "version": version,
+            **changes
+        },
+        workspace_id
+    )
+
+
+def create_message_deleted_event(
+    message_id: str, channel_id: Optional[str], deleted_at: datetime, version: int, workspace_id: str
+) -> Dict[str, Any]:
+    """Create a message delete delta."""
+    return create_event(
+        WSEventType.MESSAGE_DELETED,
+        {
+            "message_id": message_id,
+            "channel_id": channel_id,
+            "deleted_at": deleted_at,
+            "version": version
+        },
+        workspace_id
+    )
+
+
+def create_message_bulk_event(
+    channel_id: Optional[str],
+    dm_id: Optional[str],
+    count: int,
+    first_seq: Optional[int],
+    last_seq: Optional[int],
+    workspace_id: str
+) -> Dict[str, Any]:
+    """Create a summary of messages ingested in bulk; clients fetch the messages themselves."""
+    return create_event(
+        WSEventType.MESSAGE_BULK,
+        {
+            "channel_id": channel_id,
+            "dm_id": dm_id,
+            "count": count,
+            "first_seq": first_seq,
+            "last_seq": last_seq
+        },
+        workspace_id
+    )
+
+
+def create_reaction_event(
+    message_id: str,
+    emoji: str,
+    user_id: str,
+    action: str,
+    workspace_id: str,
+    channel_id: Optional[str] = None,
+    count: Optional[int] = None,
+    version: Optional[int] = None
+) -> Dict[str, Any]:
+    """Create a reaction delta: who reacted, the emoji's new count and the message version."""
     event_type = WSEventType.REACTION_ADDED if action == "add" else WSEventType.REACTION_REMOVED
     return create_event(
         event_type,
         {
             "message_id": message_id,
+            "channel_id": channel_id,
             "emoji": emoji,
-            "user_id": user_id
+            "user_id": user_id,
+            "count": count,
+            "version": version
+        },
+        workspace_id
+    )
+
+
+def create_reaction_counts_event(
+    message_id: str,
+    channel_id: Optional[str],
+    counts: Dict[str, int],
+    version: int,
+    workspace_id: str,
+    base_version: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Create a coalesced reaction update for a hot message: every emoji's count at a version.
+
+    base_version, when set, means every change after it up to version was a reaction
+    folded into these counts.
+    """
+    return create_event(
+        WSEventType.REACTION_COUNTS,
+        {
+            "message_id": message_id,
+            "channel_id": channel_id,
+            "counts": counts,
+            "version": version,
+            "base_version": base_version
         },
         workspace_id
     )
@@ -80,6 +276,22 @@ def create_typing_event(channel_id: str, user_id: str, is_typing: bool, workspac
     )
 
 
+def create_typing_update_event(
+    channel_id: str, typing: List[str], started: List[str], stopped: List[str], workspace_id: str
+) -> Dict[str, Any]:
+    """Create a consolidated typing update for one channel: everyone typing now, plus the changes."""
+    return create_event(
+        WSEventType.TYPING_UPDATE,
+        {
+            "channel_id": channel_id,
+            "typing": typing,
+            "started": started,
+            "stopped": stopped
+        },
+        workspace_id
+    )
+
+
 def create_presence_event(user_id: str, status: str, workspace_id: str) -> Dict[str, Any]:
     """Create a presence update event."""
     return create_event(
@@ -92,11 +304,21 @@ def create_presence_event(user_id: str, status: str, workspace_id: str) -> Dict[
     )
 
 
+def create_presence_diff_event(changes: Dict[str, List[str]], workspace_id: str) -> Dict[str, Any]:
+    """Create a batched presence update: user ids grouped by their new status."""
+    return create_event(WSEventType.PRESENCE_DIFF, changes, workspace_id)
+
+
 def create_channel_event(event_type: WSEventType, channel: Dict[str, Any], workspace_id: str) -> Dict[str, Any]:
     """Create a channel event."""
     return create_event(event_type, channel, workspace_id)
 
 
+def create_thread_updated_event(summary: Dict[str, Any], workspace_id: str) -> Dict[str, Any]:
+    """Create a thread summary update: reply count, participants and last reply time."""
+    return create_event(WSEventType.THREAD_UPDATED, summary, workspace_id)
+
+
 def create_error_event(error_message: str, error_code: str = None) -> Dict[str, Any]:
     """Create an error event."""
     return create_event(
@@ -106,3 +328,14 @@ def create_error_event(error_message: str, error_code: str = None) -> Dict[str,
             "code": error_code
         }
     )
+
+
+def create_sync_required_event(latest_seq: int, workspace_id: str) -> Dict[str, Any]:
+    """Tell a resuming client that its gap is no longer in the replay log."""
+    return create_event(
+        WSEventType.SYNC_REQUIRED,
+        {
+            "latest_seq": latest_seq
+        },
+        workspace_id
+    )
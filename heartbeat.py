@@ -0,0 +1,91 @@
+from typing import Awaitable, Callable, List, Optional, Set
+import asyncio
+import time
+
+from app.core.config import settings
+from app.websocket.connection_state import ConnectionState
+from app.websocket.events import Frame, WSEventType, create_event, encode_frame
+
+
+class HeartbeatWheel:
+    """
+    Server-driven heartbeats and idle-connection reaping with a single timer.
+
+    Connections are spread over a ring of slots. One task advances through the
+    ring so that each slot (and so each connection) is visited once per heartbeat
+    interval: live connections get the shared heartbeat frame and connections that
+    have been silent for longer than the idle timeout are reaped together. The
+    slot and last activity time live on each ConnectionState.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[ConnectionState, Frame], None],
+        reap: Callable[[List[ConnectionState]], Awaitable[None]],
+        interval: float = settings.WS_HEARTBEAT_INTERVAL,
+        idle_timeout: float = settings.WS_IDLE_TIMEOUT,
+        slots: int = settings.WS_HEARTBEAT_SLOTS
+    ):
+        self.send = send
+        self.reap = reap
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self._slots: List[Set[ConnectionState]] = [set() for _ in range(max(1, slots))]
+        self._next_slot = 0
+        self._cursor = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the wheel."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def add(self, connection: ConnectionState):
+        """Start tracking a connection."""
+        slot = self._next_slot
+        self._next_slot = (self._next_slot + 1) % len(self._slots)
+        self._slots[slot].add(connection)
+        connection.heartbeat_slot = slot
+
+    def remove(self, connection: ConnectionState):
+        """Stop tracking a connection."""
+        if connection.heartbeat_slot >= 0:
+            self._slots[connection.heartbeat_slot].discard(connection)
+            connection.heartbeat_slot = -1
+
+    async def tick(self):
+        """Visit the next slot: heartbeat the live connections and reap the idle ones."""
+        slot = self._slots[self._cursor]
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        if not slot:
+            return
+
+        now = time.monotonic()
+        # One encoded heartbeat shared by the whole slot
+        frame = encode_frame(create_event(WSEventType.HEARTBEAT, {}))
+        idle = []
+        for connection in slot:
+            if now - connection.last_activity >= self.idle_timeout:
+                idle.append(connection)
+            else:
+                self.send(connection, frame)
+
+        if idle:
+            await self.reap(idle)
+
+    async def _run(self):
+        tick_interval = self.interval / len(self._slots)
+        try:
+            while True:
+                await asyncio.sleep(tick_interval)
+                try:
+                    await self.tick()
+                except Exception as e:
+                    print(f"Heartbeat error: {e}")
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,77 @@
+from typing import Dict, Tuple
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+import base64
+import json
+import os
+
+from app.core.config import settings
+
+NONCE_SIZE = 12
+# Name of the master key derived from ENCRYPTION_KEY when no key file is configured
+SETTINGS_KEY_ID = "settings"
+
+
+class LocalFileKMS:
+    """
+    Local stand-in for a key management service: wraps and unwraps data keys with a master key.
+
+    Master keys are read from the JSON file at KMS_MASTER_KEY_FILE:
+
+        {"active": "2024-06", "keys": {"2024-05": "<base64 32 bytes>", "2024-06": "<base64 32 bytes>"}}
+
+    New data keys are wrapped with the active master key; every key in the
+    file can still unwrap, so the master key is rotated by adding a key and
+    marking it active. A master key derived from ENCRYPTION_KEY is used when
+    there is no file, and stays available for unwrapping once there is. The
+    interface is async like a real KMS client, and wrapping binds the data key
+    to its workspace the way a KMS encryption context does.
+    """
+
+    def __init__(self, path: str = settings.KMS_MASTER_KEY_FILE):
+        self.path = path
+        self._masters: Dict[str, AESGCM] = {}
+        self.active_key_id = None
+
+    def _load(self):
+        if self._masters:
+            return
+        # Always able to unwrap keys wrapped before a key file was configured
+        material = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"kms/master").derive(
+            settings.ENCRYPTION_KEY.encode()
+        )
+        self._masters = {SETTINGS_KEY_ID: AESGCM(material)}
+        self.active_key_id = SETTINGS_KEY_ID
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                config = json.load(f)
+            self._masters.update({
+                key_id: AESGCM(base64.b64decode(material)) for key_id, material in config["keys"].items()
+            })
+            self.active_key_id = config["active"]
+            if self.active_key_id not in self._masters:
+                raise ValueError(f"Active master key {self.active_key_id} is not in {self.path}")
+
+    async def wrap(self, key: bytes, context: str) -> Tuple[str, bytes]:
+        """
+        Wrap a data key with the active master key.
+
+        Returns:
+            (master key id, wrapped key)
+        """
+        self._load()
+        nonce = os.urandom(NONCE_SIZE)
+        wrapped = nonce + self._masters[self.active_key_id].encrypt(nonce, key, context.encode())
+        return self.active_key_id, wrapped
+
+    async def unwrap(self, master_key_id: str, wrapped: bytes, context: str) -> bytes:
+        """Unwrap a data key; the context must match the one it was wrapped with."""
+        self._load()
+        master = self._masters.get(master_key_id)
+        if master is None:
+            raise ValueError(f"Unknown master key {master_key_id}")
+        return master.decrypt(wrapped[:NONCE_SIZE], wrapped[NONCE_SIZE:], context.encode())
+
+
+kms = LocalFileKMS()
@@ -1,16 +1,23 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+from typing import Optional
 from prometheus_client import make_asgi_app
 import uvicorn
 
 from app.core.config import settings
+from app.core.encryption_migration import encryption_migrator
+from app.core.principal_cache import Principal, authenticate_websocket, principal_cache
+from app.core.read_markers import read_markers
 from app.db.postgresql import init_db
 from app.db.mongodb import init_mongodb
 from app.db.redis import init_redis, RedisClient
 from app.db.elasticsearch import init_elasticsearch, ElasticsearchClient
+from app.websocket.admission import admission, reject
 from app.websocket.connection_manager import manager
+from app.websocket.events import create_error_event
+from app.websocket.protocol import negotiate, receive_event
 from app.api.v1.api import api_router
 
 
@@ -26,6 +33,10 @@ async def lifespan(app: FastAPI):
         await init_mongodb()
         await init_redis()
         await init_elasticsearch()
+        principal_cache.redis = RedisClient.get_client()
+        read_markers.start(RedisClient.get_client())
+        if settings.ENCRYPTION_MIGRATION_ENABLED and settings.ENCRYPTION_WRITE_VERSION >= 2:
+            encryption_migrator.start()
         
         # Initialize WebSocket manager
         await manager.initialize()
@@ -37,6 +48,9 @@ async def lifespan(app: FastAPI):
     finally:
         # Shutdown
         print("🛑 Shutting down...")
+        await manager.presence.stop()
+        await read_markers.stop()
+        await encryption_migrator.stop()
         await RedisClient.close()
         await ElasticsearchClient.close()
         print("✅ Cleanup complete")
@@ -84,19 +98,51 @@ async def health_check():
     return {"status": "healthy"}
 
 
+async def _authenticate(websocket: WebSocket, token: Optional[str], workspace_id: str) -> Optional[Principal]:
+    """Resolve the connecting user, closing the handshake if that fails."""
+    try:
+        principal = await authenticate_websocket(token, workspace_id)
+    except Exception as e:
+        print(f"WebSocket auth error: {e}")
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        return None
+    if principal is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+    return principal
+
+
 @app.websocket("/ws/{workspace_id}")
-async def websocket_endpoint(websocket: WebSocket, workspace_id: str, token: str = None):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    workspace_id: str,
+    token: str = None,
+    batch: bool = False,
+    resume_from: Optional[int] = None
+):
     """WebSocket endpoint for real-time communication."""
-    # In production, validate token and extract user_id
-    # For now, accept the connection
-    user_id = "demo_user"  # Extract from token in production
+    codec, subprotocol = negotiate(websocket)
+    retry_after = await admission.admit()
+    if retry_after is not None:
+        await reject(websocket, retry_after, subprotocol)
+        return
     
-    await manager.connect(websocket, workspace_id, user_id)
+    try:
+        principal = await _authenticate(websocket, token, workspace_id)
+        if principal is None:
+            return
+        user_id = principal.user_id
+        await manager.connect(
+            websocket, workspace_id, user_id,
+            batch=batch, resume_from=resume_from, codec=codec, subprotocol=subprotocol
+        )
+    finally:
+        admission.release()
     
     try:
         while True:
             # Receive message from client
-            data = await websocket.receive_json()
+            data = await receive_event(websocket, codec)
+            manager.touch(websocket)
             
             # Handle different message types
             msg_type = data.get("type")
@@ -107,7 +153,20 @@ async def websocket_endpoint(websocket: WebSocket, workspace_id: str, token: str
             elif msg_type == "typing":
                 channel_id = data.get("channel_id")
                 is_typing = data.get("is_typing", True)
-                await manager.send_typing_indicator(workspace_id, channel_id, user_id, is_typing)
+                if channel_id:
+                    await manager.send_typing_indicator(workspace_id, channel_id, user_id, is_typing)
+            
+            elif msg_type == "subscribe":
+                # View threads without participating in them
+                try:
+                    await manager.subscribe_threads(websocket, data.get("thread_ids"))
+                except ValueError as e:
+                    await manager.send_personal_message(
+                        create_error_event(str(e), "INVALID_SUBSCRIPTION"), websocket
+                    )
+            
+            elif msg_type == "unsubscribe":
+                manager.unsubscribe_threads(websocket, data.get("thread_ids") or [])
             
             else:
                 # Echo back for now (in production, process and broadcast)
@@ -125,5 +184,6 @@ if __name__ == "__main__":
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=settings.DEBUG
+        reload=settings.DEBUG,
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE
     )
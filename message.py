@@ -1,16 +1,19 @@
 # MongoDB schemas (document structure)
 # These are not SQLAlchemy models but Python dataclasses for type hints
 
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 from datetime import datetime
 from pydantic import BaseModel, Field
+from pydantic_core import core_schema
 from bson import ObjectId
 
 
 class PyObjectId(ObjectId):
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls.validate, serialization=core_schema.to_string_ser_schema()
+        )
 
     @classmethod
     def validate(cls, v):
@@ -19,8 +22,8 @@ class PyObjectId(ObjectId):
         return ObjectId(v)
 
     @classmethod
-    def __modify_schema__(cls, field_schema):
-        field_schema.update(type="string")
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
 
 
 class Reaction(BaseModel):
@@ -44,13 +47,16 @@ class Message(BaseModel):
     channel_id: Optional[str] = None
     dm_id: Optional[str] = None
     user_id: str
-    content: str  # Encrypted content
+    content: Union[str, bytes]  # Encrypted: binary v2 envelope, or base64 Fernet text (v1)
     thread_id: Optional[str] = None
     parent_message_id: Optional[str] = None
     attachments: List[Attachment] = []
     reactions: List[Reaction] = []
     is_edited: bool = False
     is_deleted: bool = False
+    version: int = 1  # Bumped on every edit, delete and reaction change
+    channel_seq: Optional[int] = None  # Position in the channel, used for unread counts
+    mentions: List[str] = []  # Mentioned user ids
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = None
     deleted_at: Optional[datetime] = None
@@ -0,0 +1,347 @@
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from collections import OrderedDict
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from prometheus_client import Counter, Gauge
+import json
+import time
+
+from app.core.config import settings
+from app.websocket.events import WSEventType
+
+CACHE_REQUESTS = Counter(
+    "message_cache_requests_total",
+    "First-page history reads by cache result",
+    ["result"]
+)
+CACHE_EVICTIONS = Counter(
+    "message_cache_evictions_total",
+    "Channels dropped from the message cache",
+    ["reason"]
+)
+CACHE_BYTES = Gauge(
+    "message_cache_bytes",
+    "Estimated size of the cached messages"
+)
+CACHE_CHANNELS = Gauge(
+    "message_cache_channels",
+    "Channels held in the message cache"
+)
+
+# Fields kept for each cached message, i.e. what a history page returns
+CACHED_FIELDS = (
+    "_id", "id", "workspace_id", "channel_id", "dm_id", "user_id", "content", "thread_id", "attachments",
+    "reactions", "is_edited", "is_deleted", "version", "channel_seq", "created_at"
+)
+
+# Events that change cached messages
+MESSAGE_EVENT_TYPES = frozenset({
+    WSEventType.MESSAGE_NEW.value,
+    WSEventType.MESSAGE_UPDATED.value,
+    WSEventType.MESSAGE_DELETED.value,
+    WSEventType.MESSAGE_BULK.value,
+    WSEventType.REACTION_ADDED.value,
+    WSEventType.REACTION_REMOVED.value,
+    WSEventType.REACTION_COUNTS.value,
+})
+
+
+def _sort_key(message: dict):
+    return (message["created_at"], message["_id"])
+
+
+def _copy_reactions(reactions) -> List[dict]:
+    # Reactions are updated in place, so don't share them with the caller
+    return [dict(reaction, user_ids=list(reaction.get("user_ids") or ())) for reaction in reactions or ()]
+
+
+def _cached_copy(message: dict) -> dict:
+    copy = {field: message[field] for field in CACHED_FIELDS if field in message}
+    copy["reactions"] = _copy_reactions(copy.get("reactions"))
+    return copy
+
+
+def _estimate_size(message: dict) -> int:
+    """Rough resident size of a cached message: fixed overhead plus its variable parts."""
+    size = 600 + len(message.get("content") or "")
+    size += 300 * len(message.get("attachments") or ())
+    for reaction in message.get("reactions") or ():
+        size += 120 + 60 * len(reaction.get("user_ids") or ())
+    return size
+
+
+class _ChannelEntry:
+    __slots__ = ("workspace_id", "messages", "has_more", "size", "expires", "stale_reactions")
+
+    def __init__(self, workspace_id: str, messages: List[dict], has_more: bool, expires: float):
+        self.workspace_id = workspace_id
+        # Newest first, like a history page
+        self.messages = messages
+        # Whether the channel has messages older than the cached ones
+        self.has_more = has_more
+        self.size = sum(_estimate_size(message) for message in messages)
+        self.expires = expires
+        # Ids of messages whose counts are current but whose reaction user lists aren't
+        self.stale_reactions: Set[str] = set()
+
+
+class MessageCache:
+    """
+    Node-local cache of the newest messages of busy channels, decrypted.
+
+    Holds up to MESSAGE_CACHE_CHANNEL_MESSAGES messages per channel and answers
+    first-page history reads. Entries are evicted least recently used first,
+    by channel count and by an estimated memory budget.
+
+    A channel is only cached while this node has sockets in its workspace, i.e.
+    while it is subscribed to the workspace's events: every message, edit,
+    delete and reaction, from this node or any other, passes through apply() and
+    is written into the cached copy. Versions make the deltas idempotent, and a
+    delta that skips a version evicts the channel rather than risk losing the
+    skipped change when it arrives late. A fill
+    that raced with a change is discarded, and entries expire after
+    MESSAGE_CACHE_TTL in case a pub/sub message was lost.
+
+    Coalesced reaction.counts events say how many reacted but not who, so they
+    update the counts and mark the message's user lists stale; readers reload
+    just those lists with refresh_reactions() instead of refilling the channel.
+    """
+
+    def __init__(self, is_subscribed: Callable[[str], bool]):
+        self.is_subscribed = is_subscribed
+        self.channel_messages = settings.MESSAGE_CACHE_CHANNEL_MESSAGES
+        self.max_channels = settings.MESSAGE_CACHE_MAX_CHANNELS
+        self.max_bytes = settings.MESSAGE_CACHE_MAX_BYTES
+        self.ttl = settings.MESSAGE_CACHE_TTL
+        self._entries: "OrderedDict[str, _ChannelEntry]" = OrderedDict()
+        self._workspace_channels: Dict[str, Set[str]] = {}
+        # channel_id -> token of the fill in progress; cleared by any change to the channel
+        self._fills: Dict[str, object] = {}
+        self._bytes = 0
+
+    def get(self, workspace_id: str, channel_id: str, limit: int) -> Optional[Tuple[List[dict], bool]]:
+        """
+        Serve a first page of history from the cache.
+
+        Returns:
+            (newest messages first, whether older ones exist), or None on a miss
+        """
+        if limit > self.channel_messages or not self.is_subscribed(workspace_id):
+            CACHE_REQUESTS.labels("bypass").inc()
+            return None
+        entry = self._entries.get(channel_id)
+        if entry is None or entry.workspace_id != workspace_id:
+            CACHE_REQUESTS.labels("miss").inc()
+            return None
+        if entry.expires <= time.monotonic():
+            self._drop(channel_id, "expired")
+            CACHE_REQUESTS.labels("miss").inc()
+            return None
+        self._entries.move_to_end(channel_id)
+        CACHE_REQUESTS.labels("hit").inc()
+        return entry.messages[:limit], entry.has_more or len(entry.messages) > limit
+
+    def begin_fill(self, workspace_id: str, channel_id: str) -> Optional[object]:
+        """Start a fill before reading MongoDB. Returns a token for fill(), or None if not cacheable."""
+        if not self.is_subscribed(workspace_id):
+            return None
+        token = object()
+        self._fills[channel_id] = token
+        return token
+
+    def fill(
+        self, token: Optional[object], workspace_id: str, channel_id: str, messages: List[dict], has_more: bool
+    ):
+        """Cache a channel's newest messages (decrypted, newest first) unless it changed since begin_fill."""
+        if token is None or self._fills.get(channel_id) is not token:
+            return
+        del self._fills[channel_id]
+        if not self.is_subscribed(workspace_id):
+            return
+        kept = [_cached_copy(message) for message in messages[:self.channel_messages]]
+        has_more = has_more or len(messages) > self.channel_messages
+        self._drop(channel_id, None)
+        entry = _ChannelEntry(workspace_id, kept, has_more, time.monotonic() + self.ttl)
+        self._entries[channel_id] = entry
+        self._workspace_channels.setdefault(workspace_id, set()).add(channel_id)
+        self._bytes += entry.size
+        self._evict()
+        self._update_gauges()
+
+    def apply(self, event_type: Optional[str], channel_id: Optional[str], data: dict):
+        """Write a message event into the cached copy of its channel."""
+        if not channel_id or event_type not in MESSAGE_EVENT_TYPES:
+            return
+        # Any change makes a fill that read MongoDB before it stale
+        self._fills.pop(channel_id, None)
+        entry = self._entries.get(channel_id)
+        if entry is None:
+            return
+        try:
+            if event_type == WSEventType.MESSAGE_NEW.value:
+                self._add_message(entry, data)
+            elif event_type == WSEventType.MESSAGE_BULK.value:
+                self._drop(channel_id, "invalidated")
+            else:
+                self._update_message(channel_id, entry, event_type, data)
+        except (KeyError, TypeError, ValueError, InvalidId):
+            self._drop(channel_id, "invalidated")
+        self._update_gauges()
+
+    def apply_published(self, event_type: Optional[str], channel_id: Optional[str], text: str):
+        """apply() for an event published by another node; only parsed if the channel is cached."""
+        if not channel_id or event_type not in MESSAGE_EVENT_TYPES:
+            return
+        if channel_id not in self._entries:
+            self._fills.pop(channel_id, None)
+            return
+        try:
+            data = json.loads(text).get("data") or {}
+        except ValueError:
+            self._drop(channel_id, "invalidated")
+            return
+        self.apply(event_type, channel_id, data)
+
+    def stale_reactions(self, channel_id: str, messages: List[dict]) -> List[str]:
+        """Ids of the given cached messages whose reaction user lists need reloading."""
+        entry = self._entries.get(channel_id)
+        if entry is None or not entry.stale_reactions:
+            return []
+        return [message["id"] for message in messages if message["id"] in entry.stale_reactions]
+
+    def refresh_reactions(self, channel_id: str, docs: List[dict]):
+        """Replace stale reactions with ones read from MongoDB (documents with _id, reactions, version)."""
+        entry = self._entries.get(channel_id)
+        if entry is None:
+            return
+        stale = {message["id"]: message for message in entry.messages if message["id"] in entry.stale_reactions}
+        for doc in docs:
+            message = stale.get(str(doc["_id"]))
+            if message is None or doc.get("version") != message.get("version"):
+                # A change landed between the read and the events we've seen; the next reader tries again
+                continue
+            before = _estimate_size(message)
+            message["reactions"] = _copy_reactions(doc.get("reactions"))
+            message["version"] = doc.get("version")
+            entry.stale_reactions.discard(message["id"])
+            self._resize(entry, _estimate_size(message) - before)
+
+    def drop_workspace(self, workspace_id: str):
+        """Forget a workspace's channels, e.g. once the node stops following its events."""
+        for channel_id in list(self._workspace_channels.get(workspace_id, ())):
+            self._drop(channel_id, "unsubscribed")
+        self._update_gauges()
+
+    def _add_message(self, entry: _ChannelEntry, data: dict):
+        message = _cached_copy(data)
+        message["_id"] = ObjectId(message.get("_id") or message["id"])
+        message["id"] = str(message["_id"])
+        if isinstance(message["created_at"], str):
+            message["created_at"] = datetime.fromisoformat(message["created_at"])
+        if any(cached["_id"] == message["_id"] for cached in entry.messages):
+            return
+
+        messages = entry.messages
+        key = _sort_key(message)
+        if entry.has_more and messages and key < _sort_key(messages[-1]):
+            # Older than everything cached: it belongs to history we don't hold
+            return
+        position = 0
+        while position < len(messages) and _sort_key(messages[position]) > key:
+            position += 1
+        messages.insert(position, message)
+        self._resize(entry, _estimate_size(message))
+        while len(messages) > self.channel_messages:
+            self._resize(entry, -_estimate_size(messages.pop()))
+            entry.has_more = True
+        self._evict()
+
+    def _update_message(self, channel_id: str, entry: _ChannelEntry, event_type: str, data: dict):
+        message_id = data["message_id"]
+        message = next((cached for cached in entry.messages if cached["id"] == message_id), None)
+        if message is None:
+            return
+        version = data.get("version")
+        if version is None:
+            # Can't order a delta without a version
+            self._drop(channel_id, "invalidated")
+            return
+        cached_version = message.get("version") or 0
+        if version <= cached_version:
+            return
+        if version > cached_version + 1:
+            # Counts may skip the reactions they fold in; any other skipped change
+            # could still arrive and would then be ignored as stale
+            base_version = data.get("base_version") if event_type == WSEventType.REACTION_COUNTS.value else None
+            if base_version is None or cached_version < base_version:
+                self._drop(channel_id, "invalidated")
+                return
+
+        before = _estimate_size(message)
+        if event_type == WSEventType.REACTION_COUNTS.value:
+            self._apply_counts(message, data["counts"])
+            entry.stale_reactions.add(message["id"])
+        elif event_type == WSEventType.MESSAGE_UPDATED.value:
+            for field in ("content", "is_edited"):
+                if field in data:
+                    message[field] = data[field]
+        elif event_type == WSEventType.MESSAGE_DELETED.value:
+            message["is_deleted"] = True
+        else:
+            self._apply_reaction(message, event_type, data)
+        message["version"] = version
+        self._resize(entry, _estimate_size(message) - before)
+
+    @staticmethod
+    def _apply_reaction(message: dict, event_type: str, data: dict):
+        reactions = message["reactions"]
+        reaction = next((item for item in reactions if item["emoji"] == data["emoji"]), None)
+        if event_type == WSEventType.REACTION_ADDED.value:
+            if reaction is None:
+                reaction = {"emoji": data["emoji"], "user_ids": [], "count": 0}
+                reactions.append(reaction)
+            if data["user_id"] not in reaction["user_ids"]:
+                reaction["user_ids"].append(data["user_id"])
+        elif reaction is not None and data["user_id"] in reaction["user_ids"]:
+            reaction["user_ids"].remove(data["user_id"])
+        if reaction is not None:
+            count = data.get("count")
+            reaction["count"] = count if count is not None else len(reaction["user_ids"])
+            if reaction["count"] <= 0:
+                reactions.remove(reaction)
+
+    @staticmethod
+    def _apply_counts(message: dict, counts: Dict[str, int]):
+        """Set every emoji's count; user lists are kept as they were and are now only partial."""
+        known = {reaction["emoji"]: reaction for reaction in message["reactions"]}
+        message["reactions"] = [
+            dict(known.get(emoji) or {"emoji": emoji, "user_ids": []}, count=count)
+            for emoji, count in counts.items() if count > 0
+        ]
+
+    def _resize(self, entry: _ChannelEntry, delta: int):
+        entry.size += delta
+        self._bytes += delta
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_channels or self._bytes > self.max_bytes):
+            channel_id = next(iter(self._entries))
+            self._drop(channel_id, "capacity")
+
+    def _drop(self, channel_id: str, reason: Optional[str]):
+        entry = self._entries.pop(channel_id, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        channels = self._workspace_channels.get(entry.workspace_id)
+        if channels is not None:
+            channels.discard(channel_id)
+            if not channels:
+                del self._workspace_channels[entry.workspace_id]
+        if reason:
+            CACHE_EVICTIONS.labels(reason).inc()
+
+    def _update_gauges(self):
+        CACHE_BYTES.set(self._bytes)
+        CACHE_CHANNELS.set(len(self._entries))
@@ -1,16 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel, Field, ValidationError
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import json
 
-from app.db.mongodb import get_mongo_db
+from app.db.mongodb import get_mongo_db, MESSAGE_CHANNEL_HISTORY_INDEX, MESSAGE_DM_HISTORY_INDEX
+from app.db.postgresql import get_db
 from app.models.user import User
+from app.models.channel import Channel, ChannelMember, DirectMessage
 from app.models.message import Message, Reaction, Attachment
+from app.core.config import settings
 from app.core.encryption import encryption
+from app.core.read_markers import read_markers
 from app.api.v1.endpoints.auth import get_current_user
 from app.websocket.connection_manager import manager
-from app.websocket.events import create_message_event
+from app.websocket.events import (
+    create_message_bulk_event,
+    create_message_deleted_event,
+    create_message_event,
+    create_message_updated_event,
+    create_reaction_event,
+    create_thread_updated_event
+)
 
 router = APIRouter()
 
@@ -20,6 +38,26 @@ class MessageCreate(BaseModel):
     content: str
     thread_id: Optional[str] = None
     attachments: List[Attachment] = []
+    mentions: List[str] = []
+
+class BulkMessageCreate(MessageCreate):
+    created_at: Optional[datetime] = None  # Original timestamp, for imported history
+
+class BulkIngestError(BaseModel):
+    index: int
+    error: str
+
+class BulkIngestResponse(BaseModel):
+    inserted: int
+    failed: List[BulkIngestError]
+    channels: Dict[str, int]
+    truncated: bool = False
+
+class MessageUpdate(BaseModel):
+    content: str
+
+class ReactionCreate(BaseModel):
+    emoji: str = Field(..., min_length=1, max_length=64)
 
 class MessageResponse(BaseModel):
     id: str
@@ -31,11 +69,133 @@ class MessageResponse(BaseModel):
     thread_id: Optional[str]
     attachments: List[Attachment]
     reactions: List[Reaction]
+    is_edited: bool = False
+    is_deleted: bool = False
+    version: int = 0  # 0 for messages written before versioning
+    channel_seq: Optional[int] = None
     created_at: datetime
     
     class Config:
         from_attributes = True
 
+class ReplyCreate(BaseModel):
+    content: str
+    attachments: List[Attachment] = []
+    mentions: List[str] = []
+
+class ThreadSummary(BaseModel):
+    parent_message_id: str
+    channel_id: Optional[str] = None
+    dm_id: Optional[str] = None
+    reply_count: int = 0
+    participant_ids: List[str] = []  # The parent's author first, then repliers
+    last_reply_at: Optional[datetime] = None
+
+class ReplyPage(BaseModel):
+    messages: List[MessageResponse]  # Oldest first
+    after: Optional[str] = None
+    has_more: bool = False
+
+# Fields of a parent message that its thread inherits
+THREAD_PARENT_PROJECTION = {"workspace_id": 1, "channel_id": 1, "dm_id": 1, "user_id": 1, "thread_id": 1}
+THREAD_SUMMARY_PROJECTION = {
+    "parent_message_id": 1, "channel_id": 1, "dm_id": 1, "reply_count": 1, "participant_ids": 1, "last_reply_at": 1
+}
+
+async def _thread_parents(parent_ids: List[str], workspace_id: str) -> Dict[str, dict]:
+    """Load the messages replies go under. Missing, deleted and reply messages are left out."""
+    oids = [ObjectId(parent_id) for parent_id in parent_ids if ObjectId.is_valid(parent_id)]
+    if not oids:
+        return {}
+    db = get_mongo_db()
+    parents = await db.messages.find(
+        {"_id": {"$in": oids}, "workspace_id": workspace_id, "is_deleted": {"$ne": True}},
+        projection=THREAD_PARENT_PROJECTION
+    ).to_list(length=None)
+    # Threads are one level deep
+    return {str(parent["_id"]): parent for parent in parents if not parent.get("thread_id")}
+
+async def _thread_parent(parent_id: str, workspace_id: str) -> dict:
+    parent = (await _thread_parents([parent_id], workspace_id)).get(parent_id)
+    if not parent:
+        raise HTTPException(status_code=404, detail="Parent message not found")
+    return parent
+
+def _thread_summary(thread: dict) -> dict:
+    return {
+        "parent_message_id": thread["parent_message_id"],
+        "channel_id": thread.get("channel_id"),
+        "dm_id": thread.get("dm_id"),
+        "reply_count": thread.get("reply_count", 0),
+        "participant_ids": thread.get("participant_ids", []),
+        "last_reply_at": thread.get("last_reply_at")
+    }
+
+def _thread_route(thread: dict) -> dict:
+    """publish_event routing for a thread's events: its participants and viewers, not the whole channel."""
+    return {
+        "channel_id": thread.get("channel_id"),
+        "thread_id": thread["parent_message_id"],
+        "participant_ids": thread.get("participant_ids", [])
+    }
+
+async def _reply_route(reply: dict) -> dict:
+    """publish_event routing for a change to an existing reply."""
+    db = get_mongo_db()
+    thread = await db.threads.find_one({"_id": ObjectId(reply["thread_id"])}, projection={"participant_ids": 1})
+    return {
+        "channel_id": reply.get("channel_id"),
+        "thread_id": reply["thread_id"],
+        "participant_ids": (thread or {}).get("participant_ids", [])
+    }
+
+async def _publish_thread_updated(thread: dict, workspace_id: str):
+    await manager.publish_event(
+        create_thread_updated_event(_thread_summary(thread), workspace_id), **_thread_route(thread)
+    )
+
+async def _record_replies(parent: dict, author_ids: List[str], count: int, last_reply_at: datetime) -> dict:
+    """
+    Fold new replies into their parent's thread summary and return it.
+    
+    One upsert keyed by the parent's id (created on the first reply), so the
+    summary is maintained as replies are written and never recounted.
+    """
+    db = get_mongo_db()
+    thread = await db.threads.find_one_and_update(
+        {"_id": parent["_id"]},
+        {
+            "$inc": {"reply_count": count},
+            "$addToSet": {"participant_ids": {"$each": list(dict.fromkeys([parent["user_id"], *author_ids]))}},
+            "$max": {"last_reply_at": last_reply_at},
+            "$setOnInsert": {
+                "parent_message_id": str(parent["_id"]),
+                "workspace_id": parent["workspace_id"],
+                "channel_id": parent.get("channel_id"),
+                "dm_id": parent.get("dm_id"),
+                "created_at": datetime.utcnow()
+            }
+        },
+        projection=THREAD_SUMMARY_PROJECTION,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return thread
+
+async def _record_reply_deleted(thread_id: str, workspace_id: str):
+    """Take a deleted reply out of its thread's count. Participants and last_reply_at are kept."""
+    if not ObjectId.is_valid(thread_id):
+        return
+    db = get_mongo_db()
+    thread = await db.threads.find_one_and_update(
+        {"_id": ObjectId(thread_id), "reply_count": {"$gt": 0}},
+        {"$inc": {"reply_count": -1}},
+        projection=THREAD_SUMMARY_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if thread:
+        await _publish_thread_updated(thread, workspace_id)
+
 @router.post("", response_model=MessageResponse, status_code=201)
 async def create_message(
     message_data: MessageCreate,
@@ -46,8 +206,21 @@ async def create_message(
     db = get_mongo_db()
     messages_collection = db.messages
     
-    # Encrypt content
-    encrypted_content = encryption.encrypt(message_data.content)
+    parent = None
+    if message_data.thread_id:
+        # Replies live in their parent's conversation
+        parent = await _thread_parent(message_data.thread_id, workspace_id)
+        message_data.channel_id = parent.get("channel_id")
+        message_data.dm_id = parent.get("dm_id")
+    
+    # Encrypt content with the workspace's data key
+    key = await encryption.data_key(workspace_id)
+    encrypted_content = encryption.encrypt(message_data.content, key=key)
+    
+    # Channel position for unread counts; replies aren't in the channel timeline
+    channel_seq = None
+    if message_data.channel_id and parent is None:
+        channel_seq = await read_markers.next_seq(workspace_id, message_data.channel_id)
     
     # Create message document
     message_doc = {
@@ -61,73 +234,791 @@ async def create_message(
         "reactions": [],
         "is_edited": False,
         "is_deleted": False,
+        "version": 1,
+        "channel_seq": channel_seq,
+        "mentions": message_data.mentions,
         "created_at": datetime.utcnow()
     }
     
     result = await messages_collection.insert_one(message_doc)
     message_doc["_id"] = result.inserted_id
     
+    if channel_seq is not None:
+        await read_markers.record_message(
+            message_data.channel_id, str(result.inserted_id), channel_seq,
+            current_user.id, message_data.mentions
+        )
+    
     # Decrypt for response
     message_doc["content"] = message_data.content
     message_doc["id"] = str(result.inserted_id)
     
-    # Broadcast via WebSocket
-    await manager.broadcast_to_workspace(
-        workspace_id,
-        create_message_event(message_doc, workspace_id)
-    )
+    # Deliver locally and to every other node via Redis
+    if parent is None:
+        await manager.publish_event(
+            create_message_event(message_doc, workspace_id),
+            channel_id=message_data.channel_id
+        )
+    else:
+        # Only the thread sees the reply itself; the summary tells it the count changed
+        thread = await _record_replies(parent, [current_user.id], 1, message_doc["created_at"])
+        await manager.publish_event(create_message_event(message_doc, workspace_id), **_thread_route(thread))
+        await _publish_thread_updated(thread, workspace_id)
     
     return MessageResponse(**message_doc)
 
-@router.get("", response_model=List[MessageResponse])
+class _BulkConversation:
+    """Running totals for one channel or DM across the chunks of a bulk request."""
+    
+    def __init__(self, channel_id: Optional[str], dm_id: Optional[str]):
+        self.channel_id = channel_id
+        self.dm_id = dm_id
+        self.count = 0
+        self.first_seq: Optional[int] = None
+        self.last_seq: Optional[int] = None
+        # (message_id, seq, author_id, mentions) for the read-marker engine
+        self.markers: List[Tuple[str, int, str, List[str]]] = []
+
+async def _bulk_items(request: Request) -> AsyncIterator[Tuple[int, object]]:
+    """
+    Yield (index, raw item) from a JSON array body or a streamed NDJSON body.
+    
+    NDJSON lines are yielded as bytes and parsed later, so a bad line only fails itself.
+    Bodies over BULK_INGEST_MAX_BYTES and lines over BULK_INGEST_MAX_LINE_BYTES are
+    rejected with 413; a streamed body is cut off there, after the chunks before it
+    were ingested.
+    """
+    max_bytes = settings.BULK_INGEST_MAX_BYTES
+    max_line = settings.BULK_INGEST_MAX_LINE_BYTES
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Body larger than {max_bytes} bytes")
+    
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        index = 0
+        received = 0
+        buffer = bytearray()
+        # Bytes of buffer already known to hold no newline, so a long line isn't rescanned per chunk
+        searched = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Body larger than {max_bytes} bytes")
+            buffer += chunk
+            start = 0
+            while True:
+                newline = buffer.find(b"\n", max(start, searched))
+                if newline < 0:
+                    break
+                if newline - start > max_line:
+                    raise HTTPException(status_code=413, detail=f"Line {index} longer than {max_line} bytes")
+                line = bytes(buffer[start:newline])
+                start = newline + 1
+                if line.strip():
+                    yield index, line
+                    index += 1
+            del buffer[:start]
+            searched = len(buffer)
+            if searched > max_line:
+                raise HTTPException(status_code=413, detail=f"Line {index} longer than {max_line} bytes")
+        if buffer.strip():
+            yield index, bytes(buffer)
+        return
+    
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Body larger than {max_bytes} bytes")
+    try:
+        body = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if isinstance(body, dict):
+        body = body.get("messages")
+    if not isinstance(body, list):
+        raise HTTPException(status_code=400, detail="Expected a list of messages")
+    if len(body) > settings.BULK_INGEST_MAX_MESSAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_INGEST_MAX_MESSAGES} messages per request"
+        )
+    for index, item in enumerate(body):
+        yield index, item
+
+def _parse_bulk_item(raw: object) -> BulkMessageCreate:
+    if isinstance(raw, bytes):
+        raw = json.loads(raw)
+    if not isinstance(raw, dict):
+        raise ValueError("Expected a message object")
+    message = BulkMessageCreate(**raw)
+    if not message.channel_id and not message.dm_id and not message.thread_id:
+        raise ValueError("channel_id, dm_id or thread_id is required")
+    if message.created_at and message.created_at.tzinfo:
+        # Stored timestamps are naive UTC, like datetime.utcnow()
+        message.created_at = message.created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return message
+
+async def _ingest_chunk(
+    chunk: List[Tuple[int, BulkMessageCreate]],
+    workspace_id: str,
+    user_id: str,
+    conversations: Dict[Tuple[Optional[str], Optional[str]], _BulkConversation],
+    failed: List[BulkIngestError]
+) -> int:
+    """Encrypt, sequence and insert one chunk. Returns the number of messages inserted."""
+    db = get_mongo_db()
+    thread_ids = {message.thread_id for _, message in chunk if message.thread_id}
+    parents = await _thread_parents(list(thread_ids), workspace_id) if thread_ids else {}
+    accepted = []
+    for index, message in chunk:
+        if not message.thread_id:
+            accepted.append((index, message))
+        elif message.thread_id in parents:
+            parent = parents[message.thread_id]
+            message.channel_id = parent.get("channel_id")
+            message.dm_id = parent.get("dm_id")
+            accepted.append((index, message))
+        else:
+            failed.append(BulkIngestError(index=index, error="Parent message not found"))
+    chunk = accepted
+    if not chunk:
+        return 0
+    key = await encryption.data_key(workspace_id)
+    encrypted = await encryption.encrypt_batch([message.content for _, message in chunk], key=key)
+    
+    # One seq range per channel for the whole chunk; replies don't take one
+    channel_counts: Dict[str, int] = {}
+    for _, message in chunk:
+        if message.channel_id and not message.thread_id:
+            channel_counts[message.channel_id] = channel_counts.get(message.channel_id, 0) + 1
+    next_seqs = {}
+    for channel_id, count in channel_counts.items():
+        last = await read_markers.reserve_seqs(workspace_id, channel_id, count)
+        next_seqs[channel_id] = last - count + 1
+    
+    now = datetime.utcnow()
+    docs = []
+    for (_, message), content in zip(chunk, encrypted):
+        channel_seq = None
+        if message.channel_id and not message.thread_id:
+            channel_seq = next_seqs[message.channel_id]
+            next_seqs[message.channel_id] += 1
+        docs.append({
+            "_id": ObjectId(),
+            "workspace_id": workspace_id,
+            "channel_id": message.channel_id,
+            "dm_id": message.dm_id,
+            "user_id": user_id,
+            "content": content,
+            "thread_id": message.thread_id,
+            "attachments": [att.dict() for att in message.attachments],
+            "reactions": [],
+            "is_edited": False,
+            "is_deleted": False,
+            "version": 1,
+            "channel_seq": channel_seq,
+            "mentions": message.mentions,
+            "created_at": message.created_at or now
+        })
+    
+    rejected = set()
+    try:
+        await db.messages.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Unordered: everything except the reported documents was written
+        for error in e.details.get("writeErrors", []):
+            rejected.add(error["index"])
+            failed.append(
+                BulkIngestError(index=chunk[error["index"]][0], error=error.get("errmsg", "write failed"))
+            )
+    
+    # (reply count, latest reply) per thread
+    replies: Dict[str, Tuple[int, datetime]] = {}
+    for position, doc in enumerate(docs):
+        if position in rejected:
+            continue
+        if doc["thread_id"]:
+            # Replies are announced to their threads, not in the conversation's message.bulk
+            count, latest = replies.get(doc["thread_id"], (0, doc["created_at"]))
+            replies[doc["thread_id"]] = (count + 1, max(latest, doc["created_at"]))
+            continue
+        key = (doc["channel_id"], doc["dm_id"] if not doc["channel_id"] else None)
+        conversation = conversations.get(key)
+        if conversation is None:
+            conversation = conversations[key] = _BulkConversation(*key)
+        conversation.count += 1
+        seq = doc["channel_seq"]
+        if seq is not None:
+            if conversation.first_seq is None or seq < conversation.first_seq:
+                conversation.first_seq = seq
+            if conversation.last_seq is None or seq > conversation.last_seq:
+                conversation.last_seq = seq
+            conversation.markers.append((str(doc["_id"]), seq, user_id, doc["mentions"]))
+    for thread_id, (count, latest) in replies.items():
+        thread = await _record_replies(parents[thread_id], [user_id], count, latest)
+        await _publish_thread_updated(thread, workspace_id)
+    return len(docs) - len(rejected)
+
+@router.post("/bulk", response_model=BulkIngestResponse)
+async def create_messages_bulk(
+    request: Request,
+    workspace_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Ingest many messages at once, for bots and history imports.
+    
+    Accepts a JSON array (or {"messages": [...]}) or a streamed NDJSON body
+    (Content-Type: application/x-ndjson) of message objects. Messages are
+    encrypted off the event loop and written with unordered insert_many in
+    chunks of BULK_INGEST_CHUNK_SIZE; invalid or rejected messages are reported
+    by index without failing the rest. Connected clients get one message.bulk
+    summary per channel instead of one event per message; thread replies get a
+    thread.updated per thread instead and aren't counted in channels.
+    """
+    conversations: Dict[Tuple[Optional[str], Optional[str]], _BulkConversation] = {}
+    failed: List[BulkIngestError] = []
+    inserted = 0
+    truncated = False
+    chunk: List[Tuple[int, BulkMessageCreate]] = []
+    
+    async for index, raw in _bulk_items(request):
+        if index >= settings.BULK_INGEST_MAX_MESSAGES:
+            # Streamed bodies stop at the limit; the client resends the remainder
+            truncated = True
+            break
+        try:
+            chunk.append((index, _parse_bulk_item(raw)))
+        except (ValueError, ValidationError) as e:
+            failed.append(BulkIngestError(index=index, error=str(e)))
+            continue
+        if len(chunk) >= settings.BULK_INGEST_CHUNK_SIZE:
+            inserted += await _ingest_chunk(chunk, workspace_id, current_user.id, conversations, failed)
+            chunk = []
+    if chunk:
+        inserted += await _ingest_chunk(chunk, workspace_id, current_user.id, conversations, failed)
+    
+    for conversation in conversations.values():
+        if conversation.channel_id:
+            await read_markers.record_messages(conversation.channel_id, conversation.markers)
+        await manager.publish_event(
+            create_message_bulk_event(
+                conversation.channel_id,
+                conversation.dm_id,
+                conversation.count,
+                conversation.first_seq,
+                conversation.last_seq,
+                workspace_id
+            ),
+            channel_id=conversation.channel_id
+        )
+    
+    failed.sort(key=lambda error: error.index)
+    return BulkIngestResponse(
+        inserted=inserted,
+        failed=failed,
+        channels={
+            conversation.channel_id or conversation.dm_id: conversation.count
+            for conversation in conversations.values()
+        },
+        truncated=truncated
+    )
+
+# Fields MessageResponse needs; everything else stays on the server
+HISTORY_PROJECTION = {
+    field: 1 for field in (
+        "workspace_id", "channel_id", "dm_id", "user_id", "content", "thread_id", "attachments",
+        "reactions", "is_edited", "is_deleted", "version", "channel_seq", "created_at"
+    )
+}
+MAX_PAGE_SIZE = 100
+_EPOCH = datetime(1970, 1, 1)
+
+class MessagePage(BaseModel):
+    messages: List[MessageResponse]  # Newest first
+    # Opaque cursors for the next page in each direction
+    before: Optional[str] = None
+    after: Optional[str] = None
+    has_more_before: bool = False
+    has_more_after: bool = False
+
+def encode_cursor(message: dict) -> str:
+    """Keyset cursor for a message: its created_at in milliseconds and its id."""
+    millis = (message["created_at"] - _EPOCH) // timedelta(milliseconds=1)
+    return f"{millis}_{message['_id']}"
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        millis, message_id = cursor.split("_", 1)
+        return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(message_id)
+    except (ValueError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def history_index(channel_id: Optional[str]) -> list:
+    """The compound index a history query for a channel (or else a DM) runs on."""
+    return MESSAGE_CHANNEL_HISTORY_INDEX if channel_id else MESSAGE_DM_HISTORY_INDEX
+
+def history_query(
+    workspace_id: str,
+    channel_id: Optional[str],
+    dm_id: Optional[str],
+    cursor: Optional[Tuple[datetime, ObjectId]] = None,
+    older: bool = True,
+    inclusive: bool = False
+) -> Tuple[dict, list]:
+    """
+    Build the filter and sort for one page of history.
+    
+    Equality on the index prefix plus a range on created_at, sorted on
+    (created_at, _id), so the query is a single bounded index scan with no
+    in-memory sort. Messages sharing the cursor's millisecond are split by _id.
+    Thread replies are left out by the index's trailing thread_id.
+    
+    Args:
+        cursor: (created_at, _id) to page from; None for the newest (or oldest) messages
+        older: Page towards older messages (newest first) rather than newer ones (oldest first)
+        inclusive: Include the cursor's own message
+    """
+    query = {"workspace_id": workspace_id}
+    if channel_id:
+        query["channel_id"] = channel_id
+    else:
+        query["dm_id"] = dm_id
+    # Replies are read through their thread
+    query["thread_id"] = None
+    
+    order = -1 if older else 1
+    if cursor:
+        created_at, message_id = cursor
+        query["created_at"] = {"$lte" if older else "$gte": created_at}
+        if older:
+            excluded = {"$gt": message_id} if inclusive else {"$gte": message_id}
+        else:
+            excluded = {"$lt": message_id} if inclusive else {"$lte": message_id}
+        query["$nor"] = [{"created_at": created_at, "_id": excluded}]
+    return query, [("created_at", order), ("_id", order)]
+
+async def _fetch_history(query: dict, sort: list, limit: int) -> Tuple[List[dict], bool]:
+    """Fetch up to limit messages, plus whether more exist past them."""
+    if limit <= 0:
+        return [], True
+    db = get_mongo_db()
+    cursor = db.messages.find(query, projection=HISTORY_PROJECTION).sort(sort).limit(limit + 1)
+    messages = await cursor.to_list(length=limit + 1)
+    return messages[:limit], len(messages) > limit
+
+async def _decrypt_all(messages: List[dict]):
+    plaintexts = await encryption.decrypt_batch(
+        [msg["content"] for msg in messages],
+        keys=[(msg["_id"], msg.get("version", 0)) for msg in messages]
+    )
+    for msg, plaintext in zip(messages, plaintexts):
+        msg["content"] = plaintext
+        msg["id"] = str(msg["_id"])
+
+async def _newest_page(workspace_id: str, channel_id: str, limit: int) -> Tuple[List[dict], bool]:
+    """A channel's newest messages, from the hot-channel cache when it has them."""
+    cache = manager.message_cache
+    cached = cache.get(workspace_id, channel_id, limit)
+    if cached is not None:
+        stale = cache.stale_reactions(channel_id, cached[0])
+        if stale:
+            # Hot messages only had their counts updated; reload who reacted
+            db = get_mongo_db()
+            docs = await db.messages.find(
+                {"_id": {"$in": [ObjectId(message_id) for message_id in stale]}},
+                projection={"reactions": 1, "version": 1}
+            ).to_list(length=None)
+            cache.refresh_reactions(channel_id, docs)
+        return cached
+    
+    # Read enough to fill the cache, then serve the page from that
+    token = cache.begin_fill(workspace_id, channel_id)
+    fetch_limit = max(limit, cache.channel_messages) if token is not None else limit
+    messages, has_more = await _fetch_history(*history_query(workspace_id, channel_id, None), fetch_limit)
+    await _decrypt_all(messages)
+    cache.fill(token, workspace_id, channel_id, messages, has_more)
+    return messages[:limit], has_more or len(messages) > limit
+
+@router.get("", response_model=MessagePage)
 async def get_messages(
+    workspace_id: str,
     channel_id: Optional[str] = None,
     dm_id: Optional[str] = None,
     limit: int = 50,
     before: Optional[str] = None,
+    after: Optional[str] = None,
+    around: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a page of messages from a channel or DM, newest first.
+    
+    Page with the before/after cursors returned by the previous page, or pass
+    around=<message_id> to open history at a message (it is included, with
+    roughly half the page on either side).
+    """
+    if bool(channel_id) == bool(dm_id):
+        raise HTTPException(status_code=400, detail="Exactly one of channel_id or dm_id is required")
+    if sum(value is not None for value in (before, after, around)) > 1:
+        raise HTTPException(status_code=400, detail="Use only one of before, after or around")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    older: List[dict] = []
+    newer: List[dict] = []
+    if around:
+        target = {"channel_id": channel_id} if channel_id else {"dm_id": dm_id}
+        db = get_mongo_db()
+        anchor = await db.messages.find_one(
+            {"_id": _object_id(around), "workspace_id": workspace_id, **target},
+            projection={"created_at": 1}
+        )
+        if not anchor:
+            raise HTTPException(status_code=404, detail="Message not found")
+        key = (anchor["created_at"], anchor["_id"])
+        older_limit = limit // 2 + 1
+        older_query = history_query(workspace_id, channel_id, dm_id, key, older=True, inclusive=True)
+        newer_query = history_query(workspace_id, channel_id, dm_id, key, older=False)
+        (older, has_more_before), (newer, has_more_after) = await asyncio.gather(
+            _fetch_history(*older_query, older_limit),
+            _fetch_history(*newer_query, limit - older_limit)
+        )
+        await _decrypt_all(older + newer)
+    elif after:
+        newer, has_more_after = await _fetch_history(
+            *history_query(workspace_id, channel_id, dm_id, decode_cursor(after), older=False), limit
+        )
+        await _decrypt_all(newer)
+        has_more_before = True
+    elif before:
+        older, has_more_before = await _fetch_history(
+            *history_query(workspace_id, channel_id, dm_id, decode_cursor(before), older=True), limit
+        )
+        await _decrypt_all(older)
+        has_more_after = True
+    elif channel_id:
+        older, has_more_before = await _newest_page(workspace_id, channel_id, limit)
+        has_more_after = False
+    else:
+        older, has_more_before = await _fetch_history(*history_query(workspace_id, None, dm_id), limit)
+        await _decrypt_all(older)
+        has_more_after = False
+    
+    messages = newer[::-1] + older
+    
+    return MessagePage(
+        messages=[MessageResponse(**msg) for msg in messages],
+        before=encode_cursor(messages[-1]) if messages else before,
+        after=encode_cursor(messages[0]) if messages else after,
+        has_more_before=has_more_before,
+        has_more_after=has_more_after
+    )
+
+def _object_id(message_id: str) -> ObjectId:
+    try:
+        return ObjectId(message_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Message not found")
+
+async def _find_readable(session: AsyncSession, message_id: str, workspace_id: str, user_id: str, **kwargs) -> dict:
+    """
+    Load a message from the workspace, if the user is a member of its channel or DM.
+    
+    Anything else is a 404, so message ids can't be probed across conversations.
+    """
+    msg = await get_mongo_db().messages.find_one(
+        {"_id": _object_id(message_id), "workspace_id": workspace_id}, **kwargs
+    )
+    if msg and msg.get("channel_id"):
+        statement = (
+            select(ChannelMember.id)
+            .join(Channel, Channel.id == ChannelMember.channel_id)
+            .where(
+                Channel.id == msg["channel_id"],
+                Channel.workspace_id == workspace_id,
+                ChannelMember.user_id == user_id
+            )
+        )
+    elif msg and msg.get("dm_id"):
+        statement = select(DirectMessage.id).where(
+            DirectMessage.id == msg["dm_id"],
+            DirectMessage.workspace_id == workspace_id,
+            or_(DirectMessage.user1_id == user_id, DirectMessage.user2_id == user_id)
+        )
+    else:
+        raise HTTPException(status_code=404, detail="Message not found")
+    result = await session.execute(statement.limit(1))
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return msg
+
+# Fields a delta event needs from the updated document
+DELTA_PROJECTION = {"workspace_id": 1, "channel_id": 1, "thread_id": 1, "version": 1}
+
+@router.get("/threads", response_model=List[ThreadSummary])
+async def get_thread_summaries(
+    workspace_id: str,
+    parent_ids: List[str] = Query(...),
     current_user: User = Depends(get_current_user)
 ):
-    """Get messages from a channel or DM."""
+    """
+    Thread summaries for the messages on a page, in one query.
+    
+    Messages without replies are left out.
+    """
+    if len(parent_ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} parent_ids")
+    oids = [ObjectId(parent_id) for parent_id in parent_ids if ObjectId.is_valid(parent_id)]
     db = get_mongo_db()
-    messages_collection = db.messages
+    threads = await db.threads.find(
+        {"_id": {"$in": oids}, "workspace_id": workspace_id}, projection=THREAD_SUMMARY_PROJECTION
+    ).to_list(length=None)
+    return [ThreadSummary(**_thread_summary(thread)) for thread in threads]
+
+@router.get("/{message_id}/replies", response_model=ReplyPage)
+async def get_replies(
+    message_id: str,
+    workspace_id: str,
+    limit: int = 50,
+    after: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db)
+):
+    """A page of a thread's replies, oldest first; pass the returned cursor as after for the next."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # Replies live in the parent's conversation, so its membership covers them
+    await _find_readable(session, message_id, workspace_id, current_user.id, projection=THREAD_PARENT_PROJECTION)
+    query = {"thread_id": message_id, "workspace_id": workspace_id}
+    if after:
+        # Same keyset shape as history_query, on the (thread_id, created_at, _id) index
+        created_at, last_id = decode_cursor(after)
+        query["created_at"] = {"$gte": created_at}
+        query["$nor"] = [{"created_at": created_at, "_id": {"$lte": last_id}}]
+    replies, has_more = await _fetch_history(query, [("created_at", 1), ("_id", 1)], limit)
+    await _decrypt_all(replies)
+    return ReplyPage(
+        messages=[MessageResponse(**reply) for reply in replies],
+        after=encode_cursor(replies[-1]) if replies else after,
+        has_more=has_more
+    )
+
+@router.post("/{message_id}/replies", response_model=MessageResponse, status_code=201)
+async def create_reply(
+    message_id: str,
+    reply: ReplyCreate,
+    workspace_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Reply in a message's thread. The reply goes to the parent's channel or DM."""
+    return await create_message(
+        MessageCreate(
+            content=reply.content,
+            thread_id=message_id,
+            attachments=reply.attachments,
+            mentions=reply.mentions
+        ),
+        workspace_id,
+        current_user
+    )
+
+@router.get("/{message_id}", response_model=MessageResponse)
+async def get_message(
+    message_id: str,
+    workspace_id: str,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db)
+):
+    """Get a single message, e.g. to resync after a gap in delta versions."""
+    msg = await _find_readable(session, message_id, workspace_id, current_user.id)
+    await _decrypt_all([msg])
+    return MessageResponse(**msg)
+
+@router.patch("/{message_id}")
+async def update_message(
+    message_id: str,
+    message_data: MessageUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    """Edit a message. Clients receive a message.updated delta with the new content."""
+    db = get_mongo_db()
+    updated_at = datetime.utcnow()
+    message_oid = _object_id(message_id)
     
-    query = {}
-    if channel_id:
-        query["channel_id"] = channel_id
-    if dm_id:
-        query["dm_id"] = dm_id
-    if before:
-        query["_id"] = {"$lt": ObjectId(before)}
+    # The new content is encrypted with the message's workspace key
+    existing = await db.messages.find_one({"_id": message_oid}, projection={"workspace_id": 1})
+    if not existing:
+        raise HTTPException(status_code=404, detail="Message not found")
+    key = await encryption.data_key(existing["workspace_id"])
     
-    cursor = messages_collection.find(query).sort("created_at", -1).limit(limit)
-    messages = await cursor.to_list(length=limit)
+    updated = await db.messages.find_one_and_update(
+        {"_id": message_oid, "user_id": current_user.id, "is_deleted": {"$ne": True}},
+        {
+            "$set": {
+                "content": encryption.encrypt(message_data.content, key=key),
+                "is_edited": True,
+                "updated_at": updated_at
+            },
+            "$inc": {"version": 1}
+        },
+        projection=DELTA_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="Message not found")
     
-    # Decrypt messages
-    for msg in messages:
-        msg["content"] = encryption.decrypt(msg["content"])
-        msg["id"] = str(msg["_id"])
+    route = await _reply_route(updated) if updated.get("thread_id") else {"channel_id": updated.get("channel_id")}
+    await manager.publish_event(
+        create_message_updated_event(
+            message_id,
+            updated.get("channel_id"),
+            {"content": message_data.content, "is_edited": True, "updated_at": updated_at},
+            updated["version"],
+            updated["workspace_id"]
+        ),
+        **route
+    )
     
-    return [MessageResponse(**msg) for msg in messages]
+    return {"status": "updated", "version": updated["version"]}
 
-@router.post("/{message_id}/reactions")
-async def add_reaction(
+@router.delete("/{message_id}")
+async def delete_message(
     message_id: str,
-    emoji: str,
     current_user: User = Depends(get_current_user)
 ):
-    """Add a reaction to a message."""
+    """Soft-delete a message. Clients receive a message.deleted delta."""
     db = get_mongo_db()
-    messages_collection = db.messages
+    deleted_at = datetime.utcnow()
+    
+    updated = await db.messages.find_one_and_update(
+        {"_id": _object_id(message_id), "user_id": current_user.id, "is_deleted": {"$ne": True}},
+        {"$set": {"is_deleted": True, "deleted_at": deleted_at}, "$inc": {"version": 1}},
+        projection=DELTA_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="Message not found")
     
-    await messages_collection.update_one(
-        {"_id": ObjectId(message_id), "reactions.emoji": emoji},
-        {"$addToSet": {"reactions.$.user_ids": current_user.id}, "$inc": {"reactions.$.count": 1}}
+    route = await _reply_route(updated) if updated.get("thread_id") else {"channel_id": updated.get("channel_id")}
+    await manager.publish_event(
+        create_message_deleted_event(
+            message_id, updated.get("channel_id"), deleted_at, updated["version"], updated["workspace_id"]
+        ),
+        **route
     )
+    if updated.get("thread_id"):
+        await _record_reply_deleted(updated["thread_id"], updated["workspace_id"])
     
-    # If reaction doesn't exist, add it
-    await messages_collection.update_one(
-        {"_id": ObjectId(message_id), "reactions.emoji": {"$ne": emoji}},
-        {"$push": {"reactions": {"emoji": emoji, "user_ids": [current_user.id], "count": 1}}}
+    return {"status": "deleted", "version": updated["version"]}
+
+def _add_reaction_update(emoji: str, user_id: str) -> List[dict]:
+    """
+    Pipeline update adding a user to an emoji's reaction, creating it if needed.
+    
+    Counts are recomputed from user_ids rather than incremented, so they can't drift.
+    """
+    reactions = {"$ifNull": ["$reactions", []]}
+    with_user = {"$map": {"input": reactions, "as": "r", "in": {"$cond": [
+        {"$eq": ["$$r.emoji", emoji]},
+        {"$let": {
+            "vars": {"users": {"$concatArrays": [{"$ifNull": ["$$r.user_ids", []]}, [user_id]]}},
+            "in": {"emoji": "$$r.emoji", "user_ids": "$$users", "count": {"$size": "$$users"}}
+        }},
+        "$$r"
+    ]}}}
+    return [{"$set": {
+        "reactions": {"$cond": [
+            {"$in": [emoji, {"$ifNull": ["$reactions.emoji", []]}]},
+            with_user,
+            {"$concatArrays": [reactions, [{"emoji": emoji, "user_ids": [user_id], "count": 1}]]}
+        ]},
+        "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+    }}]
+
+def _remove_reaction_update(emoji: str, user_id: str) -> List[dict]:
+    """Pipeline update removing a user from an emoji's reaction, dropping the reaction once nobody is left."""
+    without_user = {"$map": {"input": {"$ifNull": ["$reactions", []]}, "as": "r", "in": {"$cond": [
+        {"$eq": ["$$r.emoji", emoji]},
+        {"$let": {
+            "vars": {"users": {"$filter": {
+                "input": {"$ifNull": ["$$r.user_ids", []]}, "as": "u", "cond": {"$ne": ["$$u", user_id]}
+            }}},
+            "in": {"emoji": "$$r.emoji", "user_ids": "$$users", "count": {"$size": "$$users"}}
+        }},
+        "$$r"
+    ]}}}
+    return [{"$set": {
+        "reactions": {"$filter": {"input": without_user, "as": "r", "cond": {"$gt": ["$$r.count", 0]}}},
+        "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+    }}]
+
+# Every emoji's count, without the user lists
+REACTION_PROJECTION = {**DELTA_PROJECTION, "reactions.emoji": 1, "reactions.count": 1}
+
+async def _change_reaction(message_id: str, emoji: str, user_id: str, action: str) -> dict:
+    """
+    Add or remove a user's reaction in one atomic update and publish the delta.
+    
+    The filter only matches when the change does something, so repeating a
+    request is a no-op: the version stays and nothing is published.
+    """
+    db = get_mongo_db()
+    message_oid = _object_id(message_id)
+    reacted = {"$elemMatch": {"emoji": emoji, "user_ids": user_id}}
+    if action == "add":
+        query = {"_id": message_oid, "is_deleted": {"$ne": True}, "reactions": {"$not": reacted}}
+        update = _add_reaction_update(emoji, user_id)
+    else:
+        query = {"_id": message_oid, "is_deleted": {"$ne": True}, "reactions": reacted}
+        update = _remove_reaction_update(emoji, user_id)
+    
+    updated = await db.messages.find_one_and_update(
+        query, update, projection=REACTION_PROJECTION, return_document=ReturnDocument.AFTER
     )
+    changed = updated is not None
+    if not changed:
+        updated = await db.messages.find_one(
+            {"_id": message_oid, "is_deleted": {"$ne": True}}, projection=REACTION_PROJECTION
+        )
+        if not updated:
+            raise HTTPException(status_code=404, detail="Message not found")
     
-    return {"status": "added"}
+    counts = {reaction["emoji"]: reaction["count"] for reaction in updated.get("reactions") or ()}
+    if changed:
+        event = create_reaction_event(
+            message_id,
+            emoji,
+            user_id,
+            action,
+            updated["workspace_id"],
+            channel_id=updated.get("channel_id"),
+            count=counts.get(emoji, 0),
+            version=updated["version"]
+        )
+        if updated.get("thread_id"):
+            # Replies go to their thread only, so they skip the hot-message aggregation
+            await manager.publish_event(event, **await _reply_route(updated))
+        else:
+            await manager.publish_reaction(event, counts)
+    return {"count": counts.get(emoji, 0), "version": updated["version"]}
+
+@router.post("/{message_id}/reactions")
+async def add_reaction(
+    message_id: str,
+    reaction: ReactionCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Add a reaction to a message. Adding one the user already has changes nothing."""
+    result = await _change_reaction(message_id, reaction.emoji, current_user.id, "add")
+    return {"status": "added", **result}
+
+@router.delete("/{message_id}/reactions/{emoji}")
+async def remove_reaction(
+    message_id: str,
+    emoji: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Remove the user's reaction from a message."""
+    result = await _change_reaction(message_id, emoji, current_user.id, "remove")
+    return {"status": "removed", **result}
@@ -34,6 +34,15 @@ class MongoDB:
         return db[name]
 
 
+# Message history indexes. Keyset pagination in the messages endpoint sorts on
+# (created_at, _id) and must match these exactly to avoid in-memory sorts. The
+# trailing thread_id lets the scan itself skip thread replies without fetching them.
+MESSAGE_CHANNEL_HISTORY_INDEX = [
+    ("workspace_id", 1), ("channel_id", 1), ("created_at", -1), ("_id", -1), ("thread_id", 1)
+]
+MESSAGE_DM_HISTORY_INDEX = [("workspace_id", 1), ("dm_id", 1), ("created_at", -1), ("_id", -1), ("thread_id", 1)]
+
+
 # Convenience function
 def get_mongo_db():
     """Get MongoDB database instance."""
@@ -47,12 +56,23 @@ async def init_mongodb():
     
     # Messages collection
     messages = db.messages
-    await messages.create_index([("workspace_id", 1), ("channel_id", 1), ("created_at", -1)])
-    await messages.create_index([("workspace_id", 1), ("dm_id", 1), ("created_at", -1)])
-    await messages.create_index([("thread_id", 1), ("created_at", 1)])
+    await messages.create_index(MESSAGE_CHANNEL_HISTORY_INDEX)
+    await messages.create_index(MESSAGE_DM_HISTORY_INDEX)
+    await messages.create_index([("thread_id", 1), ("created_at", 1), ("_id", 1)])
     await messages.create_index([("user_id", 1)])
+    await messages.create_index([("channel_id", 1), ("channel_seq", -1)])
+    # Workspace-scoped walks in _id order, e.g. re-encryption after a key rotation
+    await messages.create_index([("workspace_id", 1), ("_id", 1)])
+    
+    # Read markers collection
+    read_markers = db.read_markers
+    await read_markers.create_index([("user_id", 1), ("channel_id", 1)], unique=True)
+    
+    # Wrapped per-workspace encryption keys
+    workspace_keys = db.workspace_keys
+    await workspace_keys.create_index([("workspace_id", 1), ("version", -1)], unique=True)
     
-    # Threads collection
+    # Threads collection: one summary per parent message, keyed by the parent's _id
     threads = db.threads
     await threads.create_index([("parent_message_id", 1)])
     
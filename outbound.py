@@ -0,0 +1,145 @@
+from collections import deque
+from enum import Enum
+from typing import Deque, FrozenSet, List, Optional
+import asyncio
+import time
+
+from app.websocket.events import EPHEMERAL_EVENT_TYPES, Frame
+
+
+class SlowConsumerPolicy(str, Enum):
+    """What to do when a connection's outbound queue is full."""
+    DROP_OLDEST = "drop_oldest"
+    DROP_EPHEMERAL = "drop_ephemeral"
+    DISCONNECT = "disconnect"
+
+
+def _is_ephemeral(frame: Frame) -> bool:
+    return frame.event_type in EPHEMERAL_EVENT_TYPES
+
+
+class OutboundQueue:
+    """Bounded queue of encoded frames for a single WebSocket, drained by its writer task."""
+    __slots__ = ("maxsize", "policy", "batching", "codec", "dropped", "writer_task", "_items", "_waiter")
+
+    def __init__(
+        self,
+        maxsize: int,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST,
+        batching: bool = False,
+        codec=None
+    ):
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        # Whether the client negotiated array frames at connect time
+        self.batching = batching
+        # Wire format negotiated at connect time (app.websocket.protocol)
+        self.codec = codec
+        self.dropped = 0
+        self.writer_task: Optional[asyncio.Task] = None
+        self._items: Deque[Frame] = deque()
+        # Future the writer is parked on; created only while it waits, unlike an asyncio.Event
+        self._waiter: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, frame: Frame) -> bool:
+        """
+        Enqueue a frame without blocking.
+
+        Returns:
+            False if the queue is full and the policy is to disconnect the consumer,
+            True otherwise (even if a frame had to be dropped to make room)
+        """
+        if len(self._items) >= self.maxsize:
+            if self.policy == SlowConsumerPolicy.DISCONNECT:
+                return False
+            if not self._make_room(frame):
+                # The incoming frame itself was the cheapest one to lose
+                self.dropped += 1
+                return True
+
+        self._items.append(frame)
+        self._wake()
+        return True
+
+    def _make_room(self, incoming: Frame) -> bool:
+        """Evict one queued frame. Returns False if the incoming frame should be dropped instead."""
+        if self.policy == SlowConsumerPolicy.DROP_EPHEMERAL:
+            for index, queued in enumerate(self._items):
+                if _is_ephemeral(queued):
+                    del self._items[index]
+                    self.dropped += 1
+                    return True
+            # Nothing ephemeral is queued; never evict a real event for a typing frame
+            if _is_ephemeral(incoming):
+                return False
+
+        self._items.popleft()
+        self.dropped += 1
+        return True
+
+    def prepend(self, frames: List[Frame]):
+        """
+        Put replayed frames ahead of everything queued so far.
+
+        Queued live frames that were also replayed are dropped. Only the exact
+        sequence numbers replayed count: a live event numbered below the newest
+        replayed one may not have been in the log yet. Replays are allowed to
+        exceed maxsize; they are bounded by the replay log instead.
+        """
+        replayed = {frame.seq for frame in frames if frame.seq is not None}
+        live = self._items
+        if replayed:
+            live = (frame for frame in self._items if frame.seq is None or frame.seq not in replayed)
+        self._items = deque(frames)
+        self._items.extend(live)
+        if self._items:
+            self._wake()
+
+    def _wake(self):
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def _wait(self):
+        self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    async def get(self) -> Frame:
+        """Wait for and return the next queued frame."""
+        while not self._items:
+            await self._wait()
+        return self._items.popleft()
+
+    async def get_batch(self, max_events: int, window: float, bypass: FrozenSet[str]) -> List[Frame]:
+        """
+        Wait for the next frame, then collect whatever else arrives within the window.
+
+        Stops early at max_events or at a frame whose type is in bypass; a bypass
+        frame is always returned on its own so it isn't held back by batching.
+        """
+        first = await self.get()
+        batch = [first]
+        if first.event_type in bypass:
+            return batch
+
+        deadline = time.monotonic() + window
+        while len(batch) < max_events:
+            if not self._items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                continue
+            if self._items[0].event_type in bypass:
+                break
+            batch.append(self._items.popleft())
+        return batch
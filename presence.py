@@ -0,0 +1,197 @@
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone
+from sqlalchemy.dialects.postgresql import insert
+import asyncio
+import time
+
+from app.core.config import settings
+from app.db.postgresql import AsyncSessionLocal
+from app.models.user import PresenceStatus, UserPresence
+from app.websocket.events import create_presence_diff_event
+
+
+class PresenceEngine:
+    """
+    Redis-backed presence with batched diffs and lazy write-back to PostgreSQL.
+
+    Liveness lives in a sorted set per workspace (user_id -> expiry) refreshed in
+    bulk for every locally connected user, plus a hash counting how many nodes hold
+    sockets for each user. Changes are collected per workspace and sent as one
+    presence.diff event per flush interval; last_seen/status rows are upserted in
+    bulk every WS_PRESENCE_PERSIST_INTERVAL instead of on each change.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[dict], Awaitable[None]],
+        local_workspaces: Callable[[], Iterable[str]]
+    ):
+        self.publish = publish
+        self.local_workspaces = local_workspaces
+        self.redis = None
+        self.ttl = settings.WS_PRESENCE_TTL
+        # (workspace_id, user_id) -> number of local sockets
+        self._local: Dict[Tuple[str, str], int] = {}
+        # workspace_id -> user_id -> status not yet announced
+        self._pending: Dict[str, Dict[str, str]] = {}
+        # user_id -> columns to write back to user_presence
+        self._unsaved: Dict[str, dict] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    @staticmethod
+    def _live_key(workspace_id: str) -> str:
+        return f"presence:{workspace_id}"
+
+    @staticmethod
+    def _nodes_key(workspace_id: str) -> str:
+        return f"presence_nodes:{workspace_id}"
+
+    def start(self, redis_client=None):
+        """Start the diff flush and persistence loops."""
+        self.redis = redis_client
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._every(settings.WS_PRESENCE_FLUSH_INTERVAL, self.flush)),
+                asyncio.create_task(self._every(self.ttl / 3, self.refresh)),
+                asyncio.create_task(self._every(settings.WS_PRESENCE_PERSIST_INTERVAL, self.persist))
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.persist()
+
+    def mark(self, workspace_id: str, user_id: str, status: str):
+        """Queue a status change for the next diff and the next write-back."""
+        self._pending.setdefault(workspace_id, {})[user_id] = status
+        row = self._unsaved.setdefault(user_id, {})
+        row["status"] = status
+        row["last_seen"] = datetime.now(timezone.utc)
+
+    async def connected(self, workspace_id: str, user_id: str):
+        """Track a new local socket; announces the user if this made them online."""
+        key = (workspace_id, user_id)
+        self._local[key] = self._local.get(key, 0) + 1
+        if self._local[key] > 1:
+            return
+        if not self.redis:
+            self.mark(workspace_id, user_id, PresenceStatus.ONLINE.value)
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(self._live_key(workspace_id), {user_id: time.time() + self.ttl})
+            pipe.hincrby(self._nodes_key(workspace_id), user_id, 1)
+            added, _ = await pipe.execute()
+        if added:
+            self.mark(workspace_id, user_id, PresenceStatus.ONLINE.value)
+
+    async def disconnected(self, workspace_id: str, user_id: str):
+        """Track a closed local socket; announces the user offline once no node holds one."""
+        key = (workspace_id, user_id)
+        remaining = self._local.get(key, 0) - 1
+        if remaining > 0:
+            self._local[key] = remaining
+            return
+        self._local.pop(key, None)
+        if not self.redis:
+            self.mark(workspace_id, user_id, PresenceStatus.OFFLINE.value)
+            return
+        nodes = await self.redis.hincrby(self._nodes_key(workspace_id), user_id, -1)
+        if nodes > 0:
+            # Still connected through another node
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hdel(self._nodes_key(workspace_id), user_id)
+            pipe.zrem(self._live_key(workspace_id), user_id)
+            _, removed = await pipe.execute()
+        if removed:
+            self.mark(workspace_id, user_id, PresenceStatus.OFFLINE.value)
+
+    def set_status(self, user_id: str, workspace_ids: Iterable[str], status: str, custom_status: Optional[str]):
+        """Apply an explicit status change from the REST API."""
+        for workspace_id in workspace_ids:
+            self.mark(workspace_id, user_id, status)
+        row = self._unsaved.setdefault(user_id, {"status": status, "last_seen": datetime.now(timezone.utc)})
+        row["custom_status"] = custom_status
+
+    async def refresh(self):
+        """Extend the TTL of every locally connected user, one ZADD per workspace."""
+        if not self.redis or not self._local:
+            return
+        expires_at = time.time() + self.ttl
+        by_workspace: Dict[str, Dict[str, float]] = {}
+        for workspace_id, user_id in self._local:
+            by_workspace.setdefault(workspace_id, {})[user_id] = expires_at
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for workspace_id, users in by_workspace.items():
+                pipe.zadd(self._live_key(workspace_id), users)
+            await pipe.execute()
+
+    async def _expire(self):
+        """Announce users whose TTL lapsed (e.g. their node died) in workspaces we serve."""
+        workspaces = list(self.local_workspaces())
+        if not self.redis or not workspaces:
+            return
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for workspace_id in workspaces:
+                pipe.zrangebyscore(self._live_key(workspace_id), "-inf", now)
+            expired = await pipe.execute()
+        for workspace_id, user_ids in zip(workspaces, expired):
+            for user_id in user_ids:
+                # Only the node whose ZREM succeeds announces it
+                if await self.redis.zrem(self._live_key(workspace_id), user_id):
+                    await self.redis.hdel(self._nodes_key(workspace_id), user_id)
+                    self.mark(workspace_id, user_id, PresenceStatus.OFFLINE.value)
+
+    async def flush(self):
+        """Send one presence.diff per workspace with changes since the last flush."""
+        await self._expire()
+        pending, self._pending = self._pending, {}
+        for workspace_id, changes in pending.items():
+            diff: Dict[str, List[str]] = {}
+            for user_id, status in changes.items():
+                diff.setdefault(status, []).append(user_id)
+            await self.publish(create_presence_diff_event(diff, workspace_id))
+
+    async def persist(self):
+        """Write accumulated status/last_seen changes back to PostgreSQL in bulk."""
+        if not self._unsaved:
+            return
+        unsaved, self._unsaved = self._unsaved, {}
+        # Rows that carry a custom status need it in the upsert; the rest must leave it alone
+        groups: Dict[bool, List[dict]] = {True: [], False: []}
+        for user_id, row in unsaved.items():
+            groups["custom_status" in row].append(
+                {**row, "user_id": user_id, "status": PresenceStatus(row["status"])}
+            )
+
+        try:
+            async with AsyncSessionLocal() as session:
+                for with_custom_status, rows in groups.items():
+                    if not rows:
+                        continue
+                    stmt = insert(UserPresence.__table__)
+                    columns = ["status", "last_seen"] + (["custom_status"] if with_custom_status else [])
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[UserPresence.__table__.c.user_id],
+                        set_={column: stmt.excluded[column] for column in columns}
+                    )
+                    await session.execute(stmt, rows)
+                await session.commit()
+        except Exception as e:
+            print(f"Presence persist error: {e}")
+            # Keep the changes for the next attempt unless newer ones replaced them
+            for user_id, row in unsaved.items():
+                self._unsaved.setdefault(user_id, row)
+
+    async def _every(self, interval: float, job: Callable[[], Awaitable[None]]):
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await job()
+                except Exception as e:
+                    print(f"Presence error: {e}")
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,176 @@
+from typing import Dict, FrozenSet, Optional, Tuple
+from collections import OrderedDict
+from fastapi import HTTPException
+from sqlalchemy import select
+import asyncio
+import json
+import time
+
+from app.core.config import settings
+from app.core.security import decode_token, verify_token_type
+from app.db.postgresql import AsyncSessionLocal
+from app.models.user import User, UserWorkspace
+
+
+class Principal:
+    """The authenticated identity behind a connection."""
+    __slots__ = ("user_id", "email", "full_name", "is_active", "workspace_ids")
+
+    def __init__(self, user_id: str, email: str, full_name: str, is_active: bool, workspace_ids: FrozenSet[str]):
+        self.user_id = user_id
+        self.email = email
+        self.full_name = full_name
+        self.is_active = is_active
+        self.workspace_ids = workspace_ids
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "email": self.email,
+            "full_name": self.full_name,
+            "is_active": self.is_active,
+            "workspace_ids": sorted(self.workspace_ids)
+        })
+
+    @classmethod
+    def from_json(cls, user_id: str, raw: str) -> "Principal":
+        data = json.loads(raw)
+        return cls(user_id, data["email"], data["full_name"], data["is_active"], frozenset(data["workspace_ids"]))
+
+
+class PrincipalCache:
+    """
+    TTL'd user -> Principal cache shared by every WebSocket handshake on the node.
+
+    Lookups go to an in-process LRU first, then to Redis (when connected), and only
+    then to PostgreSQL. Concurrent misses for the same user share one load, so a
+    reconnect storm costs one query per distinct user rather than one per socket.
+    A refresh within miss_ttl of the last load reuses it, so retried handshakes for
+    a workspace the user isn't in don't each query PostgreSQL.
+    """
+
+    def __init__(
+        self,
+        ttl: int = settings.PRINCIPAL_CACHE_TTL,
+        size: int = settings.PRINCIPAL_CACHE_SIZE,
+        miss_ttl: int = settings.PRINCIPAL_CACHE_MISS_TTL
+    ):
+        self.ttl = ttl
+        self.size = size
+        self.miss_ttl = miss_ttl
+        self.redis = None
+        # user_id -> (monotonic expiry, principal or None for unknown users, monotonic time
+        # it was read from PostgreSQL or None for copies from Redis)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Principal], Optional[float]]]" = OrderedDict()
+        # (user_id, refresh) -> load in progress
+        self._inflight: Dict[Tuple[str, bool], asyncio.Task] = {}
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"principal:{user_id}"
+
+    async def get(self, user_id: str, refresh: bool = False) -> Optional[Principal]:
+        """
+        Resolve a user's principal.
+
+        Args:
+            refresh: Skip the cached copies and reload from PostgreSQL, unless this
+                node read the user from PostgreSQL in the last miss_ttl seconds
+
+        Returns:
+            The principal, or None if the user does not exist
+        """
+        entry = self._entries.get(user_id)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            _, principal, checked = entry
+            # A refresh reuses this node's PostgreSQL read from the last miss_ttl seconds
+            if not refresh or (checked is not None and now - checked < self.miss_ttl):
+                self._entries.move_to_end(user_id)
+                return principal
+
+        key = (user_id, refresh)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(user_id, refresh))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one cancelled handshake doesn't fail everyone waiting on the load
+        return await asyncio.shield(task)
+
+    async def invalidate(self, user_id: str):
+        """Forget a user's principal, e.g. after their account or memberships changed."""
+        self._entries.pop(user_id, None)
+        if self.redis:
+            await self.redis.delete(self._key(user_id))
+
+    def _store(self, user_id: str, principal: Optional[Principal], checked: Optional[float] = None):
+        self._entries[user_id] = (time.monotonic() + self.ttl, principal, checked)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    async def _load(self, user_id: str, refresh: bool) -> Optional[Principal]:
+        if self.redis and not refresh:
+            try:
+                raw = await self.redis.get(self._key(user_id))
+                if raw:
+                    principal = Principal.from_json(user_id, raw)
+                    self._store(user_id, principal)
+                    return principal
+            except Exception as e:
+                print(f"Principal cache error: {e}")
+
+        # One round trip for the user and all of their workspace memberships
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(User.email, User.full_name, User.is_active, UserWorkspace.workspace_id)
+                .outerjoin(UserWorkspace, UserWorkspace.user_id == User.id)
+                .where(User.id == user_id)
+            )
+            rows = result.all()
+
+        principal = None
+        if rows:
+            email, full_name, is_active = rows[0][:3]
+            workspace_ids = frozenset(row.workspace_id for row in rows if row.workspace_id)
+            principal = Principal(user_id, email, full_name, is_active, workspace_ids)
+        self._store(user_id, principal, checked=time.monotonic())
+
+        if self.redis and principal is not None:
+            try:
+                await self.redis.set(self._key(user_id), principal.to_json(), ex=self.ttl)
+            except Exception as e:
+                print(f"Principal cache error: {e}")
+        return principal
+
+
+principal_cache = PrincipalCache()
+
+
+async def authenticate_websocket(token: Optional[str], workspace_id: str) -> Optional[Principal]:
+    """
+    Authenticate a WebSocket handshake from its access token.
+
+    Returns:
+        The principal if the token is a valid access token for an active member
+        of the workspace, otherwise None
+    """
+    if not token:
+        return None
+    try:
+        payload = decode_token(token)
+        verify_token_type(payload, "access")
+    except HTTPException:
+        return None
+
+    user_id = payload.get("sub")
+    if not user_id:
+        return None
+
+    principal = await principal_cache.get(user_id)
+    if principal is not None and workspace_id not in principal.workspace_ids:
+        # May have joined since the principal was cached
+        principal = await principal_cache.get(user_id, refresh=True)
+    if principal is None or not principal.is_active or workspace_id not in principal.workspace_ids:
+        return None
+    return principal
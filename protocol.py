@@ -0,0 +1,131 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+from datetime import datetime, timezone
+from fastapi import WebSocket, WebSocketDisconnect
+import json
+import struct
+import zlib
+
+from app.core.config import settings
+from app.websocket.events import EVENT_TYPE_CODES, Frame
+
+try:
+    import msgpack
+except ImportError:  # Binary protocol is optional
+    msgpack = None
+
+JSON_SUBPROTOCOL = "fct.json.v1"
+MSGPACK_SUBPROTOCOL = "fct.msgpack.v1"
+
+# First byte of every server -> client binary frame
+FLAG_RAW = b"\x00"
+FLAG_DEFLATE = b"\x01"
+
+
+class JsonCodec:
+    """The original wire format: one JSON text frame per event."""
+    subprotocol = JSON_SUBPROTOCOL
+
+    async def send(self, websocket: WebSocket, frame: Frame):
+        await websocket.send_text(frame.text)
+
+    async def send_batch(self, websocket: WebSocket, frames: List[Frame]):
+        await websocket.send_text("[" + ",".join(frame.text for frame in frames) + "]")
+
+    def decode(self, payload: Union[str, bytes]) -> Dict[str, Any]:
+        return json.loads(payload)
+
+
+class MsgpackCodec:
+    """
+    Compact binary wire format.
+
+    Each event is packed as [type, data, workspace_id, timestamp_ms, seq] where
+    type is the integer code from EVENT_TYPE_CODES (or the type string for types
+    without one). Frames are packed once and the result is cached on the Frame,
+    so every recipient on the node shares the same bytes. Payloads of at least
+    WS_COMPRESSION_MIN_BYTES are deflated; the leading flag byte says which.
+    """
+    subprotocol = MSGPACK_SUBPROTOCOL
+
+    def __init__(self, compression_min_bytes: int = settings.WS_COMPRESSION_MIN_BYTES):
+        self.compression_min_bytes = compression_min_bytes
+
+    @staticmethod
+    def pack_event(event: Dict[str, Any]) -> bytes:
+        event_type = event.get("type")
+        timestamp = event.get("timestamp")
+        if timestamp:
+            parsed = datetime.fromisoformat(timestamp)
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            timestamp = int(parsed.timestamp() * 1000)
+        return msgpack.packb(
+            [
+                EVENT_TYPE_CODES.get(event_type, event_type),
+                event.get("data"),
+                event.get("workspace_id"),
+                timestamp,
+                event.get("seq")
+            ],
+            use_bin_type=True
+        )
+
+    def _packed(self, frame: Frame) -> bytes:
+        if frame.packed is None:
+            frame.packed = self.pack_event(json.loads(frame.text))
+        return frame.packed
+
+    def _wrap(self, body: bytes) -> bytes:
+        if len(body) >= self.compression_min_bytes:
+            return FLAG_DEFLATE + zlib.compress(body, settings.WS_COMPRESSION_LEVEL)
+        return FLAG_RAW + body
+
+    def encode(self, frame: Frame) -> bytes:
+        if frame.binary is None:
+            frame.binary = self._wrap(self._packed(frame))
+        return frame.binary
+
+    async def send(self, websocket: WebSocket, frame: Frame):
+        await websocket.send_bytes(self.encode(frame))
+
+    async def send_batch(self, websocket: WebSocket, frames: List[Frame]):
+        # A msgpack array is its header followed by the already-packed elements
+        count = len(frames)
+        header = bytes([0x90 | count]) if count < 16 else b"\xdc" + struct.pack(">H", count)
+        await websocket.send_bytes(self._wrap(header + b"".join(self._packed(frame) for frame in frames)))
+
+    def decode(self, payload: Union[str, bytes]) -> Dict[str, Any]:
+        if isinstance(payload, str):
+            # Clients may still send plain JSON text frames
+            return json.loads(payload)
+        return msgpack.unpackb(payload, raw=False)
+
+
+json_codec = JsonCodec()
+
+
+def negotiate(websocket: WebSocket) -> Tuple[Union[JsonCodec, MsgpackCodec], Optional[str]]:
+    """
+    Pick a codec from the subprotocols the client offered.
+
+    Returns:
+        The codec and the subprotocol to accept with (None if the client offered
+        none we speak, in which case it gets plain JSON)
+    """
+    offered = websocket.scope.get("subprotocols") or []
+    if msgpack is not None and MSGPACK_SUBPROTOCOL in offered:
+        return MsgpackCodec(), MSGPACK_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return json_codec, JSON_SUBPROTOCOL
+    return json_codec, None
+
+
+async def receive_event(websocket: WebSocket, codec: Union[JsonCodec, MsgpackCodec]) -> Dict[str, Any]:
+    """Receive one client frame in whichever format the connection speaks."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    payload = message.get("bytes")
+    if payload is None:
+        payload = message.get("text")
+    return codec.decode(payload)
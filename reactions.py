@@ -0,0 +1,114 @@
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+
+from app.core.config import settings
+from app.websocket.events import create_reaction_counts_event
+
+
+class _HotMessage:
+    __slots__ = ("workspace_id", "channel_id", "counts", "version", "dirty", "first_version", "folded")
+
+    def __init__(self, workspace_id: str, channel_id: Optional[str]):
+        self.workspace_id = workspace_id
+        self.channel_id = channel_id
+        self.counts: Dict[str, int] = {}
+        self.version = 0
+        # Changed since the last reaction.counts
+        self.dirty = False
+        # Lowest version and number of changes folded in since the last reaction.counts
+        self.first_version: Optional[int] = None
+        self.folded = 0
+
+
+class ReactionAggregator:
+    """
+    Publish reaction deltas, coalescing them for hot messages.
+
+    A message that gets more than WS_REACTION_HOT_THRESHOLD reaction changes on
+    this node within one WS_REACTION_FLUSH_INTERVAL is hot: instead of a
+    reaction.added/removed per click, the flush loop publishes one
+    reaction.counts per interval with every emoji's count at the newest version
+    seen. A hot message that goes a whole interval without changes cools down
+    and gets individual deltas again.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[dict, Optional[str]], Awaitable[None]],
+        threshold: int = settings.WS_REACTION_HOT_THRESHOLD,
+        interval: float = settings.WS_REACTION_FLUSH_INTERVAL
+    ):
+        self.publish = publish
+        self.threshold = threshold
+        self.interval = interval
+        # message_id -> changes seen in the current interval
+        self._recent: Dict[str, int] = {}
+        self._hot: Dict[str, _HotMessage] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the periodic flush loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def record(self, event: dict, counts: Dict[str, int]):
+        """
+        Publish a reaction delta, or fold it into the next reaction.counts if its message is hot.
+
+        Args:
+            counts: The message's count per emoji after the change
+        """
+        data = event["data"]
+        message_id = data["message_id"]
+        hot = self._hot.get(message_id)
+        if hot is None:
+            changes = self._recent.get(message_id, 0) + 1
+            self._recent[message_id] = changes
+            if changes <= self.threshold:
+                await self.publish(event, data.get("channel_id"))
+                return
+            hot = self._hot[message_id] = _HotMessage(event["workspace_id"], data.get("channel_id"))
+        if hot.first_version is None or data["version"] < hot.first_version:
+            hot.first_version = data["version"]
+        hot.folded += 1
+        # Concurrent requests can finish out of order; keep the newest snapshot
+        if data["version"] > hot.version:
+            hot.counts = counts
+            hot.version = data["version"]
+            hot.dirty = True
+
+    async def flush(self):
+        """Send one reaction.counts per hot message that changed, and cool down the rest."""
+        self._recent.clear()
+        for message_id, hot in list(self._hot.items()):
+            if not hot.dirty:
+                del self._hot[message_id]
+                continue
+            hot.dirty = False
+            # When every version skipped since the last update was folded in here, readers
+            # holding base_version or newer know they missed nothing but reactions
+            base_version = None
+            if hot.version - hot.first_version + 1 == hot.folded:
+                base_version = hot.first_version - 1
+            hot.first_version = None
+            hot.folded = 0
+            event = create_reaction_counts_event(
+                message_id, hot.channel_id, hot.counts, hot.version, hot.workspace_id, base_version
+            )
+            await self.publish(event, hot.channel_id)
+
+    async def _run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.flush()
+                except Exception as e:
+                    print(f"Reaction flush error: {e}")
+        except asyncio.CancelledError:
+            pass
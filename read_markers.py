@@ -0,0 +1,226 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+from pymongo import UpdateOne
+import asyncio
+
+from app.core.config import settings
+from app.db.mongodb import get_mongo_db
+
+LOADED_MARKER = "_loaded"
+
+
+class ReadMarkers:
+    """
+    Per-user read positions and unread/mention counts, kept in Redis.
+
+    Every channel message gets a channel_seq from a counter per channel, so a
+    user's unread count is the channel's latest seq minus their read seq; sending
+    a message is one HINCRBY no matter how many members the channel has. Read
+    positions live in a sorted set per user (channel -> seq, only ever moved
+    forward with ZADD GT) and mentions in a sorted set per user and channel that
+    is trimmed as the user reads. Marker changes are written back to MongoDB
+    every READ_MARKER_PERSIST_INTERVAL and reloaded from there when a user's
+    markers are missing from Redis.
+    """
+
+    def __init__(self):
+        self.redis = None
+        # (user_id, channel_id) -> (seq, message_id) not yet written to MongoDB
+        self._unsaved: Dict[Tuple[str, str], Tuple[int, str]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _heads_key(workspace_id: str) -> str:
+        return f"channel_seqs:{workspace_id}"
+
+    @staticmethod
+    def _seqs_key(user_id: str) -> str:
+        return f"read_seqs:{user_id}"
+
+    @staticmethod
+    def _ids_key(user_id: str) -> str:
+        return f"read_ids:{user_id}"
+
+    @staticmethod
+    def _mentions_key(user_id: str, channel_id: str) -> str:
+        return f"mentions:{user_id}:{channel_id}"
+
+    def start(self, redis_client):
+        """Start the periodic write-back to MongoDB."""
+        self.redis = redis_client
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.persist()
+
+    async def next_seq(self, workspace_id: str, channel_id: str) -> int:
+        """Allocate the next channel_seq for a new message."""
+        return await self.reserve_seqs(workspace_id, channel_id, 1)
+
+    async def reserve_seqs(self, workspace_id: str, channel_id: str, count: int) -> int:
+        """
+        Allocate count consecutive channel_seqs in one increment.
+
+        Returns:
+            The last seq of the range; the first is last - count + 1
+        """
+        key = self._heads_key(workspace_id)
+        if not await self.redis.hexists(key, channel_id):
+            # Either the channel's first messages or the counter was lost; resume after the last stored seq.
+            # HSETNX lets exactly one concurrent caller seed it, before anyone increments.
+            db = get_mongo_db()
+            last = await db.messages.find_one(
+                {"channel_id": channel_id, "channel_seq": {"$exists": True}},
+                projection={"channel_seq": 1},
+                sort=[("channel_seq", -1)]
+            )
+            await self.redis.hsetnx(key, channel_id, (last or {}).get("channel_seq") or 0)
+        return await self.redis.hincrby(key, channel_id, count)
+
+    async def record_message(
+        self, channel_id: str, message_id: str, seq: int, author_id: str, mentions: Iterable[str]
+    ):
+        """Count a new message's mentions and mark it read for its author."""
+        await self.record_messages(channel_id, [(message_id, seq, author_id, mentions)])
+
+    async def record_messages(self, channel_id: str, messages: List[Tuple[str, int, str, Iterable[str]]]):
+        """
+        Count mentions for a batch of new messages in one channel.
+
+        Args:
+            messages: (message_id, seq, author_id, mentions) for each message
+        """
+        latest_by_author: Dict[str, Tuple[int, str]] = {}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for message_id, seq, author_id, mentions in messages:
+                for user_id in set(mentions) - {author_id}:
+                    pipe.zadd(self._mentions_key(user_id, channel_id), {message_id: seq})
+                if author_id not in latest_by_author or latest_by_author[author_id][0] < seq:
+                    latest_by_author[author_id] = (seq, message_id)
+            if len(pipe):
+                await pipe.execute()
+        # Authors have read up to their own latest message
+        for author_id, (seq, message_id) in latest_by_author.items():
+            await self.mark_read(author_id, channel_id, message_id, seq)
+
+    async def mark_read(self, user_id: str, channel_id: str, message_id: str, seq: int) -> bool:
+        """
+        Move a user's read position in a channel forward to a message.
+
+        Returns:
+            False if the user had already read past it
+        """
+        # Load first so a fresh marker doesn't hide the user's other stored markers
+        await self._ensure_loaded(user_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            # GT keeps the marker monotonic when several devices report out of order
+            pipe.zadd(self._seqs_key(user_id), {channel_id: seq}, gt=True, ch=True)
+            pipe.zremrangebyscore(self._mentions_key(user_id, channel_id), "-inf", seq)
+            moved, _ = await pipe.execute()
+        if not moved:
+            return False
+
+        await self.redis.hset(self._ids_key(user_id), channel_id, f"{seq}:{message_id}")
+        current = self._unsaved.get((user_id, channel_id))
+        if current is None or current[0] < seq:
+            self._unsaved[(user_id, channel_id)] = (seq, message_id)
+        return True
+
+    async def counts(self, user_id: str, workspace_id: str, channel_ids: List[str]) -> List[dict]:
+        """Unread and mention counts for each of a user's channels, in one pipeline."""
+        if not channel_ids:
+            return []
+        await self._ensure_loaded(user_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hmget(self._heads_key(workspace_id), channel_ids)
+            pipe.zmscore(self._seqs_key(user_id), channel_ids)
+            pipe.hmget(self._ids_key(user_id), channel_ids)
+            for channel_id in channel_ids:
+                pipe.zcard(self._mentions_key(user_id, channel_id))
+            heads, read_seqs, read_ids, *mentions = await pipe.execute()
+
+        result = []
+        for i, channel_id in enumerate(channel_ids):
+            head = int(heads[i] or 0)
+            read_seq = int(read_seqs[i] or 0)
+            last_read = read_ids[i].split(":", 1)[1] if read_ids[i] else None
+            result.append({
+                "channel_id": channel_id,
+                "unread": max(0, head - read_seq),
+                "mentions": mentions[i],
+                "last_read_message_id": last_read
+            })
+        return result
+
+    async def _ensure_loaded(self, user_id: str):
+        """Reload a user's markers from MongoDB if Redis doesn't have them."""
+        if await self.redis.exists(self._seqs_key(user_id)):
+            return
+        db = get_mongo_db()
+        rows = await db.read_markers.find(
+            {"user_id": user_id},
+            projection={"channel_id": 1, "last_read_seq": 1, "last_read_message_id": 1}
+        ).to_list(length=None)
+        # The placeholder member keeps users without any markers from reloading on every call
+        seqs = {LOADED_MARKER: 0}
+        seqs.update({row["channel_id"]: row["last_read_seq"] for row in rows})
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(self._seqs_key(user_id), seqs, gt=True)
+            if rows:
+                pipe.hset(
+                    self._ids_key(user_id),
+                    mapping={
+                        row["channel_id"]: f"{row['last_read_seq']}:{row['last_read_message_id']}" for row in rows
+                    }
+                )
+            await pipe.execute()
+
+    async def persist(self):
+        """Write changed read markers back to MongoDB in one bulk write."""
+        if not self._unsaved:
+            return
+        unsaved, self._unsaved = self._unsaved, {}
+        now = datetime.utcnow()
+        operations = []
+        for (user_id, channel_id), (seq, message_id) in unsaved.items():
+            stored_seq = {"$ifNull": ["$last_read_seq", 0]}
+            # Pipeline update so the id only moves together with a higher seq (another node may be ahead)
+            operations.append(UpdateOne(
+                {"user_id": user_id, "channel_id": channel_id},
+                [{"$set": {
+                    "last_read_message_id": {
+                        "$cond": [{"$gt": [seq, stored_seq]}, message_id, "$last_read_message_id"]
+                    },
+                    "last_read_seq": {"$max": [stored_seq, seq]},
+                    "updated_at": now
+                }}],
+                upsert=True
+            ))
+        try:
+            db = get_mongo_db()
+            await db.read_markers.bulk_write(operations, ordered=False)
+        except Exception as e:
+            print(f"Read marker persist error: {e}")
+            # Keep the changes for the next attempt unless newer ones replaced them
+            for key, value in unsaved.items():
+                current = self._unsaved.get(key)
+                if current is None or current[0] < value[0]:
+                    self._unsaved[key] = value
+
+    async def _run(self):
+        try:
+            while True:
+                await asyncio.sleep(settings.READ_MARKER_PERSIST_INTERVAL)
+                try:
+                    await self.persist()
+                except Exception as e:
+                    print(f"Read marker persist error: {e}")
+        except asyncio.CancelledError:
+            pass
+
+
+read_markers = ReadMarkers()
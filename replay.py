@@ -0,0 +1,132 @@
+from typing import List, Optional, Tuple
+import asyncio
+
+from app.core.config import settings
+
+# One replayable event: (seq, channel_id, thread participant ids, encoded frame)
+ReplayEntry = Tuple[int, Optional[str], Optional[List[str]], str]
+
+
+class ReplayLog:
+    """
+    Sequenced, bounded per-workspace event log in Redis for resuming sessions.
+
+    Sequence numbers come from an INCR counter per workspace. Entries are kept in a
+    sorted set scored by sequence, capped at WS_REPLAY_LOG_SIZE, so concurrent
+    publishers on different nodes can append out of order without breaking range
+    reads. A number is allocated before its event is appended, so a reader can
+    briefly see a log with holes in it; since() waits those out.
+    """
+
+    # Between reads while waiting for allocated events to be appended
+    GAP_POLL_INTERVAL = 0.05
+
+    def __init__(
+        self,
+        redis_client,
+        size: int = settings.WS_REPLAY_LOG_SIZE,
+        gap_timeout: float = settings.WS_REPLAY_GAP_TIMEOUT
+    ):
+        self.redis = redis_client
+        self.size = size
+        self.gap_timeout = gap_timeout
+
+    @staticmethod
+    def _seq_key(workspace_id: str) -> str:
+        return f"ws_seq:{workspace_id}"
+
+    @staticmethod
+    def _log_key(workspace_id: str) -> str:
+        return f"ws_log:{workspace_id}"
+
+    async def next_seq(self, workspace_id: str) -> int:
+        """Allocate the next sequence number for a workspace."""
+        return await self.redis.incr(self._seq_key(workspace_id))
+
+    async def latest_seq(self, workspace_id: str) -> int:
+        """Get the last sequence number allocated for a workspace."""
+        return int(await self.redis.get(self._seq_key(workspace_id)) or 0)
+
+    def append(
+        self,
+        pipe,
+        workspace_id: str,
+        seq: int,
+        channel_id: Optional[str],
+        text: str,
+        participant_ids: Optional[List[str]] = None
+    ):
+        """
+        Queue the commands that store an event and trim the log onto a pipeline.
+
+        Args:
+            participant_ids: For thread events, the users the event is replayed to
+        """
+        key = self._log_key(workspace_id)
+        route = channel_id or ""
+        if participant_ids is not None:
+            route = f"{route}\t{','.join(participant_ids)}"
+        pipe.zadd(key, {f"{route}\n{text}": seq})
+        pipe.zremrangebyrank(key, 0, -(self.size + 1))
+        pipe.expire(key, settings.WS_REPLAY_TTL)
+
+    async def since(self, workspace_id: str, after_seq: int) -> Optional[List[ReplayEntry]]:
+        """
+        Get every event with a sequence number greater than after_seq.
+
+        Numbers allocated but not logged yet (a publish in flight) are waited for
+        up to gap_timeout.
+
+        Returns:
+            The entries in order, or None if some of them were trimmed from the
+            log or never showed up, and the client has to resync from scratch
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.gap_timeout
+        while True:
+            entries = await self._read(workspace_id, after_seq)
+            if entries is not False:
+                return entries
+            if loop.time() >= deadline:
+                return None
+            await asyncio.sleep(self.GAP_POLL_INTERVAL)
+
+    async def _read(self, workspace_id: str, after_seq: int):
+        """One attempt at since(): the entries, None if they can't be replayed, or False if there are holes."""
+        key = self._log_key(workspace_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.get(self._seq_key(workspace_id))
+            pipe.zrange(key, 0, 0, withscores=True)
+            pipe.zrangebyscore(key, f"({after_seq}", "+inf", withscores=True)
+            current, oldest, entries = await pipe.execute()
+
+        current = int(current or 0)
+        if after_seq > current:
+            # The counter was reset under the client
+            return None
+        if after_seq == current:
+            return []
+        if oldest and int(oldest[0][1]) > after_seq + 1:
+            # Trimmed; waiting won't bring these back
+            return None
+
+        result = []
+        expected = after_seq + 1
+        for member, score in entries:
+            seq = int(score)
+            if seq > current:
+                # Logged after the counter was read
+                break
+            if seq != expected:
+                return False
+            route, text = member.split("\n", 1)
+            channel_id, thread_event, participants = route.partition("\t")
+            participant_ids = None
+            if thread_event:
+                participant_ids = participants.split(",") if participants else []
+            result.append((seq, channel_id or None, participant_ids, text))
+            expected += 1
+        if expected <= current:
+            # The newest events are allocated but not logged yet
+            return False
+        return result
@@ -0,0 +1,87 @@
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.endpoints import messages
+from app.api.v1.endpoints.messages import _bulk_items, _parse_bulk_item
+
+
+class FakeRequest:
+    def __init__(self, chunks, content_type="application/x-ndjson", content_length=None):
+        self.chunks = chunks
+        self.headers = {"content-type": content_type}
+        if content_length is not None:
+            self.headers["content-length"] = str(content_length)
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(messages.settings, "BULK_INGEST_MAX_BYTES", 1000)
+    monkeypatch.setattr(messages.settings, "BULK_INGEST_MAX_LINE_BYTES", 100)
+
+
+async def collect(request):
+    return [(index, json.loads(raw) if isinstance(raw, bytes) else raw) async for index, raw in _bulk_items(request)]
+
+
+async def test_ndjson_lines_split_across_chunks():
+    request = FakeRequest([b'{"a": 1}\n{"a"', b': 2}\n\n{"a": 3}'])
+    assert await collect(request) == [(0, {"a": 1}), (1, {"a": 2}), (2, {"a": 3})]
+
+
+async def test_ndjson_long_line_is_rejected():
+    request = FakeRequest([b'{"a": 1}\n', b"x" * 60, b"x" * 60])
+    with pytest.raises(HTTPException) as error:
+        await collect(request)
+    assert error.value.status_code == 413
+
+
+async def test_ndjson_long_line_within_one_chunk_is_rejected():
+    request = FakeRequest([b"x" * 150 + b"\n"])
+    with pytest.raises(HTTPException) as error:
+        await collect(request)
+    assert error.value.status_code == 413
+
+
+async def test_ndjson_body_over_limit_is_rejected():
+    request = FakeRequest([b'{"a": 1}\n' * 50] * 3)
+    with pytest.raises(HTTPException) as error:
+        await collect(request)
+    assert error.value.status_code == 413
+
+
+async def test_json_array_body():
+    request = FakeRequest([b'[{"a": 1},', b' {"a": 2}]'], content_type="application/json")
+    assert await collect(request) == [(0, {"a": 1}), (1, {"a": 2})]
+
+
+async def test_content_length_checked_before_reading():
+    request = FakeRequest([], content_type="application/json", content_length=5000)
+    with pytest.raises(HTTPException) as error:
+        await collect(request)
+    assert error.value.status_code == 413
+
+
+async def test_json_body_over_limit_without_content_length():
+    request = FakeRequest([b"[" + b"1," * 600 + b"1]"], content_type="application/json")
+    with pytest.raises(HTTPException) as error:
+        await collect(request)
+    assert error.value.status_code == 413
+
+
+async def test_ndjson_timestamps_become_naive_utc():
+    request = FakeRequest([
+        b'{"channel_id": "c", "content": "a", "created_at": "2024-01-01T12:00:00Z"}\n'
+        b'{"channel_id": "c", "content": "b", "created_at": "2024-01-01T12:00:00+02:00"}\n'
+        b'{"channel_id": "c", "content": "c", "created_at": "2024-01-01T11:00:00"}'
+    ])
+    created = [_parse_bulk_item(raw).created_at async for _, raw in _bulk_items(request)]
+    assert created == [datetime(2024, 1, 1, 12), datetime(2024, 1, 1, 10), datetime(2024, 1, 1, 11)]
+    # Comparable with each other and with utcnow(), as thread summaries need
+    assert max(created + [datetime.utcnow()]) > created[0]
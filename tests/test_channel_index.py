@@ -0,0 +1,73 @@
+from app.websocket.channel_index import ChannelRoutingIndex
+from app.websocket.connection_state import ConnectionState
+from app.websocket.outbound import OutboundQueue
+
+
+def connection(user_id: str, workspace_id: str = "ws") -> ConnectionState:
+    return ConnectionState(object(), user_id, workspace_id, OutboundQueue(10))
+
+
+def loaded_index(rows):
+    index = ChannelRoutingIndex()
+
+    async def fetch(_):
+        return rows
+
+    index._fetch = fetch
+    return index
+
+
+async def test_routes_to_online_members_only():
+    index = loaded_index([("general", "alice"), ("general", "bob"), ("random", "carol")])
+    alice, carol = connection("alice"), connection("carol")
+    index.add_connection(alice)
+    index.add_connection(carol)
+    await index.ensure_loaded("ws")
+
+    assert index.connections_for_channel("ws", "general") == [alice]
+    assert index.is_member("ws", "general", "bob") is True
+    assert index.is_member("ws", "random", "alice") is False
+
+
+async def test_membership_changes_apply_after_load():
+    index = loaded_index([("general", "alice")])
+    alice = connection("alice")
+    index.add_connection(alice)
+    await index.ensure_loaded("ws")
+
+    index.remove_member("ws", "general", "alice")
+    assert index.connections_for_channel("ws", "general") == []
+    index.add_member("ws", "general", "alice")
+    assert index.connections_for_channel("ws", "general") == [alice]
+
+
+async def test_unknown_until_loaded():
+    index = loaded_index([])
+    index.add_connection(connection("alice"))
+    assert index.is_member("ws", "general", "alice") is None
+    assert index.connections_for_channel("ws", "general") is None
+
+
+async def test_last_connection_releases_interned_users():
+    index = loaded_index([("general", f"user-{i}") for i in range(100)])
+    alice = connection("user-0")
+    index.add_connection(alice)
+    await index.ensure_loaded("ws")
+    assert len(index._user_ids["ws"]) == 100
+
+    index.remove_connection(alice)
+    assert index._user_ids == {}
+    assert index._channel_members == {}
+    assert not index.is_loaded("ws")
+
+
+async def test_intern_tables_are_per_workspace():
+    index = loaded_index([("general", "alice")])
+    index.add_connection(connection("alice", "ws"))
+    other = connection("alice", "other")
+    index.add_connection(other)
+    await index.ensure_loaded("ws")
+
+    index.remove_connection(other)
+    assert "other" not in index._user_ids
+    assert index.is_member("ws", "general", "alice") is True
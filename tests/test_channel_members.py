@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.endpoints import channels
+from app.models.channel import ChannelRole
+from app.models.user import UserRole
+
+CHANNEL = SimpleNamespace(id="general", workspace_id="ws")
+MEMBER = object()
+
+
+class Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar_one_or_none(self):
+        return self.value
+
+
+class Session:
+    """Answers each execute() with the next queued value."""
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.deleted = []
+
+    async def execute(self, statement):
+        return Result(self.values.pop(0))
+
+    async def delete(self, row):
+        self.deleted.append(row)
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def membership_events(monkeypatch):
+    events = []
+
+    async def update_channel_membership(*args, **kwargs):
+        events.append(args)
+
+    monkeypatch.setattr(channels.manager, "update_channel_membership", update_channel_membership)
+    return events
+
+
+def user(user_id: str):
+    return SimpleNamespace(id=user_id)
+
+
+async def test_members_can_leave():
+    db = Session(CHANNEL, MEMBER)
+    assert await channels.remove_channel_member("general", "alice", user("alice"), db) == {"status": "removed"}
+    assert db.deleted == [MEMBER]
+
+
+async def test_members_cannot_remove_others(membership_events):
+    # Neither a channel admin nor a workspace admin
+    db = Session(CHANNEL, ChannelRole.MEMBER, UserRole.MEMBER, MEMBER)
+    with pytest.raises(HTTPException) as raised:
+        await channels.remove_channel_member("general", "bob", user("alice"), db)
+    assert raised.value.status_code == 403
+    assert db.deleted == []
+    assert membership_events == []
+
+
+async def test_outsiders_cannot_remove_members():
+    db = Session(CHANNEL, None, None, MEMBER)
+    with pytest.raises(HTTPException) as raised:
+        await channels.remove_channel_member("general", "bob", user("mallory"), db)
+    assert raised.value.status_code == 403
+
+
+@pytest.mark.parametrize("channel_role, workspace_role", [
+    (ChannelRole.ADMIN, None),
+    (ChannelRole.MEMBER, UserRole.ADMIN),
+    (None, UserRole.OWNER)
+])
+async def test_admins_can_remove_others(channel_role, workspace_role):
+    values = [CHANNEL, channel_role] + ([workspace_role] if channel_role != ChannelRole.ADMIN else []) + [MEMBER]
+    db = Session(*values)
+    await channels.remove_channel_member("general", "bob", user("alice"), db)
+    assert db.deleted == [MEMBER]
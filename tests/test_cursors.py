@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.api.v1.endpoints.messages import decode_cursor, encode_cursor, history_query
+
+
+def test_cursor_round_trip_keeps_millisecond_and_id():
+    message = {"_id": ObjectId(), "created_at": datetime(2024, 5, 1, 12, 30, 15, 123456)}
+    created_at, message_id = decode_cursor(encode_cursor(message))
+    assert created_at == datetime(2024, 5, 1, 12, 30, 15, 123000)
+    assert message_id == message["_id"]
+
+
+@pytest.mark.parametrize("cursor", ["", "abc", "123", "123_nothex", "x_5f1c0d7e9b1e8a0012345678"])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_first_page_is_newest_first_on_the_channel_index():
+    query, sort = history_query("ws", "ch", None)
+    assert query == {"workspace_id": "ws", "channel_id": "ch", "thread_id": None}
+    assert sort == [("created_at", -1), ("_id", -1)]
+
+
+def test_dm_history_filters_on_dm_and_leaves_out_replies():
+    query, _ = history_query("ws", None, "dm")
+    assert query == {"workspace_id": "ws", "dm_id": "dm", "thread_id": None}
+
+
+def test_before_excludes_cursor_and_newer_messages_in_the_same_millisecond():
+    created_at, message_id = datetime(2024, 1, 1), ObjectId()
+    query, sort = history_query("ws", "ch", None, (created_at, message_id))
+    assert query["created_at"] == {"$lte": created_at}
+    assert query["$nor"] == [{"created_at": created_at, "_id": {"$gte": message_id}}]
+    assert sort == [("created_at", -1), ("_id", -1)]
+
+
+def test_after_pages_oldest_first():
+    created_at, message_id = datetime(2024, 1, 1), ObjectId()
+    query, sort = history_query("ws", "ch", None, (created_at, message_id), older=False)
+    assert query["created_at"] == {"$gte": created_at}
+    assert query["$nor"] == [{"created_at": created_at, "_id": {"$lte": message_id}}]
+    assert sort == [("created_at", 1), ("_id", 1)]
+
+
+def test_inclusive_keeps_the_cursor_message():
+    created_at, message_id = datetime(2024, 1, 1), ObjectId()
+    query, _ = history_query("ws", "ch", None, (created_at, message_id), inclusive=True)
+    assert query["$nor"] == [{"created_at": created_at, "_id": {"$gt": message_id}}]
+
+
+def test_keyset_pages_cover_every_message_once():
+    start = datetime(2024, 1, 1)
+    # Three messages per millisecond, so pages split ties
+    messages = [
+        {"_id": ObjectId(), "created_at": start + timedelta(milliseconds=i // 3)} for i in range(20)
+    ]
+    key = lambda message: (message["created_at"], message["_id"])
+
+    def run(cursor):
+        query, _ = history_query("ws", "ch", None, cursor)
+        bound = query.get("created_at", {}).get("$lte")
+        excluded = query.get("$nor", [{}])[0]
+        rows = [
+            m for m in messages
+            if (bound is None or m["created_at"] <= bound)
+            and not (excluded and m["created_at"] == excluded["created_at"] and m["_id"] >= excluded["_id"]["$gte"])
+        ]
+        return sorted(rows, key=key, reverse=True)[:4]
+
+    seen = []
+    cursor = None
+    while True:
+        page = run(cursor)
+        if not page:
+            break
+        seen += page
+        cursor = decode_cursor(encode_cursor(page[-1]))
+    assert seen == sorted(messages, key=key, reverse=True)
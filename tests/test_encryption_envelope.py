@@ -0,0 +1,67 @@
+import os
+
+import pytest
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from app.core import encryption as encryption_module
+from app.core.encryption import ENVELOPE_HEADER, ENVELOPE_V2, NONCE_SIZE, encryption
+from app.core.workspace_keys import DataKey
+
+
+def test_v2_envelope_layout_and_round_trip():
+    envelope = encryption.encrypt("hello ✓", version=2)
+    assert isinstance(envelope, bytes)
+    assert ENVELOPE_HEADER.unpack_from(envelope) == (ENVELOPE_V2, encryption.key_id)
+    # header + nonce + ciphertext + 16-byte tag
+    assert len(envelope) == ENVELOPE_HEADER.size + NONCE_SIZE + len("hello ✓".encode()) + 16
+    assert encryption.decrypt(envelope) == "hello ✓"
+
+
+def test_v1_text_still_decrypts():
+    ciphertext = encryption.encrypt("legacy", version=1)
+    assert isinstance(ciphertext, str)
+    assert encryption.is_legacy(ciphertext)
+    assert encryption.key_id_of(ciphertext) is None
+    assert encryption.decrypt(ciphertext) == "legacy"
+
+
+def test_empty_content():
+    assert encryption.encrypt("", version=2) == ""
+    assert encryption.decrypt("") == ""
+    assert encryption.decrypt(b"") == ""
+
+
+def test_nonces_are_unique():
+    assert encryption.encrypt("same", version=2) != encryption.encrypt("same", version=2)
+
+
+@pytest.mark.parametrize("position", [0, 3, ENVELOPE_HEADER.size + 1, -1])
+def test_tampering_is_detected(position):
+    envelope = bytearray(encryption.encrypt("secret", version=2))
+    envelope[position] ^= 0x01
+    with pytest.raises(ValueError):
+        encryption.decrypt(bytes(envelope))
+
+
+def test_workspace_key_envelope_needs_its_key():
+    key = DataKey(123456, AESGCM(AESGCM.generate_key(bit_length=256)))
+    envelope = encryption.encrypt("workspace secret", version=2, key=key)
+    assert encryption.key_id_of(envelope) == 123456
+    with pytest.raises(ValueError):
+        encryption.decrypt(envelope)
+    assert encryption.decrypt(envelope, keys={123456: key.aead}) == "workspace secret"
+
+
+async def test_decrypt_batch_keeps_order_across_workers(monkeypatch):
+    monkeypatch.setattr(encryption_module.settings, "ENCRYPTION_INLINE_BATCH", 2)
+    plaintexts = [f"message {i} " + os.urandom(4).hex() for i in range(25)]
+    ciphertexts = await encryption.encrypt_batch(plaintexts, version=2)
+    assert await encryption.decrypt_batch(ciphertexts) == plaintexts
+
+
+async def test_decrypt_batch_caches_by_key():
+    ciphertexts = [encryption.encrypt("cached", version=2)]
+    cache_key = ("message-id", 1)
+    assert await encryption.decrypt_batch(ciphertexts, keys=[cache_key]) == ["cached"]
+    # A cached plaintext is served without decrypting again
+    assert await encryption.decrypt_batch([b"garbage"], keys=[cache_key]) == ["cached"]
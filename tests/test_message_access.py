@@ -0,0 +1,103 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.api.v1.endpoints import messages
+
+CHANNEL_MESSAGE, DM_MESSAGE = ObjectId(), ObjectId()
+DOCS = [
+    {"_id": CHANNEL_MESSAGE, "workspace_id": "ws", "channel_id": "general", "dm_id": None},
+    {"_id": DM_MESSAGE, "workspace_id": "ws", "channel_id": None, "dm_id": "dm-1"}
+]
+ALICE = SimpleNamespace(id="alice")
+
+
+class Messages:
+    async def find_one(self, query, **kwargs):
+        for doc in DOCS:
+            if doc["_id"] == query["_id"] and doc["workspace_id"] == query["workspace_id"]:
+                return {
+                    **doc, "user_id": "bob", "content": "secret", "thread_id": None,
+                    "attachments": [], "reactions": [], "created_at": datetime(2024, 1, 1)
+                }
+        return None
+
+
+class Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar_one_or_none(self):
+        return self.value
+
+
+class Session:
+    """Answers the membership query with member_id (None for not a member)."""
+
+    def __init__(self, member_id):
+        self.member_id = member_id
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return Result(self.member_id)
+
+
+@pytest.fixture(autouse=True)
+def mongo(monkeypatch):
+    db = SimpleNamespace(messages=Messages())
+    monkeypatch.setattr(messages, "get_mongo_db", lambda: db)
+    decrypted = []
+
+    async def decrypt_all(docs):
+        decrypted.extend(docs)
+        for doc in docs:
+            doc["id"] = str(doc["_id"])
+
+    monkeypatch.setattr(messages, "_decrypt_all", decrypt_all)
+    return decrypted
+
+
+@pytest.mark.parametrize("message_id", [CHANNEL_MESSAGE, DM_MESSAGE])
+async def test_members_can_read_a_message(message_id):
+    session = Session("membership")
+    message = await messages.get_message(str(message_id), "ws", ALICE, session)
+    assert message.id == str(message_id)
+    assert len(session.statements) == 1
+
+
+@pytest.mark.parametrize("message_id", [CHANNEL_MESSAGE, DM_MESSAGE])
+async def test_non_members_get_not_found(mongo, message_id):
+    with pytest.raises(HTTPException) as raised:
+        await messages.get_message(str(message_id), "ws", ALICE, Session(None))
+    assert raised.value.status_code == 404
+    assert mongo == []
+
+
+async def test_other_workspaces_get_not_found(mongo):
+    session = Session("membership")
+    with pytest.raises(HTTPException) as raised:
+        await messages.get_message(str(CHANNEL_MESSAGE), "other-ws", ALICE, session)
+    assert raised.value.status_code == 404
+    assert session.statements == []
+
+
+async def test_replies_need_membership_of_the_parents_conversation(mongo, monkeypatch):
+    queries = []
+
+    async def fetch_history(query, sort, limit):
+        queries.append(query)
+        return [], False
+
+    monkeypatch.setattr(messages, "_fetch_history", fetch_history)
+    with pytest.raises(HTTPException) as raised:
+        await messages.get_replies(str(DM_MESSAGE), "ws", 50, None, ALICE, Session(None))
+    assert raised.value.status_code == 404
+    assert queries == []
+
+    page = await messages.get_replies(str(DM_MESSAGE), "ws", 50, None, ALICE, Session("membership"))
+    assert page.messages == []
+    assert queries == [{"thread_id": str(DM_MESSAGE), "workspace_id": "ws"}]
@@ -0,0 +1,268 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.websocket.message_cache import MessageCache
+
+START = datetime(2024, 1, 1)
+
+
+def message(minute: int, **fields) -> dict:
+    _id = ObjectId()
+    return {
+        "_id": _id,
+        "id": str(_id),
+        "workspace_id": "ws",
+        "channel_id": "ch",
+        "user_id": "alice",
+        "content": f"message {minute}",
+        "reactions": [],
+        "version": 1,
+        "created_at": START + timedelta(minutes=minute),
+        **fields
+    }
+
+
+def history(count: int):
+    """Newest first, like a history page."""
+    return [message(minute) for minute in reversed(range(count))]
+
+
+@pytest.fixture
+def subscribed():
+    return {"ws"}
+
+
+@pytest.fixture
+def cache(subscribed):
+    cache = MessageCache(lambda workspace_id: workspace_id in subscribed)
+    cache.channel_messages = 5
+    cache.max_channels = 3
+    cache.max_bytes = 10 ** 9
+    cache.ttl = 60
+    return cache
+
+
+def filled(cache, messages, has_more=False, channel_id="ch"):
+    token = cache.begin_fill("ws", channel_id)
+    cache.fill(token, "ws", channel_id, messages, has_more)
+    return cache
+
+
+def contents(page):
+    return [cached["content"] for cached in page]
+
+
+def test_miss_then_hit(cache):
+    assert cache.get("ws", "ch", 3) is None
+    messages = history(4)
+    filled(cache, messages)
+    page, has_more = cache.get("ws", "ch", 3)
+    assert contents(page) == contents(messages[:3])
+    assert has_more
+
+
+def test_fill_keeps_only_newest_messages(cache):
+    filled(cache, history(8))
+    page, has_more = cache.get("ws", "ch", 5)
+    assert contents(page) == ["message 7", "message 6", "message 5", "message 4", "message 3"]
+    assert has_more
+
+
+def test_larger_pages_bypass_the_cache(cache):
+    filled(cache, history(3))
+    assert cache.get("ws", "ch", 6) is None
+
+
+def test_unsubscribed_workspace_is_not_cached(cache, subscribed):
+    subscribed.clear()
+    filled(cache, history(3))
+    assert cache._entries == {}
+
+
+def test_change_during_fill_discards_it(cache):
+    token = cache.begin_fill("ws", "ch")
+    cache.apply("message.new", "ch", message(10))
+    cache.fill(token, "ws", "ch", history(3), False)
+    assert cache.get("ws", "ch", 3) is None
+
+
+def test_new_message_is_inserted_in_order(cache):
+    filled(cache, history(3))
+    new = message(9)
+    cache.apply("message.new", "ch", dict(new, _id=str(new["_id"]), created_at=new["created_at"].isoformat()))
+    page, _ = cache.get("ws", "ch", 5)
+    assert contents(page) == ["message 9", "message 2", "message 1", "message 0"]
+    assert isinstance(page[0]["_id"], ObjectId)
+
+
+def test_new_message_is_idempotent(cache):
+    filled(cache, history(2))
+    new = message(5)
+    cache.apply("message.new", "ch", new)
+    cache.apply("message.new", "ch", new)
+    assert len(cache.get("ws", "ch", 5)[0]) == 3
+
+
+def test_new_messages_push_out_the_oldest(cache):
+    filled(cache, history(5))
+    cache.apply("message.new", "ch", message(10))
+    page, has_more = cache.get("ws", "ch", 5)
+    assert contents(page)[-1] == "message 1"
+    assert has_more
+
+
+def test_deltas_apply_by_version(cache):
+    messages = history(2)
+    filled(cache, messages)
+    target = messages[0]["id"]
+    cache.apply("message.updated", "ch", {"message_id": target, "content": "edited", "is_edited": True, "version": 2})
+    # Stale or repeated deltas are ignored
+    cache.apply("message.updated", "ch", {"message_id": target, "content": "older", "version": 2})
+    page, _ = cache.get("ws", "ch", 2)
+    assert page[0]["content"] == "edited"
+    assert page[0]["is_edited"]
+
+    cache.apply("message.deleted", "ch", {"message_id": target, "version": 3})
+    assert cache.get("ws", "ch", 2)[0][0]["is_deleted"]
+
+
+def test_delta_without_version_invalidates(cache):
+    messages = history(2)
+    filled(cache, messages)
+    cache.apply("message.updated", "ch", {"message_id": messages[0]["id"], "content": "x"})
+    assert cache.get("ws", "ch", 2) is None
+
+
+def test_reaction_deltas(cache):
+    messages = history(1)
+    filled(cache, messages)
+    target = messages[0]["id"]
+    cache.apply("reaction.added", "ch", {"message_id": target, "emoji": "👍", "user_id": "bob", "count": 1, "version": 2})
+    cache.apply("reaction.added", "ch", {"message_id": target, "emoji": "👍", "user_id": "carol", "count": 2, "version": 3})
+    cache.apply("reaction.removed", "ch", {"message_id": target, "emoji": "👍", "user_id": "bob", "count": 1, "version": 4})
+    page, _ = cache.get("ws", "ch", 1)
+    assert page[0]["reactions"] == [{"emoji": "👍", "user_ids": ["carol"], "count": 1}]
+    # The caller's message dicts aren't shared with the cache
+    assert messages[0]["reactions"] == []
+
+
+def test_bulk_invalidates_channel(cache):
+    filled(cache, history(2))
+    cache.apply("message.bulk", "ch", {"channel_id": "ch", "count": 10})
+    assert cache.get("ws", "ch", 2) is None
+
+
+def test_published_events_are_only_parsed_for_cached_channels(cache):
+    filled(cache, history(1))
+    cache.apply_published("message.new", "other", "not json")
+    cache.apply_published("message.new", "ch", "not json")
+    assert cache.get("ws", "ch", 1) is None
+
+
+def test_expired_entries_miss(cache):
+    cache.ttl = -1
+    filled(cache, history(2))
+    assert cache.get("ws", "ch", 2) is None
+
+
+def test_least_recently_used_channel_is_evicted(cache):
+    for channel_id in ("a", "b", "c"):
+        filled(cache, history(1), channel_id=channel_id)
+    cache.get("ws", "a", 1)
+    filled(cache, history(1), channel_id="d")
+    assert cache.get("ws", "b", 1) is None
+    assert cache.get("ws", "a", 1) is not None
+
+
+def test_byte_budget_evicts(cache):
+    filled(cache, history(5), channel_id="a")
+    cache.max_bytes = cache._bytes + 100
+    filled(cache, history(5), channel_id="b")
+    assert cache.get("ws", "a", 1) is None
+    assert cache.get("ws", "b", 1) is not None
+
+
+def test_drop_workspace(cache):
+    filled(cache, history(2))
+    cache.drop_workspace("ws")
+    assert cache._entries == {}
+    assert cache._bytes == 0
+
+
+def test_reaction_counts_update_in_place_and_mark_users_stale(cache):
+    messages = history(2)
+    messages[0]["reactions"] = [{"emoji": "👍", "user_ids": ["bob"], "count": 1}]
+    filled(cache, messages)
+    target = messages[0]["id"]
+    counts = {"👍": 40, "🎉": 3}
+    cache.apply("reaction.counts", "ch", {"message_id": target, "counts": counts, "version": 5, "base_version": 1})
+
+    page, _ = cache.get("ws", "ch", 2)
+    assert page[0]["reactions"] == [
+        {"emoji": "👍", "user_ids": ["bob"], "count": 40},
+        {"emoji": "🎉", "user_ids": [], "count": 3}
+    ]
+    assert cache.stale_reactions("ch", page) == [target]
+
+    # Who reacted is reloaded for just that message
+    reactions = [{"emoji": "👍", "user_ids": [f"u{i}" for i in range(40)], "count": 40}]
+    cache.refresh_reactions("ch", [{"_id": messages[0]["_id"], "reactions": reactions, "version": 5}])
+    page, _ = cache.get("ws", "ch", 2)
+    assert page[0]["reactions"] == reactions
+    assert cache.stale_reactions("ch", page) == []
+
+
+def test_reaction_counts_drop_emojis_nobody_uses(cache):
+    messages = history(1)
+    messages[0]["reactions"] = [{"emoji": "👍", "user_ids": ["bob"], "count": 1}]
+    filled(cache, messages)
+    cache.apply("reaction.counts", "ch", {"message_id": messages[0]["id"], "counts": {"👍": 0}, "version": 2})
+    assert cache.get("ws", "ch", 1)[0][0]["reactions"] == []
+
+
+def test_refresh_older_than_cache_is_ignored(cache):
+    messages = history(1)
+    filled(cache, messages)
+    target = messages[0]["id"]
+    cache.apply("reaction.counts", "ch", {"message_id": target, "counts": {"👍": 2}, "version": 3, "base_version": 1})
+    cache.refresh_reactions("ch", [{"_id": messages[0]["_id"], "reactions": [], "version": 2}])
+    page, _ = cache.get("ws", "ch", 1)
+    assert page[0]["reactions"][0]["count"] == 2
+    assert cache.stale_reactions("ch", page) == [target]
+
+
+def test_refresh_newer_than_cache_is_ignored(cache):
+    # MongoDB already has a change whose event hasn't reached the cache
+    messages = history(1)
+    filled(cache, messages)
+    target = messages[0]["id"]
+    cache.apply("reaction.counts", "ch", {"message_id": target, "counts": {"👍": 2}, "version": 2, "base_version": 1})
+    cache.refresh_reactions("ch", [{"_id": messages[0]["_id"], "reactions": [], "version": 3}])
+    page, _ = cache.get("ws", "ch", 1)
+    assert page[0]["version"] == 2
+    assert cache.stale_reactions("ch", page) == [target]
+
+
+def test_delta_skipping_a_version_invalidates(cache):
+    messages = history(1)
+    messages[0]["version"] = 3
+    filled(cache, messages)
+    target = messages[0]["id"]
+    # The v5 reaction overtakes the v4 edit
+    delta = {"message_id": target, "emoji": "👍", "user_id": "bob", "count": 1, "version": 5}
+    cache.apply("reaction.added", "ch", delta)
+    assert cache.get("ws", "ch", 1) is None
+
+
+def test_counts_skip_only_versions_they_fold_in(cache):
+    messages = history(2)
+    filled(cache, messages)
+    first, second = messages[0]["id"], messages[1]["id"]
+    cache.apply("reaction.counts", "ch", {"message_id": first, "counts": {"👍": 9}, "version": 9, "base_version": 1})
+    assert cache.get("ws", "ch", 2)[0][0]["version"] == 9
+
+    # Without a base_version the versions skipped may hide an edit
+    cache.apply("reaction.counts", "ch", {"message_id": second, "counts": {"👍": 9}, "version": 9})
+    assert cache.get("ws", "ch", 2) is None
@@ -0,0 +1,121 @@
+"""
+Explain-plan checks for message history pagination.
+
+Seeds a scratch database next to the configured one with messages spread over
+channels and DMs, a few of them thread replies, creates the history indexes exactly as init_mongodb does, and
+explains every query shape GET /messages issues (first page, before, after and
+the older half of around). Each plan must be a single scan of the expected
+compound index with no blocking SORT stage and no more keys examined than a
+page needs. Skipped when MongoDB isn't reachable.
+"""
+from datetime import datetime, timedelta
+from typing import Iterator
+import random
+
+import pytest
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from app.core.config import settings
+from app.db.mongodb import MESSAGE_CHANNEL_HISTORY_INDEX, MESSAGE_DM_HISTORY_INDEX
+from app.api.v1.endpoints.messages import HISTORY_PROJECTION, history_index, history_query
+
+WORKSPACE_ID = "explain-ws"
+MESSAGES = 20000
+CHANNELS = 10
+LIMIT = 50
+CHANNEL_ID = "ch-0"
+DM_ID = f"dm-{CHANNELS}"
+
+
+def index_name(keys) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def plan_stages(plan: dict) -> Iterator[dict]:
+    """Walk an explain plan tree (classic or SBE layout) yielding every stage."""
+    if "queryPlan" in plan:
+        plan = plan["queryPlan"]
+    yield plan
+    if "inputStage" in plan:
+        yield from plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+
+def seed(collection):
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    batch = []
+    for i in range(MESSAGES):
+        conversation = rng.randrange(CHANNELS * 2)
+        target = {"channel_id": f"ch-{conversation}", "dm_id": None}
+        if conversation >= CHANNELS:
+            target = {"channel_id": None, "dm_id": f"dm-{conversation}"}
+        batch.append({
+            "_id": ObjectId(),
+            "workspace_id": WORKSPACE_ID,
+            **target,
+            "user_id": f"user-{rng.randrange(50)}",
+            "content": "x" * 80,
+            # Replies share the conversation but stay out of its history
+            "thread_id": str(ObjectId()) if rng.random() < 0.02 else None,
+            "attachments": [],
+            "reactions": [],
+            "version": 1,
+            # Coarse timestamps so pages regularly split messages sharing a millisecond
+            "created_at": start + timedelta(seconds=i // 3)
+        })
+        if len(batch) == 1000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+    collection.create_index(MESSAGE_CHANNEL_HISTORY_INDEX)
+    collection.create_index(MESSAGE_DM_HISTORY_INDEX)
+
+
+@pytest.fixture(scope="module")
+def collection():
+    client = MongoClient(settings.MONGODB_URL, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        pytest.skip("MongoDB is not reachable")
+    database = f"{settings.MONGODB_DB}_explain"
+    client.drop_database(database)
+    try:
+        seed(client[database].messages)
+        yield client[database].messages
+    finally:
+        client.drop_database(database)
+        client.close()
+
+
+def shapes():
+    for label, channel_id, dm_id in (("channel", CHANNEL_ID, None), ("dm", None, DM_ID)):
+        for shape in ("first_page", "before", "after", "around_older"):
+            yield pytest.param(channel_id, dm_id, shape, id=f"{label}:{shape}")
+
+
+@pytest.mark.parametrize("channel_id, dm_id, shape", shapes())
+def test_history_query_is_one_bounded_index_scan(collection, channel_id, dm_id, shape):
+    first, _ = history_query(WORKSPACE_ID, channel_id, dm_id)
+    middle = list(collection.find(first).sort("created_at", -1).skip(200).limit(1))[0]
+    cursor = (middle["created_at"], middle["_id"])
+    query, sort = {
+        "first_page": lambda: history_query(WORKSPACE_ID, channel_id, dm_id),
+        "before": lambda: history_query(WORKSPACE_ID, channel_id, dm_id, cursor),
+        "after": lambda: history_query(WORKSPACE_ID, channel_id, dm_id, cursor, older=False),
+        "around_older": lambda: history_query(WORKSPACE_ID, channel_id, dm_id, cursor, inclusive=True),
+    }[shape]()
+
+    explain = collection.find(query, projection=HISTORY_PROJECTION).sort(sort).limit(LIMIT + 1).explain()
+    stages = list(plan_stages(explain["queryPlanner"]["winningPlan"]))
+    scans = [stage for stage in stages if stage.get("stage") == "IXSCAN"]
+    assert [scan.get("indexName") for scan in scans] == [index_name(history_index(channel_id))]
+    assert "SORT" not in [stage.get("stage") for stage in stages]
+    # A few extra keys are allowed for replies and messages sharing the cursor's millisecond
+    assert explain.get("executionStats", {}).get("totalKeysExamined", 0) <= LIMIT + 10
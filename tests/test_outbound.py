@@ -0,0 +1,97 @@
+import asyncio
+
+from app.websocket.events import Frame
+from app.websocket.outbound import OutboundQueue, SlowConsumerPolicy
+
+
+def frame(name: str, event_type: str = "message.new", seq=None) -> Frame:
+    return Frame(name, event_type, seq)
+
+
+def texts(queue: OutboundQueue):
+    return [queued.text for queued in queue._items]
+
+
+def test_put_within_capacity_keeps_order():
+    queue = OutboundQueue(3)
+    for name in ("a", "b", "c"):
+        assert queue.put(frame(name))
+    assert texts(queue) == ["a", "b", "c"]
+    assert queue.dropped == 0
+
+
+def test_drop_oldest_evicts_head():
+    queue = OutboundQueue(2, SlowConsumerPolicy.DROP_OLDEST)
+    for name in ("a", "b", "c"):
+        assert queue.put(frame(name))
+    assert texts(queue) == ["b", "c"]
+    assert queue.dropped == 1
+
+
+def test_drop_ephemeral_evicts_typing_before_messages():
+    queue = OutboundQueue(3, SlowConsumerPolicy.DROP_EPHEMERAL)
+    queue.put(frame("m1"))
+    queue.put(frame("t1", "typing.update"))
+    queue.put(frame("m2"))
+    assert queue.put(frame("m3"))
+    assert texts(queue) == ["m1", "m2", "m3"]
+    assert queue.dropped == 1
+
+
+def test_drop_ephemeral_drops_incoming_ephemeral_when_nothing_else_is():
+    queue = OutboundQueue(2, SlowConsumerPolicy.DROP_EPHEMERAL)
+    queue.put(frame("m1"))
+    queue.put(frame("m2"))
+    assert queue.put(frame("t1", "typing.update"))
+    assert texts(queue) == ["m1", "m2"]
+    assert queue.dropped == 1
+
+
+def test_drop_ephemeral_falls_back_to_oldest_for_real_events():
+    queue = OutboundQueue(2, SlowConsumerPolicy.DROP_EPHEMERAL)
+    queue.put(frame("m1"))
+    queue.put(frame("m2"))
+    assert queue.put(frame("m3"))
+    assert texts(queue) == ["m2", "m3"]
+
+
+def test_disconnect_policy_refuses_when_full():
+    queue = OutboundQueue(1, SlowConsumerPolicy.DISCONNECT)
+    assert queue.put(frame("a"))
+    assert not queue.put(frame("b"))
+    assert texts(queue) == ["a"]
+
+
+async def test_get_waits_for_put():
+    queue = OutboundQueue(4)
+    getter = asyncio.create_task(queue.get())
+    await asyncio.sleep(0)
+    assert not getter.done()
+    queue.put(frame("a"))
+    assert (await asyncio.wait_for(getter, 1)).text == "a"
+    assert len(queue) == 0
+
+
+def test_prepend_puts_replay_first_and_drops_replayed_live_copies():
+    queue = OutboundQueue(10)
+    queue.put(frame("live-3", seq=3))
+    queue.put(frame("typing", "typing.update"))
+    queue.put(frame("live-5", seq=5))
+    queue.prepend([frame("replay-2", seq=2), frame("replay-3", seq=3)])
+    assert texts(queue) == ["replay-2", "replay-3", "typing", "live-5"]
+
+
+def test_prepend_keeps_live_events_missing_from_the_replay():
+    # Event 4 was delivered live but not logged yet when the replay read the log
+    queue = OutboundQueue(10)
+    queue.put(frame("live-4", seq=4))
+    queue.prepend([frame("replay-3", seq=3), frame("replay-5", seq=5)])
+    assert texts(queue) == ["replay-3", "replay-5", "live-4"]
+
+
+async def test_prepend_wakes_writer():
+    queue = OutboundQueue(10)
+    getter = asyncio.create_task(queue.get())
+    await asyncio.sleep(0)
+    queue.prepend([frame("replay-1", seq=1)])
+    assert (await asyncio.wait_for(getter, 1)).text == "replay-1"
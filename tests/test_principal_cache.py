@@ -0,0 +1,131 @@
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.endpoints import users, workspaces
+from app.core import principal_cache as principal_cache_module
+from app.core.principal_cache import PrincipalCache
+from app.models.user import UserRole
+
+Row = namedtuple("Row", "email full_name is_active workspace_id")
+
+
+class Database:
+    """Stands in for AsyncSessionLocal; counts the principal queries."""
+
+    def __init__(self, *workspace_ids):
+        self.workspace_ids = list(workspace_ids)
+        self.queries = 0
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, statement):
+        self.queries += 1
+        rows = [Row("alice@example.com", "Alice", True, workspace_id) for workspace_id in self.workspace_ids]
+        return SimpleNamespace(all=lambda: rows)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = Database("ws-1")
+    monkeypatch.setattr(principal_cache_module, "AsyncSessionLocal", database)
+    return database
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(principal_cache_module, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+async def test_membership_misses_recheck_at_most_once_per_miss_ttl(database, clock):
+    cache = PrincipalCache(ttl=60, miss_ttl=5)
+    assert (await cache.get("alice")).workspace_ids == {"ws-1"}
+    for _ in range(3):
+        await cache.get("alice", refresh=True)
+    assert database.queries == 1
+
+    database.workspace_ids.append("ws-2")
+    clock.now += 5
+    assert (await cache.get("alice", refresh=True)).workspace_ids == {"ws-1", "ws-2"}
+    assert database.queries == 2
+
+
+async def test_refresh_ignores_copies_from_redis(database, clock):
+    cache = PrincipalCache(ttl=60, miss_ttl=5)
+    cache._store("alice", principal_cache_module.Principal("alice", "", "", True, frozenset()))
+    assert (await cache.get("alice", refresh=True)).workspace_ids == {"ws-1"}
+    assert database.queries == 1
+
+
+async def test_invalidate_forgets_the_principal(database, clock):
+    cache = PrincipalCache(ttl=60, miss_ttl=5)
+    await cache.get("alice")
+    await cache.invalidate("alice")
+    await cache.get("alice")
+    assert database.queries == 2
+
+
+class Session:
+    """Answers each execute() with the next queued value."""
+
+    def __init__(self, *values):
+        self.values = list(values)
+        self.deleted = []
+
+    async def execute(self, statement):
+        value = self.values.pop(0)
+        return SimpleNamespace(scalar_one_or_none=lambda: value)
+
+    async def delete(self, row):
+        self.deleted.append(row)
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def invalidated(monkeypatch):
+    invalidated = []
+
+    async def invalidate(user_id):
+        invalidated.append(user_id)
+
+    monkeypatch.setattr(principal_cache_module.principal_cache, "invalidate", invalidate)
+    return invalidated
+
+
+WORKSPACE = SimpleNamespace(id="ws", owner_id="owner")
+
+
+async def test_removing_a_workspace_member_invalidates_their_principal(invalidated):
+    member = SimpleNamespace(role=UserRole.MEMBER)
+    db = Session(WORKSPACE, SimpleNamespace(role=UserRole.ADMIN), member)
+    await workspaces.remove_workspace_member("ws", "bob", SimpleNamespace(id="alice"), db)
+    assert db.deleted == [member]
+    assert invalidated == ["bob"]
+
+
+async def test_members_cannot_remove_others_from_a_workspace(invalidated):
+    db = Session(WORKSPACE, SimpleNamespace(role=UserRole.MEMBER))
+    with pytest.raises(HTTPException) as raised:
+        await workspaces.remove_workspace_member("ws", "bob", SimpleNamespace(id="alice"), db)
+    assert raised.value.status_code == 403
+    assert invalidated == []
+
+
+async def test_deactivating_invalidates_the_principal(invalidated):
+    alice = SimpleNamespace(id="alice", is_active=True)
+    await users.deactivate_current_user(alice, Session())
+    assert alice.is_active is False
+    assert invalidated == ["alice"]
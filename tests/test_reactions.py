@@ -0,0 +1,76 @@
+import pytest
+
+from app.websocket.events import create_reaction_event
+from app.websocket.reactions import ReactionAggregator
+
+
+@pytest.fixture
+def published():
+    return []
+
+
+@pytest.fixture
+def aggregator(published):
+    async def publish(event, channel_id):
+        published.append((event["type"], event["data"]))
+
+    return ReactionAggregator(publish, threshold=3, interval=1.0)
+
+
+def added(version: int, count: int, message_id: str = "m1"):
+    event = create_reaction_event(message_id, "👍", f"user-{version}", "add", "ws", "ch", count, version)
+    return event, {"👍": count}
+
+
+async def test_quiet_message_gets_individual_deltas(aggregator, published):
+    for version in (1, 2, 3):
+        await aggregator.record(*added(version, version))
+    assert [event_type for event_type, _ in published] == ["reaction.added"] * 3
+    await aggregator.flush()
+    assert len(published) == 3
+
+
+async def test_hot_message_is_coalesced_into_counts(aggregator, published):
+    for version in range(1, 11):
+        await aggregator.record(*added(version, version))
+    assert len(published) == 3
+
+    await aggregator.flush()
+    assert published[-1] == (
+        "reaction.counts",
+        {"message_id": "m1", "channel_id": "ch", "counts": {"👍": 10}, "version": 10, "base_version": 3}
+    )
+
+
+async def test_out_of_order_changes_keep_the_newest_snapshot(aggregator, published):
+    for version in range(1, 5):
+        await aggregator.record(*added(version, version))
+    await aggregator.record(*added(9, 9))
+    await aggregator.record(*added(7, 7))
+    await aggregator.flush()
+    assert published[-1][1]["counts"] == {"👍": 9}
+    assert published[-1][1]["version"] == 9
+    # Versions 5, 6 and 8 weren't seen here, so the counts may have skipped other changes
+    assert published[-1][1]["base_version"] is None
+
+
+async def test_hot_message_cools_down_after_a_quiet_interval(aggregator, published):
+    for version in range(1, 6):
+        await aggregator.record(*added(version, version))
+    await aggregator.flush()
+    count = len(published)
+
+    # Nothing changed during the next interval: no frame, and the message cools down
+    await aggregator.flush()
+    assert len(published) == count
+    assert aggregator._hot == {}
+    await aggregator.record(*added(6, 6))
+    assert published[-1][0] == "reaction.added"
+
+
+async def test_messages_are_tracked_separately(aggregator, published):
+    for version in range(1, 6):
+        await aggregator.record(*added(version, version, "hot"))
+    await aggregator.record(*added(1, 1, "quiet"))
+    assert published[-1][0] == "reaction.added"
+    assert published[-1][1]["message_id"] == "quiet"
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from fakeredis import aioredis
+
+from app.core import read_markers as read_markers_module
+from app.core.read_markers import ReadMarkers
+
+
+class Messages:
+    """The one messages query reserve_seqs makes, with a delay so concurrent callers overlap."""
+
+    def __init__(self, last_seq):
+        self.last_seq = last_seq
+        self.queries = 0
+
+    async def find_one(self, *args, **kwargs):
+        self.queries += 1
+        await asyncio.sleep(0.01)
+        return {"channel_seq": self.last_seq} if self.last_seq else None
+
+
+@pytest.fixture
+async def markers(monkeypatch):
+    messages = Messages(last_seq=41)
+    db = type("DB", (), {"messages": messages})()
+    monkeypatch.setattr(read_markers_module, "get_mongo_db", lambda: db)
+    client = aioredis.FakeRedis(decode_responses=True)
+    markers = ReadMarkers()
+    markers.redis = client
+    yield markers, messages
+    await client.aclose()
+
+
+async def test_counter_resumes_after_stored_messages(markers):
+    markers, messages = markers
+    assert await markers.next_seq("ws", "ch") == 42
+    assert await markers.reserve_seqs("ws", "ch", 5) == 47
+    assert messages.queries == 1
+
+
+async def test_concurrent_first_reservations_never_collide(markers):
+    markers, _ = markers
+    seqs = await asyncio.gather(*[markers.next_seq("ws", "ch") for _ in range(20)])
+    assert sorted(seqs) == list(range(42, 62))
+
+
+async def test_new_channel_starts_at_one(markers):
+    markers, messages = markers
+    messages.last_seq = None
+    assert await markers.reserve_seqs("ws", "new", 3) == 3
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from fakeredis import aioredis
+
+from app.websocket.replay import ReplayLog
+
+
+@pytest.fixture
+async def log():
+    client = aioredis.FakeRedis(decode_responses=True)
+    yield ReplayLog(client, size=5, gap_timeout=0.2)
+    await client.aclose()
+
+
+async def publish(log: ReplayLog, channel_id=None, append: bool = True) -> int:
+    seq = await log.next_seq("ws")
+    if append:
+        await append_entry(log, seq, channel_id)
+    return seq
+
+
+async def append_entry(log: ReplayLog, seq: int, channel_id=None):
+    async with log.redis.pipeline(transaction=False) as pipe:
+        log.append(pipe, "ws", seq, channel_id, f"event-{seq}")
+        await pipe.execute()
+
+
+async def test_since_returns_missed_events_in_order(log):
+    for channel_id in ("a", None, "b"):
+        await publish(log, channel_id)
+    assert await log.since("ws", 1) == [(2, None, None, "event-2"), (3, "b", None, "event-3")]
+    assert await log.since("ws", 3) == []
+
+
+async def test_thread_events_keep_their_participants(log):
+    for participant_ids in (["alice", "bob"], []):
+        seq = await log.next_seq("ws")
+        async with log.redis.pipeline(transaction=False) as pipe:
+            log.append(pipe, "ws", seq, "a", f"event-{seq}", participant_ids)
+            await pipe.execute()
+    assert await log.since("ws", 0) == [(1, "a", ["alice", "bob"], "event-1"), (2, "a", [], "event-2")]
+
+
+async def test_since_requires_sync_once_trimmed(log):
+    for _ in range(8):
+        await publish(log)
+    assert await log.since("ws", 1) is None
+    assert [seq for seq, *_ in await log.since("ws", 3)] == [4, 5, 6, 7, 8]
+
+
+async def test_since_requires_sync_after_counter_reset(log):
+    await publish(log)
+    assert await log.since("ws", 10) is None
+
+
+async def test_since_waits_for_interior_gap(log):
+    await publish(log)
+    in_flight = await publish(log, append=False)
+    await publish(log)
+
+    async def finish():
+        await asyncio.sleep(0.05)
+        await append_entry(log, in_flight)
+
+    task = asyncio.create_task(finish())
+    assert [seq for seq, *_ in await log.since("ws", 0)] == [1, 2, 3]
+    await task
+
+
+async def test_since_waits_for_unlogged_tail(log):
+    await publish(log)
+    in_flight = await publish(log, append=False)
+
+    async def finish():
+        await asyncio.sleep(0.05)
+        await append_entry(log, in_flight)
+
+    task = asyncio.create_task(finish())
+    assert [seq for seq, *_ in await log.since("ws", 0)] == [1, 2]
+    await task
+
+
+async def test_since_requires_sync_if_gap_never_fills(log):
+    await publish(log)
+    await publish(log, append=False)
+    await publish(log)
+    assert await log.since("ws", 0) is None
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+from bson import ObjectId
+
+from app.core.config import settings
+from app.websocket.connection_manager import ConnectionManager
+from app.websocket.connection_state import ConnectionState
+from app.websocket.events import create_message_event, create_thread_updated_event
+from app.websocket.outbound import OutboundQueue
+
+THREAD = {"channel_id": "general", "thread_id": "t1", "participant_ids": ["alice"]}
+CHANNEL_THREAD, PRIVATE_THREAD, DM_THREAD, OTHER_DM_THREAD = (str(ObjectId()) for _ in range(4))
+
+
+def received(connection: ConnectionState):
+    return [json.loads(frame.text)["type"] for frame in connection.queue._items]
+
+
+@pytest.fixture
+async def manager():
+    manager = ConnectionManager()
+
+    async def fetch(_):
+        return [("general", "alice"), ("general", "bob"), ("general", "carol")]
+
+    manager.channel_index._fetch = fetch
+
+    async def fetch_thread_parents(workspace_id, thread_ids):
+        parents = [
+            (CHANNEL_THREAD, "general", None),
+            (PRIVATE_THREAD, "private", None),
+            (DM_THREAD, None, "dm-1"),
+            (OTHER_DM_THREAD, None, "dm-2")
+        ]
+        return [parent for parent in parents if parent[0] in thread_ids]
+
+    async def fetch_member_dms(workspace_id, user_id, dm_ids):
+        return {"dm-1"} & dm_ids if user_id == "alice" else set()
+
+    manager._fetch_thread_parents = fetch_thread_parents
+    manager._fetch_member_dms = fetch_member_dms
+    return manager
+
+
+async def connect(manager: ConnectionManager, user_id: str) -> ConnectionState:
+    connection = ConnectionState(object(), user_id, "ws", OutboundQueue(10))
+    manager._register(connection)
+    await manager.channel_index.ensure_loaded("ws")
+    return connection
+
+
+async def test_thread_events_reach_participants_and_viewers_only(manager):
+    alice, bob, carol, dave = [await connect(manager, user_id) for user_id in ("alice", "bob", "carol", "dave")]
+    # carol has the thread open; dave isn't in the channel
+    manager.thread_viewers["t1"] = {carol, dave}
+
+    reply = {"id": "r1", "channel_id": "general", "thread_id": "t1", "content": "hi"}
+    await manager.publish_event(create_message_event(reply, "ws"), **THREAD)
+    await manager.publish_event(create_thread_updated_event({"parent_message_id": "t1"}, "ws"), **THREAD)
+
+    assert received(alice) == received(carol) == ["message.new", "thread.updated"]
+    assert received(bob) == received(dave) == []
+
+
+async def test_channel_events_still_reach_the_channel(manager):
+    alice, bob = await connect(manager, "alice"), await connect(manager, "bob")
+    await manager.publish_event(create_message_event({"id": "m1", "channel_id": "general"}, "ws"))
+    assert received(alice) == received(bob) == ["message.new"]
+
+
+async def test_thread_events_skip_the_channel_cache(manager, monkeypatch):
+    await connect(manager, "alice")
+    applied = []
+    monkeypatch.setattr(manager.message_cache, "apply", lambda *args: applied.append(args))
+    await manager.publish_event(create_message_event({"id": "r1", "channel_id": "general"}, "ws"), **THREAD)
+    assert applied == []
+
+
+async def test_replay_filters_thread_events_by_participant(manager):
+    await connect(manager, "alice")
+
+    class Log:
+        async def since(self, workspace_id, after_seq):
+            return [
+                (1, "general", None, "channel"),
+                (2, "general", ["alice"], "thread-a"),
+                (3, "general", ["bob"], "thread-b")
+            ]
+
+    manager.replay_log = Log()
+    queue = OutboundQueue(10)
+    await manager._replay(queue, "ws", "alice", 0)
+    assert [frame.text for frame in queue._items] == ["channel", "thread-a"]
+
+
+async def test_subscribe_only_adds_visible_threads(manager):
+    alice = await connect(manager, "alice")
+    thread_ids = [CHANNEL_THREAD, PRIVATE_THREAD, DM_THREAD, OTHER_DM_THREAD, str(ObjectId())]
+    assert await manager.subscribe_threads(alice.websocket, thread_ids) == 2
+    assert alice.thread_subscriptions == {CHANNEL_THREAD, DM_THREAD}
+    assert manager.thread_viewers[DM_THREAD] == {alice}
+
+
+async def test_dm_threads_need_dm_membership(manager):
+    bob = await connect(manager, "bob")
+    assert await manager.subscribe_threads(bob.websocket, [DM_THREAD]) == 0
+    assert DM_THREAD not in manager.thread_viewers
+
+
+@pytest.mark.parametrize(
+    "thread_ids", [None, "abc", [1], ["not-an-id"], [str(ObjectId())] * (settings.WS_MAX_THREAD_SUBSCRIPTIONS + 1)]
+)
+async def test_subscribe_rejects_malformed_thread_ids(manager, thread_ids):
+    alice = await connect(manager, "alice")
+    with pytest.raises(ValueError):
+        await manager.subscribe_threads(alice.websocket, thread_ids)
+
+
+async def test_unsubscribe_and_disconnect_drop_viewers(manager):
+    alice = await connect(manager, "alice")
+    await manager.subscribe_threads(alice.websocket, [CHANNEL_THREAD, DM_THREAD])
+    manager.unsubscribe_threads(alice.websocket, [CHANNEL_THREAD, {"not": "hashable"}])
+    assert alice.thread_subscriptions == {DM_THREAD}
+    assert CHANNEL_THREAD not in manager.thread_viewers
+
+    await manager.disconnect(alice.websocket)
+    assert manager.thread_viewers == {}
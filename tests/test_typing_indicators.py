@@ -0,0 +1,124 @@
+import pytest
+from fakeredis import aioredis
+
+from app.websocket import typing_indicators
+from app.websocket.typing_indicators import TypingAggregator
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(typing_indicators.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def published():
+    return []
+
+
+@pytest.fixture
+def aggregator(clock, published):
+    async def publish(event, channel_id):
+        published.append(event["data"])
+
+    return TypingAggregator(publish, ttl=6.0, interval=0.5, refresh=3.0)
+
+
+async def test_start_is_announced_once(aggregator, published):
+    aggregator.update("ws", "ch", "alice", True)
+    aggregator.update("ws", "ch", "alice", True)
+    await aggregator.flush()
+    await aggregator.flush()
+    assert published == [{"channel_id": "ch", "typing": ["alice"], "started": ["alice"], "stopped": []}]
+
+
+async def test_start_and_stop_within_an_interval_cancel_out(aggregator, published):
+    aggregator.update("ws", "ch", "alice", True)
+    aggregator.update("ws", "ch", "alice", False)
+    await aggregator.flush()
+    assert published == []
+
+
+async def test_snapshot_lists_everyone_typing(aggregator, published):
+    aggregator.update("ws", "ch", "alice", True)
+    await aggregator.flush()
+    aggregator.update("ws", "ch", "bob", True)
+    await aggregator.flush()
+    assert published[-1] == {"channel_id": "ch", "typing": ["alice", "bob"], "started": ["bob"], "stopped": []}
+
+
+async def test_ttl_expiry_stops_typer(aggregator, published, clock):
+    aggregator.update("ws", "ch", "alice", True)
+    await aggregator.flush()
+    clock.now += 6.0
+    await aggregator.flush()
+    assert published[-1] == {"channel_id": "ch", "typing": [], "started": [], "stopped": ["alice"]}
+    assert aggregator._typing == {}
+    assert aggregator._announced == {}
+
+
+async def test_active_channels_are_reannounced(aggregator, published, clock):
+    aggregator.update("ws", "ch", "alice", True)
+    await aggregator.flush()
+    clock.now += 1.0
+    await aggregator.flush()
+    assert len(published) == 1
+
+    # A refreshed start keeps the typer alive; the snapshot is repeated without changes
+    aggregator.update("ws", "ch", "alice", True)
+    clock.now += 2.0
+    await aggregator.flush()
+    assert published[-1] == {"channel_id": "ch", "typing": ["alice"], "started": [], "stopped": []}
+    assert len(published) == 2
+
+
+async def test_channels_are_announced_separately(aggregator, published):
+    aggregator.update("ws", "a", "alice", True)
+    aggregator.update("ws", "b", "bob", True)
+    await aggregator.flush()
+    assert sorted((data["channel_id"], data["typing"]) for data in published) == [("a", ["alice"]), ("b", ["bob"])]
+
+
+async def test_nodes_share_the_typing_list_through_redis(clock, published):
+    client = aioredis.FakeRedis(decode_responses=True)
+
+    async def publish(event, channel_id):
+        published.append(event["data"])
+
+    nodes = [TypingAggregator(publish, ttl=6.0, interval=0.5, refresh=3.0) for _ in range(2)]
+    for node in nodes:
+        node.redis = client
+    first, second = nodes
+
+    first.update("ws", "ch", "alice", True)
+    await first.flush()
+    second.update("ws", "ch", "bob", True)
+    await second.flush()
+    # bob's node announces alice as well, so clients replacing their list keep her
+    assert published[-1] == {"channel_id": "ch", "typing": ["alice", "bob"], "started": ["bob"], "stopped": []}
+
+    first.update("ws", "ch", "alice", False)
+    await first.flush()
+    assert published[-1] == {"channel_id": "ch", "typing": ["bob"], "started": [], "stopped": ["alice"]}
+    await client.aclose()
+
+
+async def test_expired_typers_in_redis_are_left_out(aggregator, published):
+    client = aioredis.FakeRedis(decode_responses=True)
+    aggregator.redis = client
+    # Left behind by a node that went away while carol was typing
+    await client.hset("typing:ws:ch", "carol", 0)
+
+    aggregator.update("ws", "ch", "alice", True)
+    await aggregator.flush()
+    assert published[-1]["typing"] == ["alice"]
+    await client.aclose()
@@ -0,0 +1,166 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import math
+import time
+
+from app.core.config import settings
+from app.websocket.events import create_typing_update_event
+
+ChannelKey = Tuple[str, str]  # (workspace_id, channel_id)
+
+
+class TypingAggregator:
+    """
+    Coalesce typing indicators into at most one frame per channel per interval.
+
+    Keeps who is typing in each channel with a TTL. Repeated start events only
+    refresh the TTL; the flush loop sends one typing.update per changed channel
+    with everyone typing now plus who started and stopped since the last frame,
+    and stops users automatically once their TTL runs out.
+
+    Typing frames are the first to go when a slow consumer overflows, so the
+    full list is what clients should render: channels with typers are
+    re-announced every WS_TYPING_REFRESH_INTERVAL even without changes, which
+    repairs a lost stop and tells late subscribers who is already typing.
+
+    Each node only sees its own sockets' typers, so the list comes from Redis:
+    before announcing a channel, a node writes its typers' expiry times into the
+    channel's hash and reads back everyone's, leaving out the expired ones.
+    Without Redis the list holds this node's typers only.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[dict, Optional[str]], Awaitable[None]],
+        ttl: float = settings.WS_TYPING_TTL,
+        interval: float = settings.WS_TYPING_FLUSH_INTERVAL,
+        refresh: float = settings.WS_TYPING_REFRESH_INTERVAL
+    ):
+        self.publish = publish
+        self.ttl = ttl
+        self.interval = interval
+        self.refresh = refresh
+        # channel -> user_id -> monotonic expiry
+        self._typing: Dict[ChannelKey, Dict[str, float]] = {}
+        # Changes not yet announced
+        self._started: Dict[ChannelKey, Set[str]] = {}
+        self._stopped: Dict[ChannelKey, Set[str]] = {}
+        # channel -> monotonic time of its last typing.update
+        self._announced: Dict[ChannelKey, float] = {}
+        self.redis = None
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(workspace_id: str, channel_id: str) -> str:
+        return f"typing:{workspace_id}:{channel_id}"
+
+    def start(self, redis_client=None):
+        """Start the periodic flush loop."""
+        self.redis = redis_client
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def update(self, workspace_id: str, channel_id: str, user_id: str, is_typing: bool):
+        """Record a typing start/stop frame from a client."""
+        key = (workspace_id, channel_id)
+        typers = self._typing.setdefault(key, {})
+        if is_typing:
+            if user_id not in typers:
+                self._mark(key, user_id, started=True)
+            typers[user_id] = time.monotonic() + self.ttl
+        elif typers.pop(user_id, None) is not None:
+            self._mark(key, user_id, started=False)
+
+    def _mark(self, key: ChannelKey, user_id: str, started: bool):
+        pending, opposite = (self._started, self._stopped) if started else (self._stopped, self._started)
+        if user_id in opposite.get(key, ()):
+            # Started and stopped within one interval: nobody needs to hear about it
+            opposite[key].discard(user_id)
+            return
+        pending.setdefault(key, set()).add(user_id)
+
+    def _expire(self, now: float):
+        for key in list(self._typing):
+            typers = self._typing[key]
+            for user_id in [u for u, expires_at in typers.items() if expires_at <= now]:
+                del typers[user_id]
+                self._mark(key, user_id, started=False)
+            if not typers:
+                del self._typing[key]
+
+    async def flush(self):
+        """Expire stale typers and send one consolidated frame per changed or due channel."""
+        now = time.monotonic()
+        self._expire(now)
+        due = {key for key in self._typing if now - self._announced.get(key, 0.0) >= self.refresh}
+        changes = []
+        for key in set(self._started) | set(self._stopped) | due:
+            started = self._started.pop(key, set())
+            stopped = self._stopped.pop(key, set())
+            if not started and not stopped and key not in due:
+                continue
+            if self._typing.get(key):
+                self._announced[key] = now
+            else:
+                self._announced.pop(key, None)
+            changes.append((key, started, stopped))
+        if not changes:
+            return
+
+        everyone = await self._sync(changes, now)
+        for key, started, stopped in changes:
+            workspace_id, channel_id = key
+            event = create_typing_update_event(
+                channel_id, everyone[key], sorted(started), sorted(stopped), workspace_id
+            )
+            await self.publish(event, channel_id)
+
+    async def _sync(self, changes, now: float) -> Dict[ChannelKey, List[str]]:
+        """Write this node's typers for the given channels to Redis and read back everyone typing in them."""
+        everyone = {key: sorted(self._typing.get(key, ())) for key, _, _ in changes}
+        if not self.redis:
+            return everyone
+        wall_now = time.time()
+        # (channel, position of its HGETALL in the pipeline)
+        reads = []
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, _, stopped in changes:
+                    redis_key = self._key(*key)
+                    typers = self._typing.get(key)
+                    if typers:
+                        pipe.hset(redis_key, mapping={
+                            user_id: wall_now + (expires_at - now) for user_id, expires_at in typers.items()
+                        })
+                        pipe.expire(redis_key, math.ceil(self.ttl))
+                    if stopped:
+                        pipe.hdel(redis_key, *stopped)
+                    reads.append((key, len(pipe)))
+                    pipe.hgetall(redis_key)
+                results = await pipe.execute()
+        except Exception as e:
+            print(f"Typing sync error: {e}")
+            return everyone
+
+        for key, position in reads:
+            shared = results[position] or {}
+            everyone[key] = sorted(
+                user_id for user_id, expires_at in shared.items() if float(expires_at) > wall_now
+            )
+        return everyone
+
+    async def _run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.flush()
+                except Exception as e:
+                    print(f"Typing flush error: {e}")
+        except asyncio.CancelledError:
+            pass
@@ -4,8 +4,10 @@ from sqlalchemy import select
 from pydantic import BaseModel
 from typing import List, Optional
 from app.db.postgresql import get_db
-from app.models.user import User, UserPresence, PresenceStatus
+from app.core.principal_cache import principal_cache
+from app.models.user import User, UserWorkspace, PresenceStatus
 from app.api.v1.endpoints.auth import get_current_user
+from app.websocket.connection_manager import manager
 
 router = APIRouter()
 
@@ -48,6 +50,20 @@ async def update_current_user(
     await db.refresh(current_user)
     return current_user
 
+@router.post("/me/deactivate")
+async def deactivate_current_user(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Deactivate the current user's account; its tokens stop working."""
+    current_user.is_active = False
+    await db.commit()
+    
+    # WebSocket handshakes check is_active against the cached principal
+    await principal_cache.invalidate(current_user.id)
+    
+    return {"status": "deactivated"}
+
 @router.post("/presence")
 async def update_presence(
     presence_update: PresenceUpdate,
@@ -55,21 +71,18 @@ async def update_presence(
     db: AsyncSession = Depends(get_db)
 ):
     """Update user presence status."""
-    result = await db.execute(select(UserPresence).where(UserPresence.user_id == current_user.id))
-    presence = result.scalar_one_or_none()
+    result = await db.execute(
+        select(UserWorkspace.workspace_id).where(UserWorkspace.user_id == current_user.id)
+    )
+    workspace_ids = result.scalars().all()
     
-    if presence:
-        presence.status = presence_update.status
-        presence.custom_status = presence_update.custom_status
-    else:
-        presence = UserPresence(
-            user_id=current_user.id,
-            status=presence_update.status,
-            custom_status=presence_update.custom_status
-        )
-        db.add(presence)
-    
-    await db.commit()
+    # Announced with the next presence diff and written back to PostgreSQL in bulk
+    manager.presence.set_status(
+        current_user.id,
+        workspace_ids,
+        presence_update.status.value,
+        presence_update.custom_status
+    )
     return {"status": "updated"}
 
 @router.get("/{user_id}", response_model=UserResponse)
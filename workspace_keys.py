@@ -0,0 +1,183 @@
+from typing import Dict, Hashable, Iterable, NamedTuple, Optional, Set, Tuple
+from collections import OrderedDict
+from datetime import datetime
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import secrets
+import time
+
+from app.core.config import settings
+from app.core.kms import kms as default_kms
+from app.db.mongodb import get_mongo_db
+
+
+class DataKey(NamedTuple):
+    """An unwrapped AES-256-GCM key and the id stored in the envelopes it writes."""
+    key_id: int
+    aead: AESGCM
+
+
+class WorkspaceKeys:
+    """
+    Per-workspace data keys, stored wrapped by the KMS in the workspace_keys collection.
+
+    Each workspace has a numbered series of random 256-bit keys. The newest one
+    encrypts new messages; older ones stay available for decryption. Keys are
+    named by a random 32-bit id, which v2 envelopes carry in their header, so
+    decryption never needs to know the workspace.
+
+    Unwrapped keys are kept in a bounded LRU (WORKSPACE_KEY_CACHE_SIZE): only the
+    first use of a key on a node costs a MongoDB read and a KMS unwrap, and
+    concurrent misses share one load. Which key is active is cached for
+    WORKSPACE_KEY_ACTIVE_TTL, so after a rotation other nodes may keep writing
+    with the previous key for that long.
+    """
+
+    def __init__(self, kms=default_kms):
+        self.kms = kms
+        self.size = settings.WORKSPACE_KEY_CACHE_SIZE
+        self.active_ttl = settings.WORKSPACE_KEY_ACTIVE_TTL
+        # Ids new keys must not take, e.g. the global key's
+        self.reserved_ids: Set[int] = set()
+        # key id -> unwrapped key, most recently used last
+        self._keys: "OrderedDict[int, AESGCM]" = OrderedDict()
+        # workspace_id -> (monotonic expiry, active key)
+        self._active: "OrderedDict[str, Tuple[float, DataKey]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def cached(self, key_id: int) -> Optional[AESGCM]:
+        """Look up an unwrapped key without loading it. Safe to call from the encryption threads."""
+        return self._keys.get(key_id)
+
+    async def active(self, workspace_id: str) -> DataKey:
+        """The key new messages in a workspace are encrypted with, created on first use."""
+        entry = self._active.get(workspace_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._active.move_to_end(workspace_id)
+            return entry[1]
+        return await self._shared(("active", workspace_id), self._load_active, workspace_id)
+
+    async def load(self, key_ids: Iterable[int]) -> Dict[int, AESGCM]:
+        """
+        Unwrap keys by id, from the cache where possible.
+
+        Returns:
+            key id -> key; ids that don't exist are left out
+        """
+        keys = {}
+        missing = []
+        for key_id in key_ids:
+            aead = self._keys.get(key_id)
+            if aead is None:
+                missing.append(key_id)
+            else:
+                self._keys.move_to_end(key_id)
+                keys[key_id] = aead
+        if missing:
+            loaded = await asyncio.gather(*[self._shared(("key", key_id), self._load_key, key_id) for key_id in missing])
+            keys.update({key_id: aead for key_id, aead in zip(missing, loaded) if aead is not None})
+        return keys
+
+    async def rotate(self, workspace_id: str) -> DataKey:
+        """Create the workspace's next key and make it the active one on this node."""
+        db = get_mongo_db()
+        current = await db.workspace_keys.find_one(
+            {"workspace_id": workspace_id}, projection={"version": 1}, sort=[("version", -1)]
+        )
+        doc = await self._create(db, workspace_id, (current["version"] if current else 0) + 1)
+        key = DataKey(doc["_id"], await self._unwrap(doc))
+        self._set_active(workspace_id, key)
+        return key
+
+    async def retire_previous(self, workspace_id: str) -> int:
+        """
+        Mark every key but the newest as retired once no message uses them.
+
+        Retired keys are kept so a straggler still decrypts; deleting one would
+        make whatever it still covers unreadable.
+        """
+        db = get_mongo_db()
+        current = await db.workspace_keys.find_one(
+            {"workspace_id": workspace_id}, projection={"version": 1}, sort=[("version", -1)]
+        )
+        if current is None:
+            return 0
+        result = await db.workspace_keys.update_many(
+            {"workspace_id": workspace_id, "version": {"$lt": current["version"]}, "retired_at": None},
+            {"$set": {"retired_at": datetime.utcnow()}}
+        )
+        return result.modified_count
+
+    async def _shared(self, key: Hashable, load, *args):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(load(*args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one cancelled request doesn't fail everyone waiting on the load
+        return await asyncio.shield(task)
+
+    async def _load_active(self, workspace_id: str) -> DataKey:
+        db = get_mongo_db()
+        doc = await db.workspace_keys.find_one({"workspace_id": workspace_id}, sort=[("version", -1)])
+        if doc is None:
+            doc = await self._create(db, workspace_id, 1)
+        key = DataKey(doc["_id"], await self._unwrap(doc))
+        self._set_active(workspace_id, key)
+        return key
+
+    async def _load_key(self, key_id: int) -> Optional[AESGCM]:
+        db = get_mongo_db()
+        doc = await db.workspace_keys.find_one({"_id": key_id})
+        if doc is None:
+            return None
+        return await self._unwrap(doc)
+
+    async def _create(self, db, workspace_id: str, version: int) -> dict:
+        material = AESGCM.generate_key(bit_length=256)
+        master_key_id, wrapped = await self.kms.wrap(material, workspace_id)
+        doc = {
+            "workspace_id": workspace_id,
+            "version": version,
+            "wrapped_key": wrapped,
+            "master_key_id": master_key_id,
+            "created_at": datetime.utcnow(),
+            "retired_at": None
+        }
+        while True:
+            doc["_id"] = secrets.randbits(32)
+            if doc["_id"] in self.reserved_ids:
+                continue
+            try:
+                await db.workspace_keys.insert_one(doc)
+                self._remember(doc["_id"], AESGCM(material))
+                return doc
+            except DuplicateKeyError:
+                # Either another node created this version first (use theirs) or the id is taken (draw another)
+                existing = await db.workspace_keys.find_one({"workspace_id": workspace_id, "version": version})
+                if existing is not None:
+                    return existing
+
+    async def _unwrap(self, doc: dict) -> AESGCM:
+        aead = self._keys.get(doc["_id"])
+        if aead is None:
+            material = await self.kms.unwrap(doc["master_key_id"], doc["wrapped_key"], doc["workspace_id"])
+            aead = AESGCM(material)
+            self._remember(doc["_id"], aead)
+        return aead
+
+    def _remember(self, key_id: int, aead: AESGCM):
+        self._keys[key_id] = aead
+        self._keys.move_to_end(key_id)
+        while len(self._keys) > self.size:
+            self._keys.popitem(last=False)
+
+    def _set_active(self, workspace_id: str, key: DataKey):
+        self._active[workspace_id] = (time.monotonic() + self.active_ttl, key)
+        self._active.move_to_end(workspace_id)
+        while len(self._active) > self.size:
+            self._active.popitem(last=False)
+
+
+workspace_keys = WorkspaceKeys()
@@ -6,6 +6,8 @@ from typing import List, Optional
 from datetime import datetime, timedelta
 import secrets
 
+from app.core.encryption_migration import start_key_rotation
+from app.core.principal_cache import principal_cache
 from app.db.postgresql import get_db
 from app.models.workspace import Workspace, WorkspaceInvite
 from app.models.user import User, UserWorkspace, UserRole
@@ -133,3 +135,73 @@ async def invite_to_workspace(
     await db.commit()
     
     return {"invite_token": token, "expires_at": invite.expires_at}
+
+@router.delete("/{workspace_id}/members/{user_id}")
+async def remove_workspace_member(
+    workspace_id: str,
+    user_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Remove a member from a workspace. Members can leave; removing others takes an owner or admin."""
+    result = await db.execute(select(Workspace).where(Workspace.id == workspace_id))
+    workspace = result.scalar_one_or_none()
+    
+    if not workspace:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    if user_id == workspace.owner_id:
+        raise HTTPException(status_code=400, detail="The workspace owner can't be removed")
+    
+    if user_id != current_user.id:
+        caller_result = await db.execute(
+            select(UserWorkspace).where(
+                UserWorkspace.workspace_id == workspace_id,
+                UserWorkspace.user_id == current_user.id
+            )
+        )
+        caller = caller_result.scalar_one_or_none()
+        if not caller or caller.role not in (UserRole.OWNER, UserRole.ADMIN):
+            raise HTTPException(status_code=403, detail="Only workspace owners and admins can remove other members")
+    
+    member_result = await db.execute(
+        select(UserWorkspace).where(
+            UserWorkspace.workspace_id == workspace_id,
+            UserWorkspace.user_id == user_id
+        )
+    )
+    member = member_result.scalar_one_or_none()
+    if not member:
+        raise HTTPException(status_code=404, detail="Member not found")
+    
+    await db.delete(member)
+    await db.commit()
+    
+    # WebSocket handshakes check membership against the cached principal
+    await principal_cache.invalidate(user_id)
+    
+    return {"status": "removed"}
+
+@router.post("/{workspace_id}/encryption-key/rotate", status_code=status.HTTP_202_ACCEPTED)
+async def rotate_encryption_key(
+    workspace_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Rotate the workspace's message encryption key (owners and admins).
+    
+    New messages use the new key at once; existing ones are re-encrypted in the
+    background. Call again to resume a rotation interrupted by a restart.
+    """
+    member_result = await db.execute(
+        select(UserWorkspace).where(
+            UserWorkspace.workspace_id == workspace_id,
+            UserWorkspace.user_id == current_user.id
+        )
+    )
+    member = member_result.scalar_one_or_none()
+    if not member or member.role not in (UserRole.OWNER, UserRole.ADMIN):
+        raise HTTPException(status_code=403, detail="Only workspace owners and admins can rotate the key")
+    
+    started = start_key_rotation(workspace_id)
+    return {"workspace_id": workspace_id, "status": "started" if started else "in_progress"}